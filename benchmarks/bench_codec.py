@@ -0,0 +1,124 @@
+# benchmarks/bench_codec.py
+"""
+Payload codec 的編碼 / 解碼時間與大小 (LIST_ALL_GAMES 與 LIST_ROOMS 的真實欄位)，
+以及協商壓縮後 (zlib, COMPRESS_LEVEL) 的大小與壓縮時間。
+
+比較：
+  - json          : 預設 codec (C 加速的 json 模組)
+  - msgpack (py)  : common.codec 的純 Python 實作
+  - msgpack (C)   : 有安裝 msgpack 套件時才會測
+
+Usage:
+  python benchmarks/bench_codec.py --games 100 1000 5000 --rooms 200
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.codec import packb, unpackb
+from common.protocol import COMPRESS_LEVEL
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+
+def catalogue_payload(n_games):
+  """與 DBManager.list_all_games 相同欄位的商城列表"""
+  games = [
+    {
+      "id": i,
+      "name": f"game_{i}",
+      "version": f"1.{i % 10}.{i % 7}",
+      "author": f"dev_{i % 50}",
+      "description": "A small multiplayer game for the store. " * 2,
+      "type": random.choice(["CLI", "GUI"]),
+      "exe_path": "client.py",
+      "rating": round(random.uniform(1, 5), 1) if i % 3 else None,
+      "rating_count": random.randint(0, 500),
+    }
+    for i in range(n_games)
+  ]
+  return {"games": games, "etag": "1a2b3c4d:42"}
+
+
+def rooms_payload(n_rooms):
+  """與 RoomManager.list_rooms 相同欄位的房間列表"""
+  rooms = [
+    {
+      "room_id": f"{i + 1}-{random.getrandbits(16):04x}",
+      "game_name": f"game_{i % 40}",
+      "host": f"player_{i}",
+      "current_players": random.randint(1, 2),
+      "max_players": 2,
+      "port": 20000 + i,
+      "state": "ready",
+    }
+    for i in range(n_rooms)
+  ]
+  return {"rooms": rooms, "next_cursor": "151"}
+
+
+def codecs():
+  result = [
+    ("json", lambda d: json.dumps(d).encode("utf-8"), lambda b: json.loads(b)),
+    ("msgpack (py)", packb, unpackb),
+  ]
+  if msgpack is not None:
+    result.append(
+      (
+        "msgpack (C)",
+        lambda d: msgpack.packb(d, use_bin_type=True),
+        lambda b: msgpack.unpackb(b, raw=False),
+      )
+    )
+  return result
+
+
+def timeit(fn, repeat):
+  best = float("inf")
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t0)
+  return best * 1000
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--games", type=int, nargs="+", default=[100, 1000, 5000])
+  parser.add_argument("--rooms", type=int, nargs="+", default=[50, 200])
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+
+  payloads = [(f"catalogue x{n}", catalogue_payload(n)) for n in args.games]
+  payloads += [(f"rooms x{n}", rooms_payload(n)) for n in args.rooms]
+
+  print(
+    f"{'payload':>16} | {'codec':>13} | {'bytes':>9} | "
+    f"{'encode ms':>9} | {'decode ms':>9} | {'zlib bytes':>10} | {'zlib ms':>7}"
+  )
+  for label, data in payloads:
+    for name, encode, decode in codecs():
+      encoded = encode(data)
+      assert decode(encoded) == data
+      enc_ms = timeit(lambda: encode(data), args.repeat)
+      dec_ms = timeit(lambda: decode(encoded), args.repeat)
+      compressed = zlib.compress(encoded, COMPRESS_LEVEL)
+      zlib_ms = timeit(lambda: zlib.compress(encoded, COMPRESS_LEVEL), args.repeat)
+      print(
+        f"{label:>16} | {name:>13} | {len(encoded):>9} | "
+        f"{enc_ms:>9.2f} | {dec_ms:>9.2f} | {len(compressed):>10} | {zlib_ms:>7.2f}"
+      )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_list_all_games.py
+"""
+DBManager.list_all_games 延遲 vs 商城規模。
+
+比較：
+  - legacy : 每個遊戲各查一次 AVG/COUNT (N+1，無索引)
+  - current: DBManager.list_all_games (單一 LEFT JOIN ... GROUP BY + 索引)
+
+Usage:
+  python benchmarks/bench_list_all_games.py --games 100 500 2000 --reviews-per-game 50
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.db_manager import DBManager
+
+
+def populate(db_path, n_games, reviews_per_game):
+  conn = sqlite3.connect(db_path)
+  conn.executemany(
+    "INSERT INTO games (name, version, author, description, game_type, exe_path) "
+    "VALUES (?, '1.0', ?, 'desc', 'CLI', 'game.py')",
+    ((f"game_{i}", f"dev_{i % 50}") for i in range(n_games)),
+  )
+  conn.executemany(
+    "INSERT INTO reviews (game_name, player_name, rating, comment) VALUES (?, ?, ?, '')",
+    (
+      (f"game_{i}", f"player_{j}", random.randint(1, 5))
+      for i in range(n_games)
+      for j in range(reviews_per_game)
+    ),
+  )
+  conn.commit()
+  conn.close()
+
+
+def legacy_list_all_games(db_path, with_index):
+  """舊版的 N+1 寫法 (僅供比較)"""
+  conn = sqlite3.connect(db_path)
+  cursor = conn.cursor()
+  cursor.execute(
+    "SELECT id, name, version, author, description, game_type, exe_path FROM games"
+  )
+  games = []
+  for r in cursor.fetchall():
+    index_hint = "" if with_index else "NOT INDEXED"
+    cursor.execute(
+      f"SELECT AVG(rating), COUNT(*) FROM reviews {index_hint} WHERE game_name = ?",
+      (r[1],),
+    )
+    games.append((r, cursor.fetchone()))
+  conn.close()
+  return games
+
+
+def timeit(fn, repeat):
+  best = float("inf")
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t0)
+  return best * 1000
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--games", type=int, nargs="+", default=[100, 500, 2000])
+  parser.add_argument("--reviews-per-game", type=int, default=50)
+  parser.add_argument("--repeat", type=int, default=3)
+  args = parser.parse_args()
+
+  print(
+    f"{'games':>7} | {'reviews':>9} | {'legacy no-idx ms':>16} | "
+    f"{'legacy idx ms':>13} | {'current ms':>10}"
+  )
+  for n_games in args.games:
+    with tempfile.TemporaryDirectory() as tmp:
+      db_path = os.path.join(tmp, "bench.db")
+      db = DBManager(db_path)
+      populate(db_path, n_games, args.reviews_per_game)
+
+      no_index = timeit(lambda: legacy_list_all_games(db_path, False), args.repeat)
+      with_index = timeit(lambda: legacy_list_all_games(db_path, True), args.repeat)
+      current = timeit(db.list_all_games, args.repeat)
+
+    print(
+      f"{n_games:>7} | {n_games * args.reviews_per_game:>9} | {no_index:>16.1f} | "
+      f"{with_index:>13.1f} | {current:>10.1f}"
+    )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_recv.py
+"""
+接收端 microbenchmark：_recvall 與 recv_file，payload 從 1 KiB 到 1 GiB。
+
+比較：
+  - legacy : 舊版實作 (data += packet / 每次 recv 4 KiB)
+  - current: common.protocol 的 recv_into + 預先配置 buffer
+
+舊版 _recvall 是 O(n^2) 複製，超過 --legacy-max-mb 的大小會略過 (recv_file 不受影響)。
+
+Usage:
+  python benchmarks/bench_recv.py --max-mb 1024
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import _recvall, recv_file
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+def legacy_recvall(sock, n):
+  data = b""
+  while len(data) < n:
+    packet = sock.recv(n - len(data))
+    if not packet:
+      return None
+    data += packet
+  return data
+
+
+def legacy_recv_file(sock, file_size, save_path):
+  received = 0
+  with open(save_path, "wb") as f:
+    while received < file_size:
+      chunk = sock.recv(min(4096, file_size - received))
+      if not chunk:
+        raise ConnectionError("Connection lost while receiving file")
+      f.write(chunk)
+      received += len(chunk)
+
+
+def feed(sock, size):
+  view = memoryview(BLOCK)
+  remaining = size
+  while remaining:
+    n = min(remaining, len(BLOCK))
+    sock.sendall(view[:n])
+    remaining -= n
+
+
+def measure(size, receiver):
+  a, b = socket.socketpair()
+  t = threading.Thread(target=feed, args=(a, size))
+  t0 = time.perf_counter()
+  t.start()
+  receiver(b, size)
+  elapsed = time.perf_counter() - t0
+  t.join()
+  a.close()
+  b.close()
+  return size / elapsed / (1024 * 1024)
+
+
+def fmt_size(size):
+  if size >= 1024 * 1024:
+    return f"{size // (1024 * 1024)} MiB"
+  return f"{size // 1024} KiB"
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--max-mb", type=int, default=1024)
+  parser.add_argument("--legacy-max-mb", type=int, default=64)
+  args = parser.parse_args()
+
+  sizes = []
+  size = 1024
+  while size <= args.max_mb * 1024 * 1024:
+    sizes.append(size)
+    size *= 4 if size < 1024 * 1024 else 2
+  legacy_max = args.legacy_max_mb * 1024 * 1024
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "recv.bin")
+    cases = [
+      ("_recvall", legacy_recvall, _recvall, legacy_max),
+      (
+        "recv_file",
+        lambda s, n: legacy_recv_file(s, n, path),
+        lambda s, n: recv_file(s, n, path),
+        None,
+      ),
+    ]
+
+    print(f"{'function':>9} | {'size':>8} | {'legacy MB/s':>11} | {'current MB/s':>12}")
+    for name, legacy, current, limit in cases:
+      for size in sizes:
+        legacy_rate = f"{'skipped':>11}"
+        if limit is None or size <= limit:
+          legacy_rate = f"{measure(size, legacy):>11.0f}"
+        print(
+          f"{name:>9} | {fmt_size(size):>8} | {legacy_rate} | "
+          f"{measure(size, current):>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_send_file.py
+"""
+send_file 傳輸量比較：sendfile (zero-copy) vs chunked fallback，走 loopback。
+
+接收端在另一個 thread 以 recv_into 丟棄資料；
+CPU 欄位是發送端 thread 的 CPU 時間 (time.thread_time)。
+
+Usage:
+  python benchmarks/bench_send_file.py --size-mb 256 1024
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import send_file, _send_file_chunked
+
+
+def drain(server_sock, expected, done):
+  conn, _ = server_sock.accept()
+  buf = bytearray(1024 * 1024)
+  received = 0
+  while received < expected:
+    n = conn.recv_into(buf)
+    if not n:
+      break
+    received += n
+  conn.close()
+  done.append(received)
+
+
+def make_file(path, size):
+  block = os.urandom(1024 * 1024)
+  with open(path, "wb") as f:
+    for _ in range(size // len(block)):
+      f.write(block)
+    f.write(block[: size % len(block)])
+
+
+def run_once(path, size, sender):
+  server_sock = socket.create_server(("127.0.0.1", 0))
+  done = []
+  t = threading.Thread(target=drain, args=(server_sock, size, done))
+  t.start()
+
+  client = socket.create_connection(server_sock.getsockname())
+  cpu0, t0 = time.thread_time(), time.perf_counter()
+  sender(client, path, size)
+  client.close()
+  t.join()
+  elapsed, cpu = time.perf_counter() - t0, time.thread_time() - cpu0
+  server_sock.close()
+
+  assert done == [size], done
+  return size / elapsed / (1024 * 1024), cpu
+
+
+def send_with_sendfile(sock, path, size):
+  send_file(sock, path)
+
+
+def send_with_chunks(sock, path, size):
+  with open(path, "rb") as f:
+    _send_file_chunked(sock, f, 0, size)
+
+
+def send_with_legacy(sock, path, size):
+  """舊版實作：每次讀 4 KiB 再 sendall"""
+  with open(path, "rb") as f:
+    while True:
+      chunk = f.read(4096)
+      if not chunk:
+        break
+      sock.sendall(chunk)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--size-mb", type=int, nargs="+", default=[256, 1024])
+  args = parser.parse_args()
+
+  senders = [
+    ("sendfile", send_with_sendfile),
+    ("chunked 256K", send_with_chunks),
+    ("legacy 4K", send_with_legacy),
+  ]
+  if not hasattr(os, "sendfile"):
+    print("[Bench] os.sendfile not available, 'sendfile' row uses the fallback")
+
+  print(f"{'size MB':>8} | {'mode':>12} | {'MB/s':>8} | {'sender CPU s':>12}")
+  with tempfile.TemporaryDirectory() as tmp:
+    for size_mb in args.size_mb:
+      path = os.path.join(tmp, f"payload_{size_mb}.bin")
+      size = size_mb * 1024 * 1024
+      make_file(path, size)
+      for name, sender in senders:
+        throughput, cpu = run_once(path, size, sender)
+        print(f"{size_mb:>8} | {name:>12} | {throughput:>8.0f} | {cpu:>12.2f}")
+      os.remove(path)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,181 @@
+# benchmarks/bench_server_engines.py
+"""
+Lobby Server 壓力測試：比較 thread 與 asyncio 兩種 engine。
+
+每個 engine 都在獨立的暫存目錄下以 subprocess 啟動 (DB / storage 互不干擾)，
+再由單一 asyncio client 開出 N 條同時存在的連線，
+每條連線先 LOGIN，再連續送出 M 次 LIST_ALL_GAMES。
+
+Usage:
+  python benchmarks/bench_server_engines.py --clients 1000 --requests 20
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.constants import Command
+from common.protocol import HEADER_STRUCT, decode_payload, encode_frame
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(PROJECT_ROOT, "server", "main.py")
+
+
+def start_server(engine, workdir, start_port):
+  """以 subprocess 啟動 Server，回傳 (Popen, port)"""
+  proc = subprocess.Popen(
+    [
+      sys.executable,
+      "-u",
+      SERVER_SCRIPT,
+      "--engine",
+      engine,
+      "--port",
+      str(start_port),
+    ],
+    cwd=workdir,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.STDOUT,
+    text=True,
+  )
+
+  port = None
+  for line in proc.stdout:
+    match = re.search(r"Listening on .*:(\d+)", line)
+    if match:
+      port = int(match.group(1))
+      break
+  if port is None:
+    proc.kill()
+    raise RuntimeError(f"{engine} server failed to start")
+
+  # Server 每個指令都會 print，持續讀掉 stdout 避免 pipe 塞滿
+  threading.Thread(target=lambda: [None for _ in proc.stdout], daemon=True).start()
+  return proc, port
+
+
+def read_proc_status(pid):
+  """讀取 /proc/<pid>/status 的 VmRSS 與 Threads (僅 Linux)"""
+  stats = {}
+  try:
+    with open(f"/proc/{pid}/status") as f:
+      for line in f:
+        key, _, value = line.partition(":")
+        if key in ("VmRSS", "Threads"):
+          stats[key] = value.strip()
+  except OSError:
+    pass
+  return stats
+
+
+async def call(reader, writer, cmd, data):
+  writer.write(encode_frame(cmd, data))
+  await writer.drain()
+  header = await reader.readexactly(HEADER_STRUCT.size)
+  payload_len, cmd_value = HEADER_STRUCT.unpack(header)
+  payload = await reader.readexactly(payload_len) if payload_len else b""
+  return decode_payload(cmd_value, payload)
+
+
+async def run_client(port, idx, n_requests, latencies, connected, start_event):
+  reader, writer = await asyncio.open_connection("127.0.0.1", port)
+  await call(
+    reader,
+    writer,
+    Command.LOGIN,
+    {"username": f"bench_{idx}", "password": "pw", "role": "player"},
+  )
+  connected.append(idx)
+
+  # 等所有連線都建立後再一起開始打，才能測到「大量同時連線」的情況
+  await start_event.wait()
+  for _ in range(n_requests):
+    t0 = time.perf_counter()
+    await call(reader, writer, Command.LIST_ALL_GAMES, {})
+    latencies.append(time.perf_counter() - t0)
+
+  writer.write(encode_frame(Command.LOGOUT, {}))
+  await writer.drain()
+  writer.close()
+
+
+async def run_load(port, n_clients, n_requests, proc):
+  latencies = []
+  connected = []
+  start_event = asyncio.Event()
+
+  tasks = [
+    asyncio.create_task(
+      run_client(port, i, n_requests, latencies, connected, start_event)
+    )
+    for i in range(n_clients)
+  ]
+  while len(connected) < n_clients:
+    if all(t.done() for t in tasks):
+      break
+    await asyncio.sleep(0.05)
+
+  idle_stats = read_proc_status(proc.pid)
+  t0 = time.perf_counter()
+  start_event.set()
+  results = await asyncio.gather(*tasks, return_exceptions=True)
+  elapsed = time.perf_counter() - t0
+
+  errors = sum(1 for r in results if isinstance(r, Exception))
+  return latencies, elapsed, errors, idle_stats
+
+
+def percentile(values, pct):
+  if not values:
+    return 0.0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_engine(engine, n_clients, n_requests, start_port):
+  with tempfile.TemporaryDirectory() as workdir:
+    proc, port = start_server(engine, workdir, start_port)
+    try:
+      latencies, elapsed, errors, stats = asyncio.run(
+        run_load(port, n_clients, n_requests, proc)
+      )
+    finally:
+      proc.terminate()
+      proc.wait()
+
+  total = len(latencies)
+  print(
+    f"{engine:>8} | {n_clients:>7} | {total / elapsed:>10.0f} | "
+    f"{percentile(latencies, 50) * 1000:>8.2f} | "
+    f"{percentile(latencies, 99) * 1000:>8.2f} | "
+    f"{stats.get('VmRSS', '?'):>11} | {stats.get('Threads', '?'):>7} | {errors}"
+  )
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument("--clients", type=int, nargs="+", default=[100, 500, 1000])
+  parser.add_argument("--requests", type=int, default=20)
+  parser.add_argument("--port", type=int, default=31000)
+  parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+  args = parser.parse_args()
+
+  print(
+    f"{'engine':>8} | {'clients':>7} | {'req/s':>10} | {'p50 ms':>8} | "
+    f"{'p99 ms':>8} | {'RSS (idle)':>11} | {'threads':>7} | errors"
+  )
+  for n_clients in args.clients:
+    for engine in args.engines:
+      bench_engine(engine, n_clients, args.requests, args.port)
+
+
+if __name__ == "__main__":
+  main()
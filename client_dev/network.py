@@ -8,8 +8,17 @@ import os
 # 路徑修正 (確保能 import common)
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from common.codec import CODEC_JSON, preferred_codecs
 from common.constants import Command, DEFAULT_HOST, DEFAULT_PORT, Status
-from common.protocol import send_request, recv_request, send_file
+from common.manifest import build_zip_from_dir, diff_manifest, manifest_from_dir
+from common.protocol import (
+  COMPRESSIONS,
+  recv_request,
+  send_file,
+  send_request,
+  set_codec,
+  set_compression,
+)
 
 
 class NetworkClient:
@@ -17,9 +26,13 @@ class NetworkClient:
     self.sock = None
     self.is_connected = False
     self.username = None
+    self.host = None
+    # Server 的資料通道 Port (LOGIN 時得知)，None 時檔案走控制連線
+    self.data_port = None
 
   def connect(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
     try:
+      self.host = host
       self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
       self.sock.connect((host, port))
       self.is_connected = True
@@ -34,8 +47,14 @@ class NetworkClient:
     if not self.is_connected:
       return False, "Not connected to server"
 
-    # 傳送登入請求 (role='dev')
-    payload = {"username": username, "password": password, "role": "dev"}
+    # 傳送登入請求 (role='dev')，附上可接受的 codec 與壓縮方式
+    payload = {
+      "username": username,
+      "password": password,
+      "role": "dev",
+      "codecs": preferred_codecs(),
+      "compression": list(COMPRESSIONS),
+    }
     send_request(self.sock, Command.LOGIN, payload)
 
     # 等待回應 (Synchronous wait)
@@ -43,6 +62,10 @@ class NetworkClient:
 
     if cmd == Command.LOGIN and res.get("status") == Status.SUCCESS.value:
       self.username = username
+      # 之後的請求改用 Server 選定的 codec 與壓縮
+      set_codec(self.sock, res.get("codec", CODEC_JSON))
+      set_compression(self.sock, res.get("compression"))
+      self.data_port = res.get("data_port")
       return True, res.get("msg")
     else:
       return False, res.get("msg", "Unknown error")
@@ -73,6 +96,8 @@ class NetworkClient:
       "exe_path": exe_path,
       "file_size": file_size,
     }
+    if self.data_port:
+      payload["data_channel"] = True
     send_request(self.sock, Command.UPLOAD_GAME, payload)
 
     # 2. 等待 Server 準備好 (Blocking)
@@ -80,15 +105,13 @@ class NetworkClient:
     if cmd != Command.UPLOAD_GAME or res.get("status") != Status.SUCCESS.value:
       return False, res.get("msg", "Server rejected upload")
 
-    # 3. 發送檔案串流
+    # 3. 發送檔案串流並等待最終確認
     try:
       print(f"[Network] Sending file {file_size} bytes...")
-      send_file(self.sock, zip_file_path)
+      cmd, res = self._send_package(Command.UPLOAD_GAME, res, zip_file_path)
     except Exception as e:
       return False, f"File transfer error: {e}"
 
-    # 4. 等待最終確認
-    cmd, res = recv_request(self.sock)
     if res.get("status") == Status.SUCCESS.value:
       return True, "Upload success"
     else:
@@ -106,8 +129,41 @@ class NetworkClient:
       return res.get("games", [])
     return []
 
-  def update_game(self, name, new_version, exe_path, zip_path, file_size):
-    """D2: 更新遊戲"""
+  def get_game_info(self, name):
+    """取得遊戲目前版本與逐檔清單，失敗時回傳 None"""
+    send_request(self.sock, Command.GET_GAME_INFO, {"name": name})
+    cmd, res = recv_request(self.sock)
+    if cmd == Command.GET_GAME_INFO and res.get("status") == Status.SUCCESS.value:
+      return res
+    return None
+
+  def update_game_delta(self, name, new_version, exe_path, folder, zip_path):
+    """
+    D2: 差異更新
+    與 Server 上目前版本的 manifest 比較，只打包有變動的檔案上傳；
+    Server 沒有 manifest 時改為上傳完整資料夾。zip_path 為暫存 zip 的位置。
+    """
+    if not self.is_connected:
+      return False, "Not connected"
+
+    info = self.get_game_info(name)
+    manifest = manifest_from_dir(folder)
+
+    if info and info.get("manifest") is not None:
+      changed, removed = diff_manifest(info["manifest"], manifest)
+      print(f"[Network] Delta: {len(changed)} changed, {len(removed)} removed")
+      build_zip_from_dir(folder, zip_path, changed)
+      delta = {"base_version": info["version"], "manifest": manifest}
+    else:
+      build_zip_from_dir(folder, zip_path, sorted(manifest))
+      delta = None
+
+    return self.update_game(
+      name, new_version, exe_path, zip_path, os.path.getsize(zip_path), delta
+    )
+
+  def update_game(self, name, new_version, exe_path, zip_path, file_size, delta=None):
+    """D2: 更新遊戲 (delta 為差異更新的 base_version 與完整 manifest)"""
     if not self.is_connected:
       return False, "Not connected"
 
@@ -118,6 +174,10 @@ class NetworkClient:
       "exe_path": exe_path,
       "file_size": file_size,
     }
+    if delta:
+      payload.update(delta)
+    if self.data_port:
+      payload["data_channel"] = True
     send_request(self.sock, Command.UPDATE_GAME, payload)
 
     # 2. 等待 Ready (加入超時保護)
@@ -136,22 +196,45 @@ class NetworkClient:
     if res.get("status") != Status.SUCCESS.value:
       return False, res.get("msg")
 
-    # 3. 傳送檔案
+    # 3. 傳送檔案並等待結果
     try:
-      send_file(self.sock, zip_path)
+      cmd, res = self._send_package(Command.UPDATE_GAME, res, zip_path)
     except Exception as e:
       return False, f"File send error: {e}"
 
-    # 4. 等待結果
-    cmd, res = recv_request(self.sock)
     if res.get("status") == Status.SUCCESS.value:
       return True, "Success"
     else:
       return False, res.get("msg")
 
+  def _send_package(self, cmd, ready, zip_path):
+    """
+    Server 回覆 Ready 後送出遊戲包並回傳最終結果 (Command, data)。
+    Ready 帶 token 時改連資料通道：先送 token，再送檔案並在同一條連線等結果。
+    """
+    if not ready.get("token"):
+      send_file(self.sock, zip_path)
+      return recv_request(self.sock)
+
+    with socket.create_connection((self.host, ready["data_port"])) as data_sock:
+      send_request(data_sock, cmd, {"token": ready["token"]})
+      send_file(data_sock, zip_path)
+      result = recv_request(data_sock)
+    if result[0] is None:
+      raise ConnectionError("Data channel closed before upload finished")
+    return result
+
   def delete_game(self, game_name):
     send_request(self.sock, Command.DELETE_GAME, {"name": game_name})
     cmd, res = recv_request(self.sock)
     if res.get("status") == Status.SUCCESS.value:
       return True, res.get("msg")
     return False, res.get("msg")
+
+  def get_admin_stats(self):
+    """管理查詢 (需從 Server 本機連線)：房間分布與各 host 行程負載，失敗時回傳 None"""
+    send_request(self.sock, Command.ADMIN_STATS, {})
+    cmd, res = recv_request(self.sock)
+    if cmd == Command.ADMIN_STATS and res.get("status") == Status.SUCCESS.value:
+      return res
+    return None
@@ -88,7 +88,12 @@ class DashboardWindow(QMainWindow):
       self.table.setItem(i, 0, QTableWidgetItem(str(game["name"])))
       self.table.setItem(i, 1, QTableWidgetItem(str(game["version"])))
       self.table.setItem(i, 2, QTableWidgetItem(str(game.get("type", "Unknown"))))
-      self.table.setItem(i, 3, QTableWidgetItem("Published"))
+      # Server 在背景解壓縮部署，顯示部署進度 (pending / deploying / ready / failed)
+      deploy_status = game.get("deploy_status", "ready")
+      status_text = (
+        "Published" if deploy_status == "ready" else deploy_status.capitalize()
+      )
+      self.table.setItem(i, 3, QTableWidgetItem(status_text))
 
   def open_upload_dialog(self):
     """開啟上架對話框 (標準模式)"""
@@ -126,15 +131,9 @@ class DashboardWindow(QMainWindow):
 
       zip_path = "temp_update.zip"
       try:
-        dialog._zip_folder(dialog.selected_folder, zip_path)
-        file_size = os.path.getsize(zip_path)
-      except Exception as e:
-        QMessageBox.critical(dialog, "Zip Error", str(e))
-        return
-
-      try:
-        success, msg = self.network.update_game(
-          game_name, new_version, exe_path, zip_path, file_size
+        # 只上傳與 Server 目前版本不同的檔案
+        success, msg = self.network.update_game_delta(
+          game_name, new_version, exe_path, dialog.selected_folder, zip_path
         )
         if success:
           QMessageBox.information(
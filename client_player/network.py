@@ -1,13 +1,25 @@
 # client_player/network.py
 
 import socket
+import threading
 import os
 import sys
+import json
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from common.codec import CODEC_JSON, preferred_codecs
 from common.constants import Command, DEFAULT_HOST, DEFAULT_PORT, Status
-from common.protocol import send_request, recv_request, recv_file
+from common.protocol import (
+  COMPRESSIONS,
+  exchange_pipelined,
+  recv_file,
+  recv_request,
+  send_request,
+  set_codec,
+  set_compression,
+)
+from client_player.segmented_download import SegmentedDownload, SegmentError
 
 
 class NetworkClient:
@@ -15,9 +27,19 @@ class NetworkClient:
     self.sock = None
     self.is_connected = False
     self.username = None
+    # 本地商城快取：{game_name: game}，搭配 etag 向 Server 只拿差異
+    self._catalogue = {}
+    self._catalogue_etag = None
+    self.pipelining = False  # Server 是否接受帶 Request ID 的請求 (LOGIN 時得知)
+    self.host = None
+    # Server 的資料通道 Port (LOGIN 時得知)，None 時檔案走控制連線
+    self.data_port = None
+    # 控制連線一次只進行一組請求 / 回應；下載可在其他 thread 進行 (檔案走資料通道)
+    self.lock = threading.Lock()
 
   def connect(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
     try:
+      self.host = host
       self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
       self.sock.connect((host, port))
       self.is_connected = True
@@ -33,46 +55,281 @@ class NetworkClient:
     send_request(
       self.sock,
       Command.LOGIN,
-      {"username": username, "password": password, "role": "player"},
+      {
+        "username": username,
+        "password": password,
+        "role": "player",
+        "codecs": preferred_codecs(),
+        "compression": list(COMPRESSIONS),
+      },
     )
     cmd, res = recv_request(self.sock)
     if res.get("status") == Status.SUCCESS.value:
       self.username = username
+      # 之後的請求改用 Server 選定的 codec 與壓縮
+      set_codec(self.sock, res.get("codec", CODEC_JSON))
+      set_compression(self.sock, res.get("compression"))
+      self.pipelining = bool(res.get("pipelining"))
+      self.data_port = res.get("data_port")
       return True, res.get("msg")
     return False, res.get("msg")
 
+  def get_lobby(self, open_only=False):
+    """
+    一次取得商城列表與第一頁房間，回傳 (games, rooms, next_cursor)。
+    Server 支援 pipelining 時兩個請求一起送出，只等一次來回。
+    """
+    requests = [
+      (Command.LIST_ALL_GAMES, self._catalogue_payload()),
+      (Command.LIST_ROOMS, self._rooms_payload(open_only=open_only)),
+    ]
+    if self.pipelining:
+      with self.lock:
+        responses = exchange_pipelined(self.sock, requests)
+    else:
+      responses = [self._call(cmd, payload) for cmd, payload in requests]
+
+    games = self._apply_catalogue(*responses[0])
+    rooms, next_cursor = self._parse_rooms(*responses[1])
+    return games, rooms, next_cursor
+
+  def _call(self, cmd, payload):
+    """送出一個請求並等待回應"""
+    with self.lock:
+      send_request(self.sock, cmd, payload)
+      return recv_request(self.sock)
+
+  def _catalogue_payload(self):
+    payload = {}
+    if self._catalogue_etag:
+      payload["etag"] = self._catalogue_etag
+    return payload
+
   def get_all_games(self):
-    """P1: 取得所有遊戲列表"""
-    send_request(self.sock, Command.LIST_ALL_GAMES, {})
-    cmd, res = recv_request(self.sock)
-    return res.get("games", [])
+    """P1: 取得所有遊戲列表 (帶上次的 etag，Server 只回傳變動的部分)"""
+    return self._apply_catalogue(
+      *self._call(Command.LIST_ALL_GAMES, self._catalogue_payload())
+    )
 
-  def download_game(self, game_name, save_dir):
-    """P2: 下載遊戲"""
-    # 1. 發送下載請求
-    send_request(self.sock, Command.DOWNLOAD_GAME, {"name": game_name})
+  def _apply_catalogue(self, cmd, res):
+    """把 LIST_ALL_GAMES 的回應套用到本地快取，回傳完整列表"""
+    if cmd != Command.LIST_ALL_GAMES:
+      return list(self._catalogue.values())
 
-    # 2. 接收回應 (包含版本與檔案大小)
-    cmd, res = recv_request(self.sock)
+    # not_modified 時沿用本地快取
+    if res.get("delta"):
+      for game in res.get("changed", []):
+        self._catalogue[game["name"]] = game
+      for name in res.get("removed", []):
+        self._catalogue.pop(name, None)
+    elif not res.get("not_modified"):
+      self._catalogue = {g["name"]: g for g in res.get("games", [])}
+    self._catalogue_etag = res.get("etag")
+
+    # 維持與 Server 相同的上架順序
+    return sorted(self._catalogue.values(), key=lambda g: g.get("id", 0))
+
+  def download_game(self, game_name, save_dir, progress_callback=None, have=None):
+    """
+    P2: 下載遊戲 (支援續傳)
+    下載中的內容寫在 <game>.zip.part，旁邊的 .part.json 記錄版本；
+    連線中斷後再次呼叫會從 .part 的大小繼續，完成後才改名成正式的 zip。
+
+    have 為已安裝檔案的 {path: sha256}，Server 可能只回傳有差異的檔案
+    (結果中 delta=True，removed 為新版已刪除的檔案)。差異下載不支援續傳。
+
+    Server 有資料通道時檔案從另一條連線接收，控制連線只在交換請求時短暫使用，
+    因此可以在背景 thread 下載，同時照常查詢房間或下載其他遊戲。
+    大檔案由 Server 切成多段，以多條資料連線同時下載並逐段驗證 (見 SegmentedDownload)。
+    """
+    # 1. 準備接收檔案
+    if not os.path.exists(save_dir):
+      os.makedirs(save_dir)
+
+    part_path = os.path.join(save_dir, f"{game_name}.zip.part")
+    meta_path = part_path + ".json"
+    part_meta = self._read_part_meta(part_path, meta_path)
+
+    # 2. 發送下載請求 (有 .part 時帶上 version 與 offset；分段下載的 .part 由段落紀錄續傳)
+    payload = {"name": game_name}
+    if part_meta is not None:
+      payload["version"] = part_meta.get("version")
+      if not part_meta.get("segmented"):
+        payload["offset"] = os.path.getsize(part_path)
+    elif have is not None:
+      payload["have"] = have
+    if self.data_port:
+      payload["data_channel"] = True
+      payload["segments"] = True
+
+    # 3. 接收回應 (包含版本、檔案大小與這次傳送的範圍)
+    with self.lock:
+      send_request(self.sock, Command.DOWNLOAD_GAME, payload)
+      cmd, res = recv_request(self.sock)
+      inline = not res.get("token") and res.get("segment_hashes") is None
+      if res.get("status") == Status.SUCCESS.value and inline:
+        # 檔案緊接著在控制連線上傳送，收完才能讓其他請求使用
+        return self._receive_package(res, game_name, save_dir, progress_callback)
+
+    if res.get("status") == Status.ERR_VERSION_MISMATCH.value:
+      # Server 已有新版本，舊的 .part 沒用了，重新下載
+      self._remove_partial(part_path, meta_path)
+      return self.download_game(game_name, save_dir, progress_callback, have)
     if res.get("status") != Status.SUCCESS.value:
       return False, res.get("msg")
+    if res.get("segment_hashes") is not None:
+      return self._download_segments(
+        res, game_name, save_dir, progress_callback, part_meta
+      )
+    return self._receive_package(res, game_name, save_dir, progress_callback)
 
+  def _receive_package(self, res, game_name, save_dir, progress_callback):
+    """依 DOWNLOAD_GAME 的回應接收遊戲包到 .part，完成後改名成正式的 zip"""
+    part_path = os.path.join(save_dir, f"{game_name}.zip.part")
+    meta_path = part_path + ".json"
     version = res.get("version")
     file_size = res.get("file_size")
+    offset = res.get("offset", 0)
+    length = res.get("length", file_size)
+    delta = res.get("delta", False)
 
-    # 3. 準備接收檔案
-    if not os.path.exists(save_dir):
-      os.makedirs(save_dir)
+    with open(meta_path, "w") as f:
+      json.dump({"version": version, "file_size": file_size, "delta": delta}, f)
 
-    # 暫存 zip 檔路徑
+    # 完成後的 zip 檔路徑
     zip_path = os.path.join(save_dir, f"{game_name}_{version}.zip")
 
+    token = res.get("token")
     try:
-      recv_file(self.sock, file_size, zip_path)
-      return True, {"version": version, "zip_path": zip_path}
+      if token:
+        self._recv_from_data_channel(res, length, part_path, progress_callback, offset)
+      else:
+        recv_file(self.sock, length, part_path, progress_callback, offset=offset)
     except Exception as e:
+      # .part 保留給下次續傳；控制連線上的串流已經不完整，不能再使用
+      if not token:
+        self.is_connected = False
       return False, str(e)
 
+    return self._finish_package(res, part_path, meta_path, zip_path)
+
+  def _finish_package(self, res, part_path, meta_path, zip_path):
+    os.replace(part_path, zip_path)
+    os.remove(meta_path)
+    return True, {
+      "version": res.get("version"),
+      "zip_path": zip_path,
+      "delta": res.get("delta", False),
+      "removed": res.get("removed", []),
+      "manifest": res.get("manifest"),
+    }
+
+  def _download_segments(self, res, game_name, save_dir, progress_callback, part_meta):
+    """
+    分段下載：每段各自在控制連線上換一個 token，再從獨立的資料連線接收，
+    寫進 .part 的對應位置。已驗證的段記在 .part.json，中斷後只需補下其餘的段。
+    """
+    part_path = os.path.join(save_dir, f"{game_name}.zip.part")
+    meta_path = part_path + ".json"
+    version = res["version"]
+    file_size = res["file_size"]
+    segment_size = res["segment_size"]
+    zip_path = os.path.join(save_dir, f"{game_name}_{version}.zip")
+
+    done = []
+    if (
+      part_meta is not None
+      and part_meta.get("segmented")
+      and part_meta.get("version") == version
+      and part_meta.get("segment_size") == segment_size
+      and os.path.getsize(part_path) == file_size
+    ):
+      done = part_meta.get("done", [])
+    else:
+      with open(part_path, "wb") as f:
+        f.truncate(file_size)  # 先配置好完整大小，各段直接寫入自己的位置
+
+    meta = {
+      "version": version,
+      "file_size": file_size,
+      "delta": False,
+      "segmented": True,
+      "segment_size": segment_size,
+    }
+
+    def save_meta(done_set):
+      with open(meta_path, "w") as f:
+        json.dump(dict(meta, done=sorted(done_set)), f)
+
+    def fetch(offset, length, hasher):
+      cmd, seg = self._call(
+        Command.DOWNLOAD_GAME,
+        {
+          "name": game_name,
+          "version": version,
+          "offset": offset,
+          "length": length,
+          "data_channel": True,
+        },
+      )
+      if cmd is None:
+        # 控制連線已斷，換 token 的請求重試也不會成功
+        self.is_connected = False
+        raise SegmentError("Connection to server lost")
+      if seg.get("status") != Status.SUCCESS.value or not seg.get("token"):
+        # Server 拒絕 (例如版本已更新)，重試也沒用
+        raise SegmentError(seg.get("msg", "Segment request rejected"))
+      self._recv_from_data_channel(seg, length, part_path, None, offset, hasher)
+
+    save_meta(done)
+    download = SegmentedDownload(
+      file_size,
+      segment_size,
+      res["segment_hashes"],
+      fetch,
+      done=done,
+      progress_callback=progress_callback,
+      on_segment_done=save_meta,
+    )
+    try:
+      download.run()
+    except Exception as e:
+      return False, str(e)  # .part 與已完成的段保留給下次續傳
+    return self._finish_package(res, part_path, meta_path, zip_path)
+
+  def _recv_from_data_channel(
+    self, res, length, part_path, progress_callback, offset, hasher=None
+  ):
+    """帶 token 連上資料通道，Server 確認 token 後接收檔案內容"""
+    with socket.create_connection((self.host, res["data_port"])) as data_sock:
+      send_request(data_sock, Command.DOWNLOAD_GAME, {"token": res["token"]})
+      cmd, reply = recv_request(data_sock)
+      if cmd != Command.DOWNLOAD_GAME or reply.get("status") != Status.SUCCESS.value:
+        raise ConnectionError((reply or {}).get("msg", "Data channel rejected"))
+      recv_file(data_sock, length, part_path, progress_callback, offset, hasher)
+
+  def _read_part_meta(self, part_path, meta_path):
+    """回傳未完成下載的 .part.json 內容，沒有可續傳的 .part 時回傳 None"""
+    if not (os.path.exists(part_path) and os.path.exists(meta_path)):
+      self._remove_partial(part_path, meta_path)
+      return None
+    try:
+      with open(meta_path, "r") as f:
+        meta = json.load(f)
+    except (OSError, ValueError):
+      self._remove_partial(part_path, meta_path)
+      return None
+    # 差異 zip 是針對當次請求產生的，無法續傳
+    if meta.get("delta") or os.path.getsize(part_path) > meta.get("file_size", 0):
+      self._remove_partial(part_path, meta_path)
+      return None
+    return meta
+
+  def _remove_partial(self, part_path, meta_path):
+    for path in (part_path, meta_path):
+      if os.path.exists(path):
+        os.remove(path)
+
   def disconnect(self):
     if self.sock:
       try:
@@ -84,9 +341,7 @@ class NetworkClient:
   def create_room(self, game_name):
     """發送建立房間請求"""
     payload = {"game_name": game_name}
-    send_request(self.sock, Command.CREATE_ROOM, payload)
-
-    cmd, res = recv_request(self.sock)
+    cmd, res = self._call(Command.CREATE_ROOM, payload)
     if res.get("status") == Status.SUCCESS.value:
       return True, {"room_id": res.get("room_id"), "port": res.get("port")}
     else:
@@ -94,20 +349,29 @@ class NetworkClient:
 
   def rate_game(self, game_name, rating, comment):
     payload = {"game_name": game_name, "rating": rating, "comment": comment}
-    send_request(self.sock, Command.RATE_GAME, payload)
-
-    cmd, res = recv_request(self.sock)
+    cmd, res = self._call(Command.RATE_GAME, payload)
     if res.get("status") == Status.SUCCESS.value:
       return True, res.get("msg")
     return False, res.get("msg")
 
-  def get_active_rooms(self):
-    """傳送 LIST_ROOMS 請求取得房間列表"""
-    send_request(self.sock, Command.LIST_ROOMS, {})
-    cmd, data = recv_request(self.sock)
+  def get_active_rooms(self, game=None, open_only=False, cursor=None, limit=None):
+    """傳送 LIST_ROOMS 請求取得一頁房間列表，回傳 (rooms, next_cursor)"""
+    payload = self._rooms_payload(game, open_only, cursor, limit)
+    return self._parse_rooms(*self._call(Command.LIST_ROOMS, payload))
+
+  def _rooms_payload(self, game=None, open_only=False, cursor=None, limit=None):
+    payload = {"open": open_only}
+    if game:
+      payload["game"] = game
+    if cursor:
+      payload["cursor"] = cursor
+    if limit:
+      payload["limit"] = limit
+    return payload
 
+  def _parse_rooms(self, cmd, data):
     if cmd == Command.LIST_ROOMS:
-      return data.get("rooms", [])
+      return data.get("rooms", []), data.get("next_cursor")
     else:
       print(f"[Network] Failed to get rooms: {data}")
-      return []
+      return [], None
@@ -0,0 +1,168 @@
+# client_player/segmented_download.py
+
+import hashlib
+import threading
+import time
+from collections import deque
+
+# 一開始同時下載的段數 (連線數)
+MIN_SEGMENT_WORKERS = 2
+
+# 同時下載的段數上限
+MAX_SEGMENT_WORKERS = 8
+
+# 加開一條連線後整體速度至少要提升這個比例，才會再繼續加開
+GROWTH_THRESHOLD = 0.1
+
+# 單一段失敗 (驗證不符或連線錯誤) 時重新下載的次數
+SEGMENT_RETRIES = 2
+
+# 連線錯誤後重試前等待的秒數 (第 n 次重試等 n 倍)
+SEGMENT_RETRY_DELAY = 0.5
+
+
+class SegmentError(Exception):
+  pass
+
+
+class SegmentedDownload:
+  """
+  把檔案切成固定大小的段，用多條連線同時下載，各段寫進同一個 .part 的對應位置。
+
+  fetch(offset, length, hasher) 負責下載 [offset, offset + length) 並寫入 .part，
+  收到的資料同時餵給 hasher；每段收完後與 segment_hashes 比對，不符就重下。
+  fetch 丟出 OSError (連線中斷、token 逾時等) 時也只重下這一段 (每次呼叫都重新取得
+  token 與連線)，重試 SEGMENT_RETRIES 次仍失敗才讓整個下載失敗；
+  其他例外 (例如 SegmentError) 視為無法重試的錯誤。
+
+  同時下載的段數依實測速度調整：從 min_workers 開始，
+  每條連線都至少完成一段後量測整體速度，比上次加開前快 GROWTH_THRESHOLD 以上才再加開一條，
+  否則維持目前的數量 (頻寬已吃滿，再加只會互搶)。
+  """
+
+  def __init__(
+    self,
+    file_size,
+    segment_size,
+    segment_hashes,
+    fetch,
+    done=(),
+    progress_callback=None,
+    on_segment_done=None,
+    min_workers=MIN_SEGMENT_WORKERS,
+    max_workers=MAX_SEGMENT_WORKERS,
+  ):
+    self.file_size = file_size
+    self.segment_size = segment_size
+    self.segment_hashes = segment_hashes
+    self.fetch = fetch
+    self.progress_callback = progress_callback
+    # on_segment_done(done_set)：每完成一段呼叫一次 (持有 lock)
+    self.on_segment_done = on_segment_done
+    self.min_workers = min_workers
+    self.max_workers = max_workers
+
+    self.cond = threading.Condition()
+    self.done = {i for i in done if 0 <= i < len(segment_hashes)}
+    self.pending = deque(i for i in range(len(segment_hashes)) if i not in self.done)
+    self.received = sum(self._length(i) for i in self.done)
+    self.error = None
+    self.workers = []
+
+    # 速度量測 (自上次調整連線數起)
+    self._growing = True
+    self._mark_time = None
+    self._mark_bytes = 0
+    self._mark_segments = 0
+    self._best_rate = 0.0
+
+  def _length(self, index):
+    return min(self.segment_size, self.file_size - index * self.segment_size)
+
+  def run(self):
+    """下載所有尚未完成的段，失敗時丟出例外 (已完成的段保留在 done)"""
+    with self.cond:
+      self._mark()
+      for _ in range(min(self.min_workers, len(self.pending))):
+        self._add_worker()
+      while len(self.done) < len(self.segment_hashes) and self.error is None:
+        self.cond.wait()
+        self._adjust()
+
+    for worker in self.workers:
+      worker.join()
+    if self.error is not None:
+      raise self.error
+
+  def _add_worker(self):
+    worker = threading.Thread(target=self._work, name="segment", daemon=True)
+    self.workers.append(worker)
+    worker.start()
+
+  def _mark(self):
+    self._mark_time = time.monotonic()
+    self._mark_bytes = self.received
+    self._mark_segments = len(self.done)
+
+  def _adjust(self):
+    """(呼叫者需持有 lock) 依目前速度決定是否加開一條連線"""
+    if not self._growing or len(self.workers) >= self.max_workers:
+      return
+    # 每條連線都完成過一段後，量到的速度才有代表性
+    if len(self.done) - self._mark_segments < len(self.workers):
+      return
+    elapsed = time.monotonic() - self._mark_time
+    if elapsed <= 0:
+      return
+    rate = (self.received - self._mark_bytes) / elapsed
+    if rate > self._best_rate * (1 + GROWTH_THRESHOLD) and self.pending:
+      self._best_rate = rate
+      self._add_worker()
+      self._mark()
+    else:
+      self._growing = False
+
+  def _work(self):
+    while True:
+      with self.cond:
+        if self.error is not None or not self.pending:
+          return
+        index = self.pending.popleft()
+
+      try:
+        self._fetch_segment(index)
+      except Exception as e:
+        with self.cond:
+          if self.error is None:
+            self.error = e
+          self.cond.notify_all()
+        return
+
+      with self.cond:
+        self.done.add(index)
+        self.received += self._length(index)
+        if self.on_segment_done is not None:
+          self.on_segment_done(self.done)
+        if self.progress_callback:
+          self.progress_callback(self.received, self.file_size)
+        self.cond.notify_all()
+
+  def _fetch_segment(self, index):
+    offset = index * self.segment_size
+    length = self._length(index)
+    error = None
+    for attempt in range(SEGMENT_RETRIES + 1):
+      if attempt and isinstance(error, OSError):
+        time.sleep(SEGMENT_RETRY_DELAY * attempt)
+      hasher = hashlib.sha256()
+      try:
+        self.fetch(offset, length, hasher)
+      except OSError as e:
+        error = e
+        print(f"[Download] Segment {index} failed ({e}), retrying...")
+        continue
+      if hasher.hexdigest() == self.segment_hashes[index]:
+        return
+      error = SegmentError(f"Segment {index} failed verification")
+      print(f"[Download] Segment {index} failed verification, retrying...")
+    raise error
@@ -2,6 +2,7 @@ import os
 import zipfile
 import subprocess
 import sys
+from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtWidgets import (
   QMainWindow,
   QWidget,
@@ -19,8 +20,11 @@ from PyQt6.QtWidgets import (
   QTextEdit,
   QApplication,
   QTabWidget,  # <--- 新增
+  QCheckBox,
 )
 
+from common.manifest import installed_hashes, is_safe_path, write_manifest
+
 
 # === 評分視窗類別 (維持不變) ===
 class RateDialog(QDialog):
@@ -54,6 +58,26 @@ class RateDialog(QDialog):
     return rating, self.comment_input.toPlainText()
 
 
+# === 背景下載 ===
+class DownloadWorker(QThread):
+  """在背景 thread 下載遊戲；檔案走資料通道，下載期間大廳仍可刷新、同時下載其他遊戲"""
+
+  finished_download = pyqtSignal(str, bool, object)  # (game_name, success, result)
+
+  def __init__(self, network, game_name, game_dir, have):
+    super().__init__()
+    self.network = network
+    self.game_name = game_name
+    self.game_dir = game_dir
+    self.have = have
+
+  def run(self):
+    success, result = self.network.download_game(
+      self.game_name, self.game_dir, have=self.have
+    )
+    self.finished_download.emit(self.game_name, success, result)
+
+
 # === 主大廳視窗 ===
 class LobbyWindow(QMainWindow):
   def __init__(self, network_client, username):
@@ -61,12 +85,12 @@ class LobbyWindow(QMainWindow):
     self.network = network_client
     self.username = username
     self.download_base_path = os.path.join("client_player", "downloads", self.username)
+    self.downloads = {}  # {game_name: DownloadWorker}，進行中的下載
 
     self.init_ui()
 
     # 初始載入資料
-    self.refresh_store_list()
-    self.refresh_room_list()
+    self.refresh_all()
 
   def init_ui(self):
     self.setWindowTitle(f"Game System - Player: {self.username}")
@@ -132,8 +156,19 @@ class LobbyWindow(QMainWindow):
 
     self.tab_store.setLayout(layout)
 
+  def refresh_all(self):
+    # 商城與房間列表一起取得 (Server 支援時只需一次來回)
+    games, rooms, self.rooms_cursor = self.network.get_lobby(
+      open_only=self.chk_open_only.isChecked()
+    )
+    self.show_games(games)
+    self.room_table.setRowCount(0)
+    self.append_rooms(rooms)
+
   def refresh_store_list(self):
-    games = self.network.get_all_games()
+    self.show_games(self.network.get_all_games())
+
+  def show_games(self, games):
     self.store_table.setRowCount(0)
     self.store_table.setRowCount(len(games))
 
@@ -181,9 +216,15 @@ class LobbyWindow(QMainWindow):
     layout = QVBoxLayout()
 
     # Toolbar
+    toolbar = QHBoxLayout()
     btn_refresh = QPushButton("Refresh Rooms")
     btn_refresh.clicked.connect(self.refresh_room_list)
-    layout.addWidget(btn_refresh)
+    toolbar.addWidget(btn_refresh)
+    self.chk_open_only = QCheckBox("Joinable only")
+    self.chk_open_only.stateChanged.connect(self.refresh_room_list)
+    toolbar.addWidget(self.chk_open_only)
+    layout.addLayout(toolbar)
+    self.rooms_cursor = None  # 下一頁的 cursor (None 代表沒有更多房間)
 
     # Room Table
     self.room_table = QTableWidget()
@@ -198,19 +239,39 @@ class LobbyWindow(QMainWindow):
     self.room_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
     layout.addWidget(self.room_table)
 
+    # Server 一次只回傳一頁，捲到底時按這個載入下一頁
+    self.btn_more_rooms = QPushButton("Load More")
+    self.btn_more_rooms.clicked.connect(self.load_more_rooms)
+    self.btn_more_rooms.setEnabled(False)
+    layout.addWidget(self.btn_more_rooms)
+
     self.tab_rooms.setLayout(layout)
 
   def refresh_room_list(self):
-    # 呼叫 Network Client 取得房間列表
-    rooms = self.network.get_active_rooms()
+    # 重新從第一頁開始
     self.room_table.setRowCount(0)
-    self.room_table.setRowCount(len(rooms))
+    self.rooms_cursor = None
+    self.load_more_rooms()
 
-    for i, room in enumerate(rooms):
+  def load_more_rooms(self):
+    # 呼叫 Network Client 取得下一頁房間，接在表格後面
+    rooms, self.rooms_cursor = self.network.get_active_rooms(
+      open_only=self.chk_open_only.isChecked(), cursor=self.rooms_cursor
+    )
+    self.append_rooms(rooms)
+
+  def append_rooms(self, rooms):
+    self.btn_more_rooms.setEnabled(self.rooms_cursor is not None)
+    first_row = self.room_table.rowCount()
+    self.room_table.setRowCount(first_row + len(rooms))
+
+    for i, room in enumerate(rooms, first_row):
       r_id = room["room_id"]
       game_name = room["game_name"]
       host = room["host"]
       players = room["current_players"]
+      if room.get("max_players"):
+        players = f"{players}/{room['max_players']}"
       port = room["port"]
 
       self.room_table.setItem(i, 0, QTableWidgetItem(str(r_id)))
@@ -220,6 +281,11 @@ class LobbyWindow(QMainWindow):
 
       btn_join = QPushButton("Join")
       btn_join.setStyleSheet("background-color: #9C27B0; color: white;")
+      # 還在啟動或啟動失敗的房間不能加入
+      state = room.get("state", "ready")
+      if state != "ready":
+        btn_join.setText(state.capitalize())
+        btn_join.setEnabled(False)
       # 綁定 Join 事件，傳入 room_id, port 和 game_name
       btn_join.clicked.connect(
         lambda checked, rid=r_id, p=port, g=game_name: self.join_room(rid, p, g)
@@ -238,11 +304,22 @@ class LobbyWindow(QMainWindow):
     return None
 
   def download_game(self, game_name):
+    if game_name in self.downloads:
+      return  # 已在下載中
     self.lbl_status.setText(f"Downloading {game_name}...")
-    QApplication.processEvents()
 
     game_dir = os.path.join(self.download_base_path, game_name)
-    success, result = self.network.download_game(game_name, game_dir)
+    # 已安裝過 (有 manifest.json) 時只下載有差異的檔案
+    have = installed_hashes(game_dir)
+    worker = DownloadWorker(self.network, game_name, game_dir, have)
+    worker.finished_download.connect(self.on_download_finished)
+    self.downloads[game_name] = worker
+    worker.start()
+
+  def on_download_finished(self, game_name, success, result):
+    # 由 signal 在 UI thread 呼叫
+    self.downloads.pop(game_name).wait()
+    game_dir = os.path.join(self.download_base_path, game_name)
 
     if success:
       zip_path = result["zip_path"]
@@ -250,6 +327,13 @@ class LobbyWindow(QMainWindow):
       try:
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
           zip_ref.extractall(game_dir)
+        # 刪除新版已不存在的檔案
+        for path in result.get("removed", []):
+          old_file = os.path.join(game_dir, *path.split("/"))
+          if is_safe_path(path) and os.path.isfile(old_file):
+            os.remove(old_file)
+        if result.get("manifest") is not None:
+          write_manifest(game_dir, result["manifest"])
         with open(os.path.join(game_dir, "version.txt"), "w") as f:
           f.write(version)
         os.remove(zip_path)
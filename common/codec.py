@@ -0,0 +1,249 @@
+# GameStore/common/codec.py
+"""
+封包 Payload 的編碼方式 (codec)。
+
+- json    : 預設，所有連線一開始都使用
+- msgpack : 二進位格式 (https://msgpack.org)，在 LOGIN 時協商
+            有安裝 msgpack 套件時使用它的 C 實作，否則使用這裡的純 Python 版本；
+            兩者的輸出格式相同，可以互通。
+            msgpack 為選用套件 (pyproject.toml 的 fast extra，見 README)：
+            只有安裝了 C 實作的 Client 會提出 msgpack，
+            純 Python 版本讓沒有安裝的 Server 仍能與這些 Client 互通。
+
+支援的型別與 JSON 相同 (None / bool / int / float / str / list / dict)，另外可傳 bytes。
+"""
+
+import json
+import struct
+
+try:
+  import msgpack as _msgpack
+except ImportError:  # 選用套件，沒有時改用純 Python 實作
+  _msgpack = None
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+
+# 有 C 實作時 msgpack 比 json 快；純 Python 版本只適合互通，不會比較快
+MSGPACK_ACCELERATED = _msgpack is not None
+
+_pack_float = struct.Struct(">Bd").pack
+_unpack_float = struct.Struct(">d").unpack_from
+_unpack_float32 = struct.Struct(">f").unpack_from
+
+
+def _pack_int(n, out):
+  if 0 <= n < 0x80:
+    out.append(bytes((n,)))
+  elif -0x20 <= n < 0:
+    out.append(bytes((n & 0xFF,)))
+  elif n >= 0:
+    if n <= 0xFF:
+      out.append(b"\xcc" + bytes((n,)))
+    elif n <= 0xFFFF:
+      out.append(b"\xcd" + n.to_bytes(2, "big"))
+    elif n <= 0xFFFFFFFF:
+      out.append(b"\xce" + n.to_bytes(4, "big"))
+    elif n <= 0xFFFFFFFFFFFFFFFF:
+      out.append(b"\xcf" + n.to_bytes(8, "big"))
+    else:
+      raise OverflowError("Integer too large for msgpack")
+  else:
+    if n >= -0x80:
+      out.append(b"\xd0" + n.to_bytes(1, "big", signed=True))
+    elif n >= -0x8000:
+      out.append(b"\xd1" + n.to_bytes(2, "big", signed=True))
+    elif n >= -0x80000000:
+      out.append(b"\xd2" + n.to_bytes(4, "big", signed=True))
+    elif n >= -0x8000000000000000:
+      out.append(b"\xd3" + n.to_bytes(8, "big", signed=True))
+    else:
+      raise OverflowError("Integer too large for msgpack")
+
+
+def _pack_len(n, fix_base, fix_max, codes, out):
+  """str / bin / array / map 的長度前綴"""
+  if fix_base is not None and n <= fix_max:
+    out.append(bytes((fix_base | n,)))
+  elif n <= 0xFF and codes[0] is not None:
+    out.append(bytes((codes[0], n)))
+  elif n <= 0xFFFF:
+    out.append(bytes((codes[1],)) + n.to_bytes(2, "big"))
+  elif n <= 0xFFFFFFFF:
+    out.append(bytes((codes[2],)) + n.to_bytes(4, "big"))
+  else:
+    raise ValueError("Object too large for msgpack")
+
+
+def _pack(obj, out):
+  t = type(obj)
+  if t is str:
+    data = obj.encode("utf-8")
+    _pack_len(len(data), 0xA0, 31, (0xD9, 0xDA, 0xDB), out)
+    out.append(data)
+  elif t is int:
+    _pack_int(obj, out)
+  elif obj is None:
+    out.append(b"\xc0")
+  elif t is bool:
+    out.append(b"\xc3" if obj else b"\xc2")
+  elif t is dict:
+    _pack_len(len(obj), 0x80, 15, (None, 0xDE, 0xDF), out)
+    for key, value in obj.items():
+      _pack(key, out)
+      _pack(value, out)
+  elif t is list or t is tuple:
+    _pack_len(len(obj), 0x90, 15, (None, 0xDC, 0xDD), out)
+    for item in obj:
+      _pack(item, out)
+  elif t is float:
+    out.append(_pack_float(0xCB, obj))
+  elif t is bytes or t is bytearray or t is memoryview:
+    data = bytes(obj)
+    _pack_len(len(data), None, 0, (0xC4, 0xC5, 0xC6), out)
+    out.append(data)
+  elif isinstance(obj, bool):
+    out.append(b"\xc3" if obj else b"\xc2")
+  elif isinstance(obj, int):
+    _pack_int(int(obj), out)
+  elif isinstance(obj, str):
+    _pack(str(obj), out)
+  elif isinstance(obj, dict):
+    _pack(dict(obj), out)
+  else:
+    raise TypeError(f"Cannot serialize {t.__name__} with msgpack")
+
+
+def packb(obj) -> bytes:
+  """純 Python 的 msgpack 編碼"""
+  out = []
+  _pack(obj, out)
+  return b"".join(out)
+
+
+class _Unpacker:
+  def __init__(self, data):
+    self.data = bytes(data)
+    self.pos = 0
+
+  def _take(self, n):
+    start = self.pos
+    end = start + n
+    if end > len(self.data):
+      raise ValueError("Truncated msgpack data")
+    self.pos = end
+    return self.data[start:end]
+
+  def _uint(self, n):
+    return int.from_bytes(self._take(n), "big")
+
+  def _str(self, n):
+    return self._take(n).decode("utf-8")
+
+  def _array(self, n):
+    return [self.unpack() for _ in range(n)]
+
+  def _map(self, n):
+    result = {}
+    for _ in range(n):
+      key = self.unpack()
+      result[key] = self.unpack()
+    return result
+
+  def unpack(self):
+    if self.pos >= len(self.data):
+      raise ValueError("Truncated msgpack data")
+    code = self.data[self.pos]
+    self.pos += 1
+
+    if code <= 0x7F:
+      return code
+    if code >= 0xE0:
+      return code - 0x100
+    if 0xA0 <= code <= 0xBF:
+      return self._str(code & 0x1F)
+    if 0x80 <= code <= 0x8F:
+      return self._map(code & 0x0F)
+    if 0x90 <= code <= 0x9F:
+      return self._array(code & 0x0F)
+    if code == 0xC0:
+      return None
+    if code == 0xC2:
+      return False
+    if code == 0xC3:
+      return True
+    if code == 0xCB:
+      return _unpack_float(self._take(8))[0]
+    if code == 0xCA:
+      return _unpack_float32(self._take(4))[0]
+    if 0xCC <= code <= 0xCF:
+      return self._uint(1 << (code - 0xCC))
+    if 0xD0 <= code <= 0xD3:
+      return int.from_bytes(self._take(1 << (code - 0xD0)), "big", signed=True)
+    if 0xD9 <= code <= 0xDB:
+      return self._str(self._uint(1 << (code - 0xD9)))
+    if 0xC4 <= code <= 0xC6:
+      return self._take(self._uint(1 << (code - 0xC4)))
+    if code == 0xDC:
+      return self._array(self._uint(2))
+    if code == 0xDD:
+      return self._array(self._uint(4))
+    if code == 0xDE:
+      return self._map(self._uint(2))
+    if code == 0xDF:
+      return self._map(self._uint(4))
+    raise ValueError(f"Unsupported msgpack type 0x{code:02x}")
+
+
+def unpackb(data):
+  """純 Python 的 msgpack 解碼，格式錯誤時丟出 ValueError"""
+  unpacker = _Unpacker(data)
+  obj = unpacker.unpack()
+  if unpacker.pos != len(unpacker.data):
+    raise ValueError("Extra data after msgpack object")
+  return obj
+
+
+def _json_dumps(data) -> bytes:
+  return json.dumps(data).encode("utf-8")
+
+
+def _json_loads(payload):
+  return json.loads(str(payload, "utf-8"))
+
+
+if _msgpack is not None:
+
+  def _msgpack_dumps(data) -> bytes:
+    return _msgpack.packb(data, use_bin_type=True)
+
+  def _msgpack_loads(payload):
+    try:
+      return _msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    except Exception as e:  # ExtraData / FormatError / StackError ...
+      raise ValueError(f"Invalid msgpack data: {e}")
+
+else:
+  _msgpack_dumps = packb
+  _msgpack_loads = unpackb
+
+# {codec 名稱: (encode, decode)}
+CODECS = {
+  CODEC_JSON: (_json_dumps, _json_loads),
+  CODEC_MSGPACK: (_msgpack_dumps, _msgpack_loads),
+}
+
+
+def preferred_codecs():
+  """Client 在 LOGIN 時提出的 codec 偏好順序 (沒有 C 實作時只用 json 比較快)"""
+  if MSGPACK_ACCELERATED:
+    return [CODEC_MSGPACK, CODEC_JSON]
+  return [CODEC_JSON]
+
+
+def choose_codec(offered):
+  """Server 從 Client 提出的清單中選第一個支援的 codec"""
+  for name in offered or ():
+    if name in CODECS:
+      return name
+  return CODEC_JSON
@@ -24,6 +24,9 @@ class Command(Enum):
   # --- System ---
   ERROR = auto()  # 錯誤訊息
 
+  # --- Admin ---
+  ADMIN_STATS = auto()  # 房間與 host 行程負載 (只接受本機連線)
+
 
 class Status(Enum):
   SUCCESS = 0
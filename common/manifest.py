@@ -0,0 +1,154 @@
+# common/manifest.py
+
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+
+# Client 端安裝目錄中記錄「目前安裝版本的檔案清單」的檔名
+MANIFEST_FILE = "manifest.json"
+
+# 計算 hash 時每次讀取的大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_stream(f):
+  h = hashlib.sha256()
+  while True:
+    chunk = f.read(HASH_CHUNK_SIZE)
+    if not chunk:
+      break
+    h.update(chunk)
+  return h.hexdigest()
+
+
+def is_safe_path(path):
+  """遊戲包內的相對路徑不可跳出安裝目錄"""
+  if not path or path.startswith("/") or "\\" in path or ":" in path:
+    return False
+  return ".." not in path.split("/")
+
+
+def manifest_from_zip(zip_path):
+  """
+  由 zip 建立檔案清單 (per-file manifest)。
+  格式: {path: {"size": int, "sha256": str}}，path 一律使用 "/" 分隔。
+  """
+  manifest = {}
+  with zipfile.ZipFile(zip_path, "r") as zf:
+    for info in zf.infolist():
+      if info.is_dir():
+        continue
+      with zf.open(info) as f:
+        manifest[info.filename] = {"size": info.file_size, "sha256": _hash_stream(f)}
+  return manifest
+
+
+def manifest_from_dir(folder, paths=None):
+  """
+  由資料夾建立檔案清單 (與 UploadDialog._zip_folder 相同的走訪方式)。
+  指定 paths 時只計算這些檔案 (不存在的會略過)。
+  """
+  if paths is None:
+    paths = []
+    for root, dirs, files in os.walk(folder):
+      for file in files:
+        rel_path = os.path.relpath(os.path.join(root, file), folder)
+        paths.append(rel_path.replace(os.sep, "/"))
+
+  manifest = {}
+  for path in paths:
+    abs_path = os.path.join(folder, *path.split("/"))
+    if not os.path.isfile(abs_path):
+      continue
+    with open(abs_path, "rb") as f:
+      manifest[path] = {"size": os.path.getsize(abs_path), "sha256": _hash_stream(f)}
+  return manifest
+
+
+def diff_manifest(old, new):
+  """比較兩份清單，回傳 (需要傳送的檔案, 需要刪除的檔案)"""
+  changed = sorted(
+    path
+    for path, entry in new.items()
+    if path not in old or old[path]["sha256"] != entry["sha256"]
+  )
+  removed = sorted(path for path in old if path not in new)
+  return changed, removed
+
+
+def installed_hashes(game_dir):
+  """
+  讀取安裝目錄中的 manifest.json，並重新計算其中每個檔案目前的 hash。
+  (本地被修改或遺失的檔案會因 hash 不同而被重新下載)
+  沒有 manifest 時回傳 None。
+  """
+  manifest_path = os.path.join(game_dir, MANIFEST_FILE)
+  if not os.path.exists(manifest_path):
+    return None
+  try:
+    with open(manifest_path, "r") as f:
+      installed = json.load(f)
+  except (OSError, ValueError):
+    return None
+  current = manifest_from_dir(game_dir, list(installed))
+  return {path: entry["sha256"] for path, entry in current.items()}
+
+
+def write_manifest(game_dir, manifest):
+  with open(os.path.join(game_dir, MANIFEST_FILE), "w") as f:
+    json.dump(manifest, f)
+
+
+def build_zip_from_dir(folder, zip_path, paths):
+  """把資料夾中指定的檔案打包成 zip (開發者送出差異更新用)"""
+  with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+    for path in paths:
+      zf.write(os.path.join(folder, *path.split("/")), path)
+
+
+def build_zip_from_zip(src_zip, zip_path, paths):
+  """從完整遊戲包中挑出指定檔案另存成 zip (玩家差異下載用)"""
+  with (
+    zipfile.ZipFile(src_zip, "r") as src,
+    zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as dst,
+  ):
+    for path in paths:
+      with src.open(path) as fin, dst.open(path, "w") as fout:
+        shutil.copyfileobj(fin, fout, HASH_CHUNK_SIZE)
+
+
+def merge_delta(base_zip, delta_zip, manifest, out_path):
+  """
+  以舊版完整遊戲包 + 差異 zip 組出新版完整遊戲包。
+  新版的每個檔案優先取自差異 zip，否則取自舊版；
+  組出來的內容會逐一比對 manifest 的 hash，不符時丟出 ValueError。
+  """
+  with (
+    zipfile.ZipFile(base_zip, "r") as base,
+    zipfile.ZipFile(delta_zip, "r") as delta,
+    zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as out,
+  ):
+    delta_names = set(delta.namelist())
+    base_names = set(base.namelist())
+    for path, entry in sorted(manifest.items()):
+      if not is_safe_path(path):
+        raise ValueError(f"Unsafe path in manifest: {path}")
+      if path in delta_names:
+        src = delta
+      elif path in base_names:
+        src = base
+      else:
+        raise ValueError(f"Delta is missing file: {path}")
+
+      h = hashlib.sha256()
+      with src.open(path) as fin, out.open(path, "w") as fout:
+        while True:
+          chunk = fin.read(HASH_CHUNK_SIZE)
+          if not chunk:
+            break
+          h.update(chunk)
+          fout.write(chunk)
+      if h.hexdigest() != entry["sha256"]:
+        raise ValueError(f"Hash mismatch for {path}")
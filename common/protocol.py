@@ -1,37 +1,197 @@
 # GameStore/common/protocol.py
 
+import contextlib
 import socket
 import struct
-import json
 import os
+import threading
+import weakref
+import zlib
+from .codec import CODEC_JSON, CODEC_MSGPACK, CODECS
 from .constants import Command
 
 # Header format:
 #   Payload Length (4 bytes, unsigned int, big-endian)
 #   Command Code   (4 bytes, unsigned int, big-endian)
+#     高位元為 flag：FLAG_BINARY 代表 Payload 以 msgpack 編碼 (否則為 JSON)
+#                   FLAG_COMPRESSED 代表編碼後的 Payload 再以 zlib 壓縮
+#                   FLAG_REQUEST_ID 代表 Payload 前面多了 4 bytes 的 Request ID
+#                   (計入 Payload Length)，回應會帶上同一個 ID
 HEADER_STRUCT = struct.Struct("!II")
+REQUEST_ID_STRUCT = struct.Struct("!I")
 
+FLAG_BINARY = 0x80000000
+FLAG_COMPRESSED = 0x40000000
+FLAG_REQUEST_ID = 0x20000000
+CMD_MASK = 0x0FFFFFFF  # 最高 4 個 bit 保留給 flag
 
-def send_request(sock: socket.socket, cmd: Command, data: dict = None):
+# 可協商的壓縮方式 (LOGIN 時由 Client 提出，Server 選定)
+COMPRESSION_ZLIB = "zlib"
+COMPRESSIONS = (COMPRESSION_ZLIB,)
+
+# Payload 小於這個大小時壓縮省不了多少，直接送
+COMPRESS_THRESHOLD = 1024
+# 商城列表 (1000 款遊戲，約 240 KB JSON) 約壓到 1/15，編碼約 3 ms
+COMPRESS_LEVEL = 6
+
+# 每個連線 (socket) 送出時使用的 codec，由 set_codec 設定 (沒設定的為 JSON)
+# 接收端從 flag 判斷 codec，不需要知道對方的設定
+_socket_codecs = weakref.WeakKeyDictionary()
+# 協商啟用壓縮的 socket；收到壓縮的封包則一律解壓，與這裡的設定無關
+_compressed_sockets = weakref.WeakSet()
+
+# 這個 thread 正在回覆的 pipelined 請求：(sock, request_id, send_lock)，由 replying_to 設定
+_reply_context = threading.local()
+
+# 無法使用 sendfile 時，每次從檔案讀取並送出的大小
+SEND_CHUNK_SIZE = 256 * 1024
+
+# recv_file 每次 recv 的大小範圍 (依實際到達速度自動調整)
+RECV_CHUNK_MIN = 64 * 1024
+RECV_CHUNK_MAX = 4 * 1024 * 1024
+
+# 控制封包 (JSON / msgpack) 的 Payload 上限；遊戲包走 recv_file，不受此限制。
+# 超過上限的 Header 直接拒絕，未驗證的連線也無法讓我們配置大量記憶體
+MAX_PAYLOAD_SIZE = 32 * 1024 * 1024
+
+
+def set_codec(sock, codec: str):
+  """設定之後從這個 socket 送出的封包使用的 codec (LOGIN 協商後呼叫)"""
+  if codec not in CODECS:
+    raise ValueError(f"Unknown codec: {codec}")
+  _socket_codecs[sock] = codec
+
+
+def get_codec(sock) -> str:
+  return _socket_codecs.get(sock, CODEC_JSON)
+
+
+def set_compression(sock, compression):
+  """設定之後從這個 socket 送出的大封包是否壓縮 (None 為不壓縮)"""
+  if compression is None:
+    _compressed_sockets.discard(sock)
+  elif compression in COMPRESSIONS:
+    _compressed_sockets.add(sock)
+  else:
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def get_compression(sock):
+  return COMPRESSION_ZLIB if sock in _compressed_sockets else None
+
+
+def choose_compression(offered):
+  """Server 從 Client 提出的清單中選第一個支援的壓縮方式，都不支援時為 None"""
+  for name in offered or ():
+    if name in COMPRESSIONS:
+      return name
+  return None
+
+
+@contextlib.contextmanager
+def replying_to(sock, request_id, send_lock=None):
   """
-  將指令與資料封裝成封包並發送。
-  格式: [Length (4B)][Cmd (4B)][JSON Payload]
+  在這個 thread 內從 sock 送出的封包都帶上 request_id (回覆 pipelined 請求用)，
+  handler 照常呼叫 send_request 即可。
+  同一條連線有多個請求同時處理時傳入共用的 send_lock，讓每個封包完整寫出不交錯。
+  """
+  previous = getattr(_reply_context, "value", None)
+  _reply_context.value = (sock, request_id, send_lock)
+  try:
+    yield
+  finally:
+    _reply_context.value = previous
+
+
+def _current_reply(sock):
+  """回傳 (request_id, send_lock)；這個 thread 沒有在回覆 sock 的請求時為 (None, None)"""
+  context = getattr(_reply_context, "value", None)
+  if context is None or context[0] is not sock:
+    return None, None
+  return context[1], context[2]
+
+
+def encode_frame(
+  cmd: Command,
+  data: dict = None,
+  codec: str = CODEC_JSON,
+  compress: bool = False,
+  request_id: int = None,
+) -> bytes:
+  """
+  將指令與資料封裝成完整封包 (Header + Body) 的 bytes。
+  格式: [Length (4B)][Cmd | flags (4B)][Request ID (4B，可省略)][Payload]
+  Payload 為 JSON 或 msgpack，可能經過 zlib 壓縮。
+  compress 為 True 時，超過 COMPRESS_THRESHOLD 且壓縮後確實變小的 Payload 才會壓縮。
   """
   if data is None:
     data = {}
 
-  # 1. 序列化 JSON Payload
-  json_bytes = json.dumps(data).encode("utf-8")
+  # 1. 序列化 Payload
+  encode, _ = CODECS[codec]
+  payload = encode(data)
 
   # 2. 計算長度與準備 Header
-  payload_len = len(json_bytes)
   cmd_value = cmd.value
+  if codec == CODEC_MSGPACK:
+    cmd_value |= FLAG_BINARY
+  if compress and len(payload) >= COMPRESS_THRESHOLD:
+    compressed = zlib.compress(payload, COMPRESS_LEVEL)
+    if len(compressed) < len(payload):
+      payload = compressed
+      cmd_value |= FLAG_COMPRESSED
+  payload_len = len(payload)
 
   # 3. 打包 Header
-  header = HEADER_STRUCT.pack(payload_len, cmd_value)
+  if request_id is None:
+    return HEADER_STRUCT.pack(payload_len, cmd_value) + payload
+  header = HEADER_STRUCT.pack(
+    payload_len + REQUEST_ID_STRUCT.size, cmd_value | FLAG_REQUEST_ID
+  )
+  return header + REQUEST_ID_STRUCT.pack(request_id) + payload
+
+
+def with_request_id(frame: bytes, request_id: int) -> bytes:
+  """替已編碼好、沒有 Request ID 的封包 (例如商城列表快取) 加上 Request ID"""
+  payload_len, cmd_value = HEADER_STRUCT.unpack_from(frame)
+  header = HEADER_STRUCT.pack(
+    payload_len + REQUEST_ID_STRUCT.size, cmd_value | FLAG_REQUEST_ID
+  )
+  return header + REQUEST_ID_STRUCT.pack(request_id) + frame[HEADER_STRUCT.size :]
 
-  # 4. 發送 (Header + Body)
-  sock.sendall(header + json_bytes)
+
+def send_request(
+  sock: socket.socket, cmd: Command, data: dict = None, request_id: int = None
+):
+  """
+  將指令與資料封裝成封包並發送 (使用該 socket 協商好的 codec 與壓縮)。
+  格式: [Length (4B)][Cmd | flags (4B)][Request ID (4B，可省略)][Payload]
+  request_id 為 None 時，若正在回覆 pipelined 請求 (replying_to) 則帶上該請求的 ID。
+  """
+  reply_id, send_lock = _current_reply(sock)
+  if request_id is None:
+    request_id = reply_id
+  compress = sock in _compressed_sockets
+  frame = encode_frame(cmd, data, get_codec(sock), compress, request_id)
+
+  # 發送 (Header + Body)
+  if send_lock is None:
+    sock.sendall(frame)
+  else:
+    with send_lock:
+      sock.sendall(frame)
+
+
+def send_frame(sock: socket.socket, frame: bytes):
+  """送出已編碼好的封包，正在回覆 pipelined 請求時補上該請求的 Request ID"""
+  request_id, send_lock = _current_reply(sock)
+  if request_id is not None:
+    frame = with_request_id(frame, request_id)
+  if send_lock is None:
+    sock.sendall(frame)
+  else:
+    with send_lock:
+      sock.sendall(frame)
 
 
 def recv_request(sock: socket.socket):
@@ -39,95 +199,234 @@ def recv_request(sock: socket.socket):
   從 Socket 接收完整封包並解析。
   回傳: (Command, dict_data)
   """
+  cmd, data, _ = recv_frame(sock)
+  return cmd, data
+
+
+def recv_frame(sock: socket.socket):
+  """
+  與 recv_request 相同，另外回傳封包的 Request ID (沒有時為 None)。
+  回傳: (Command, dict_data, request_id)
+  """
   try:
     # 1. 先讀取 Header (固定 8 bytes)
     header_data = _recvall(sock, HEADER_STRUCT.size)
     if not header_data:
-      return None, None  # 連線關閉
+      return None, None, None  # 連線關閉
 
     payload_len, cmd_value = HEADER_STRUCT.unpack(header_data)
 
     # 2. 再根據長度讀取 Body
+    payload_data = b""
     if payload_len > 0:
       payload_data = _recvall(sock, payload_len)
       if not payload_data:
         raise ConnectionError("Incomplete payload received")
 
-      # 解析 JSON
-      data = json.loads(payload_data.decode("utf-8"))
-    else:
-      data = {}
-
-    try:
-      cmd = Command(cmd_value)
-    except ValueError:
-      # 收到未知的 Command，可能需要處理或忽略
-      print(f"[Protocol] Unknown command received: {cmd_value}")
-      cmd = Command.ERROR
-
-    return cmd, data
+    return decode_frame(cmd_value, payload_data)
 
   except ConnectionResetError:
-    return None, None
+    return None, None, None
   except Exception as e:
     print(f"[Protocol] Error: {e}")
-    return None, None
+    return None, None, None
+
+
+def decode_payload(cmd_value: int, payload_data: bytes):
+  """將已讀取完整的封包內容解析為 (Command, dict_data)"""
+  cmd, data, _ = decode_frame(cmd_value, payload_data)
+  return cmd, data
+
+
+def decode_frame(cmd_value: int, payload_data: bytes):
+  """
+  將已讀取完整的封包內容解析為 (Command, dict_data, request_id)。
+  同步 (recv_frame) 與 asyncio (StreamReader) 兩種讀取路徑共用。
+  Payload 的 codec、是否壓縮與是否帶 Request ID 由 Header 的 flag 決定。
+  """
+  request_id = None
+  if cmd_value & FLAG_REQUEST_ID:
+    if len(payload_data) < REQUEST_ID_STRUCT.size:
+      raise ValueError("Missing request id")
+    (request_id,) = REQUEST_ID_STRUCT.unpack_from(payload_data)
+    payload_data = payload_data[REQUEST_ID_STRUCT.size :]
+
+  codec = CODEC_MSGPACK if cmd_value & FLAG_BINARY else CODEC_JSON
+  if cmd_value & FLAG_COMPRESSED:
+    payload_data = _decompress(payload_data)
+  cmd_value &= CMD_MASK
+
+  # 解析 Payload
+  _, decode = CODECS[codec]
+  data = decode(payload_data) if payload_data else {}
+  if not isinstance(data, dict):
+    raise ValueError(f"Payload is not an object: {type(data).__name__}")
+
+  try:
+    cmd = Command(cmd_value)
+  except ValueError:
+    # 收到未知的 Command，可能需要處理或忽略
+    print(f"[Protocol] Unknown command received: {cmd_value}")
+    cmd = Command.ERROR
+
+  return cmd, data, request_id
 
 
-def _recvall(sock: socket.socket, n: int) -> bytes:
+def exchange_pipelined(sock: socket.socket, requests):
+  """
+  Client 端：一次送出多個請求 [(Command, data)] (各帶 Request ID 1..n)，
+  再依 ID 對應亂序到達的回應，依請求順序回傳 [(Command, dict_data)]。
+  連線中斷時尚未收到的回應為 (None, None)。Server 需在 LOGIN 時宣告支援 pipelining。
+  """
+  frames = [
+    encode_frame(cmd, data, get_codec(sock), sock in _compressed_sockets, i)
+    for i, (cmd, data) in enumerate(requests, 1)
+  ]
+  sock.sendall(b"".join(frames))
+
+  responses = [(None, None)] * len(requests)
+  for _ in range(len(requests)):
+    cmd, data, request_id = recv_frame(sock)
+    if cmd is None:
+      break
+    if request_id is not None and 1 <= request_id <= len(requests):
+      responses[request_id - 1] = (cmd, data)
+  return responses
+
+
+def _decompress(payload_data) -> bytes:
+  """解壓 Payload，解壓後同樣受 MAX_PAYLOAD_SIZE 限制 (避免壓縮炸彈)"""
+  decompressor = zlib.decompressobj()
+  try:
+    data = decompressor.decompress(payload_data, MAX_PAYLOAD_SIZE)
+  except zlib.error as e:
+    raise ValueError(f"Invalid compressed payload: {e}")
+  if decompressor.unconsumed_tail:
+    raise ValueError("Decompressed payload too large")
+  if not decompressor.eof:
+    raise ValueError("Truncated compressed payload")
+  return data
+
+
+def _recvall(sock: socket.socket, n: int) -> bytearray:
   """
   輔助函式：確保從 socket 精確讀取 n 個 bytes。
   解決 TCP 分包問題。
+  資料以 recv_into 直接填入 buffer，避免反覆串接造成的複製；
+  buffer 隨實際收到的資料每次最多擴充 RECV_CHUNK_MAX，不會照對方宣告的長度預先配置。
   """
-  data = b""
-  while len(data) < n:
+  if n > MAX_PAYLOAD_SIZE:
+    raise ValueError(f"Payload too large: {n} bytes")
+
+  data = bytearray(min(n, RECV_CHUNK_MAX))
+  received = 0
+  while received < n:
+    if received == len(data):
+      data.extend(bytes(min(RECV_CHUNK_MAX, n - received)))
     try:
-      packet = sock.recv(n - len(data))
-      if not packet:
+      with memoryview(data) as view:
+        nbytes = sock.recv_into(view[received:], len(data) - received)
+      if not nbytes:
         return None
-      data += packet
+      received += nbytes
     except OSError:
       return None
   return data
 
 
-def send_file(sock: socket.socket, file_path: str):
+def send_file(sock: socket.socket, file_path: str, offset: int = 0, count: int = None):
   """
-  發送檔案內容 (Raw Bytes)。
-  注意：發送前應先透過 send_request 告知 Server 檔案大小。
+  發送檔案內容 (Raw Bytes)，可指定範圍 [offset, offset + count)。
+  注意：發送前應先透過 send_request 告知對方檔案大小。
+  回傳實際送出的 bytes 數。
   """
   if not os.path.exists(file_path):
     raise FileNotFoundError(f"File not found: {file_path}")
 
   file_size = os.path.getsize(file_path)
+  if count is None:
+    count = file_size - offset
+  if offset < 0 or count < 0 or offset + count > file_size:
+    raise ValueError(f"Invalid range {offset}+{count} for {file_size} bytes file")
+  if count == 0:
+    return 0
 
-  # 使用 sendfile (Zero-copy optimization if available) 或 chunk read
   with open(file_path, "rb") as f:
-    # 這裡為了跨平台相容性，使用標準 chunk 傳輸
-    while True:
-      chunk = f.read(4096)
-      if not chunk:
-        break
-      sock.sendall(chunk)
+    # 有 os.sendfile 的平台 (Linux / macOS) 走 zero-copy，由 kernel 直接搬資料
+    # Windows 的 socket.sendfile 只是 8 KiB 的 send 迴圈，改用下面較大的 chunk
+    if hasattr(sock, "sendfile") and (
+      hasattr(os, "sendfile") or not isinstance(sock, socket.socket)
+    ):
+      return sock.sendfile(f, offset, count)
+    return _send_file_chunked(sock, f, offset, count)
+
+
+def _send_file_chunked(sock, f, offset: int, count: int) -> int:
+  """sendfile 不可用時的備援：重複使用同一塊 buffer 讀檔並 sendall"""
+  buf = bytearray(min(SEND_CHUNK_SIZE, count))
+  view = memoryview(buf)
+  f.seek(offset)
+  sent = 0
+  while sent < count:
+    n = f.readinto(view[: min(len(buf), count - sent)])
+    if not n:
+      raise EOFError("File truncated while sending")
+    sock.sendall(view[:n])
+    sent += n
+  return sent
 
 
 def recv_file(
-  sock: socket.socket, file_size: int, save_path: str, progress_callback=None
+  sock: socket.socket,
+  file_size: int,
+  save_path: str,
+  progress_callback=None,
+  offset: int = None,
+  hasher=None,
 ):
   """
   接收指定大小的檔案並寫入 save_path。
+  offset 為 None 時覆寫整個檔案；指定 offset 時保留既有內容，從該位置開始寫入 (續傳用)。
+  hasher 為任何有 update(bytes) 的物件 (例如 hashlib.sha256())，收到的資料會邊收邊餵給它，
+  不需要收完再把檔案讀一次；update 丟出例外時會中止接收。
+  讀取大小從 RECV_CHUNK_MIN 開始，每次讀滿就加倍 (上限 RECV_CHUNK_MAX)，
+  資料以 recv_into 讀進同一塊 buffer 後直接寫入檔案 (不經過 Python 端的檔案緩衝)。
   """
+  buf = bytearray(min(RECV_CHUNK_MAX, max(file_size, 1)))
+  view = memoryview(buf)
+  chunk_size = min(RECV_CHUNK_MIN, len(buf))
   received = 0
-  with open(save_path, "wb") as f:
+
+  if offset is None:
+    mode = "wb"
+  else:
+    mode = "r+b" if os.path.exists(save_path) else "w+b"
+
+  with open(save_path, mode, buffering=0) as f:
+    if offset:
+      f.seek(offset)
     while received < file_size:
       # 計算剩餘大小，避免多讀到下一個封包的 Header
-      bytes_to_read = min(4096, file_size - received)
-      chunk = sock.recv(bytes_to_read)
-      if not chunk:
+      bytes_to_read = min(chunk_size, file_size - received)
+      nbytes = sock.recv_into(view[:bytes_to_read], bytes_to_read)
+      if not nbytes:
         raise ConnectionError("Connection lost while receiving file")
 
-      f.write(chunk)
-      received += len(chunk)
+      if hasher is not None:
+        hasher.update(view[:nbytes])
+      _write_all(f, view[:nbytes])
+      received += nbytes
+
+      # socket 一次就填滿 buffer，代表資料來得比讀得快，下次讀多一點
+      if nbytes == chunk_size and chunk_size < len(buf):
+        chunk_size = min(chunk_size * 2, len(buf))
 
       if progress_callback:
         progress_callback(received, file_size)
+
+
+def _write_all(f, view: memoryview):
+  """unbuffered 檔案的 write 可能只寫入部分資料，寫到完為止"""
+  while view:
+    written = f.write(view)
+    view = view[written:]
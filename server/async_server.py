@@ -0,0 +1,184 @@
+# server/async_server.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from common.protocol import HEADER_STRUCT, MAX_PAYLOAD_SIZE, decode_frame
+from server.client_handler import PIPELINE_DEPTH, ClientHandler, is_serial
+
+# executor 預設大小：只有「正在處理中」的指令才會佔用 thread，閒置連線不佔
+DEFAULT_EXECUTOR_WORKERS = 32
+
+# 寫入緩衝低於此值時直接排入 event loop，不等 drain (避免每個回應都多一次 thread 往返)
+WRITE_BUFFER_LIMIT = 256 * 1024
+
+
+class StreamSocket:
+  """
+  把 asyncio 的 StreamReader / StreamWriter 包裝成阻塞式 socket 介面。
+  ClientHandler 在 executor thread 內執行時，
+  仍可沿用 send_request / recv_file / send_file，實際 I/O 交回 event loop 完成。
+  """
+
+  def __init__(self, reader, writer, loop):
+    self.reader = reader
+    self.writer = writer
+    self.loop = loop
+
+  def _run(self, coro):
+    """在 event loop 上執行 coroutine 並阻塞等待結果 (只能由 executor thread 呼叫)"""
+    return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+  async def _write(self, data):
+    self.writer.write(data)
+    await self.writer.drain()
+
+  def sendall(self, data):
+    if self.writer.transport.get_write_buffer_size() < WRITE_BUFFER_LIMIT:
+      # call_soon_threadsafe 依序執行，與後續寫入的順序一致
+      self.loop.call_soon_threadsafe(self.writer.write, bytes(data))
+    else:
+      # 緩衝過多 (例如傳送大檔)，等 drain 以維持 backpressure
+      self._run(self._write(data))
+
+  async def _sendfile(self, file, offset, count):
+    # loop.sendfile 會先等寫入緩衝 (例如前面的 Header) 清空再送檔案
+    return await self.loop.sendfile(self.writer.transport, file, offset, count)
+
+  def sendfile(self, file, offset=0, count=None):
+    return self._run(self._sendfile(file, offset, count))
+
+  def recv(self, n):
+    return self._run(self.reader.read(n))
+
+  def recv_into(self, buffer, nbytes=0):
+    data = self._run(self.reader.read(nbytes or len(buffer)))
+    buffer[: len(data)] = data
+    return len(data)
+
+  def getpeername(self):
+    return self.writer.get_extra_info("peername")
+
+  def close(self):
+    self.loop.call_soon_threadsafe(self.writer.close)
+
+
+class AsyncLobbyServer:
+  """
+  asyncio 版本的 Lobby Server：
+  所有連線共用一個 event loop 讀取 !II Header 與 Payload，
+  指令本身 (DB 查詢、檔案 I/O) 交給 executor 執行，與 thread 模式共用同一套 handle_command。
+  帶 Request ID 的獨立指令不等前一個完成就繼續讀下一個 (每條連線最多 PIPELINE_DEPTH 個)。
+  """
+
+  def __init__(
+    self,
+    db_manager,
+    room_manager,
+    catalogue,
+    blob_store,
+    deployer,
+    max_workers=DEFAULT_EXECUTOR_WORKERS,
+    transfer_server=None,
+  ):
+    self.db_manager = db_manager
+    self.room_manager = room_manager
+    self.catalogue = catalogue
+    self.blob_store = blob_store
+    self.deployer = deployer
+    self.transfer_server = transfer_server
+    self.executor = ThreadPoolExecutor(
+      max_workers=max_workers, thread_name_prefix="lobby-worker"
+    )
+
+  async def serve(self, server_socket, backlog):
+    server = await asyncio.start_server(
+      self._serve_client, sock=server_socket, backlog=backlog
+    )
+    async with server:
+      await server.serve_forever()
+
+  async def _serve_client(self, reader, writer):
+    loop = asyncio.get_running_loop()
+    addr = writer.get_extra_info("peername")
+    handler = ClientHandler(
+      StreamSocket(reader, writer, loop),
+      addr,
+      self.db_manager,
+      self.room_manager,
+      self.catalogue,
+      self.blob_store,
+      self.deployer,
+      self.transfer_server,
+    )
+    print(f"[Server] New connection from {addr}")
+    in_flight = set()  # 這條連線正在 executor 上處理的 pipelined 請求
+
+    try:
+      while handler.running:
+        # 1. 接收封包 (Header 固定 8 bytes，再依長度讀 Body)
+        try:
+          header_data = await reader.readexactly(HEADER_STRUCT.size)
+          payload_len, cmd_value = HEADER_STRUCT.unpack(header_data)
+          if payload_len > MAX_PAYLOAD_SIZE:
+            print(f"[Protocol] Payload too large: {payload_len} bytes")
+            break
+          payload_data = b""
+          if payload_len > 0:
+            payload_data = await reader.readexactly(payload_len)
+        except (asyncio.IncompleteReadError, ConnectionError):
+          break  # 連線斷開
+
+        try:
+          cmd, data, request_id = decode_frame(cmd_value, payload_data)
+        except Exception as e:
+          print(f"[Protocol] Error: {e}")
+          break
+
+        # 2. 處理指令 (阻塞的部分丟到 executor)
+        if request_id is None or is_serial(cmd, data, handler.transfer_server):
+          if in_flight:
+            await asyncio.wait(in_flight)
+          await loop.run_in_executor(
+            self.executor, handler.run_command, cmd, data, request_id
+          )
+          continue
+
+        if len(in_flight) >= PIPELINE_DEPTH:
+          await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        future = loop.run_in_executor(
+          self.executor, handler.run_pipelined, cmd, data, request_id
+        )
+        in_flight.add(future)
+        future.add_done_callback(in_flight.discard)
+
+    except Exception as e:
+      print(f"[Server] Error handling client {addr}: {e}")
+    finally:
+      if in_flight:
+        await asyncio.wait(in_flight)
+      handler.close_connection()
+
+
+def run_async_server(
+  server_socket,
+  db_manager,
+  room_manager,
+  catalogue,
+  blob_store,
+  deployer,
+  backlog,
+  max_workers=DEFAULT_EXECUTOR_WORKERS,
+  transfer_server=None,
+):
+  """阻塞執行 asyncio Lobby Server 直到被中斷"""
+  server = AsyncLobbyServer(
+    db_manager,
+    room_manager,
+    catalogue,
+    blob_store,
+    deployer,
+    max_workers,
+    transfer_server,
+  )
+  asyncio.run(server.serve(server_socket, backlog))
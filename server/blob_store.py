@@ -0,0 +1,205 @@
+# server/blob_store.py
+
+import hashlib
+import os
+import threading
+import uuid
+import zipfile
+
+from common.manifest import manifest_from_zip
+
+STORAGE_DIR = "server/storage"
+
+# 計算 hash 時每次讀取的大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 分段下載時每一段的大小 (每段各有 sha256，Client 收完一段就能驗證)
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(path):
+  """計算檔案的 sha256 (hex)"""
+  h = hashlib.sha256()
+  buf = bytearray(HASH_CHUNK_SIZE)
+  view = memoryview(buf)
+  with open(path, "rb", buffering=0) as f:
+    while True:
+      n = f.readinto(buf)
+      if not n:
+        break
+      h.update(view[:n])
+  return h.hexdigest()
+
+
+class BlobStore:
+  """
+  以內容 hash 命名的遊戲包儲存區 (content-addressed)。
+
+  檔案存放在 storage/blobs/<前兩碼>/<sha256>.zip，相同內容只存一份；
+  每個 blob 的引用數記在 DB (blobs 表)，歸零時才刪除實體檔案。
+  put() 會幫呼叫者取得一個引用，之後由呼叫者負責 release()。
+
+  進行中的傳輸 (下載、差異更新的基底) 以 pin() / unpin() 保護讀取中的 blob：
+  引用數歸零時若仍被 pin，實體檔案延後到最後一個 unpin() 才刪除。
+  """
+
+  def __init__(self, db_manager, root=STORAGE_DIR):
+    self.db_manager = db_manager
+    self.blob_dir = os.path.join(root, "blobs")
+    self.tmp_dir = os.path.join(root, "tmp")
+    # 保護「搬檔 + 增減引用 + 刪檔」這段，避免刪除與新增同一個 blob 互相干擾
+    self.lock = threading.Lock()
+    self._verified = {}  # {digest: (size, mtime_ns)} 已驗證過的 blob
+    self._segments = {}  # {digest: ((size, mtime_ns), segment_size, [sha256])}
+    self._pins = {}  # {digest: 進行中的傳輸數}
+    self._orphaned = set()  # 引用數已歸零、等傳輸結束才刪除的 blob
+
+    os.makedirs(self.blob_dir, exist_ok=True)
+    os.makedirs(self.tmp_dir, exist_ok=True)
+
+  def path(self, digest):
+    return os.path.join(self.blob_dir, digest[:2], f"{digest}.zip")
+
+  def new_temp_path(self):
+    """上傳中的檔案先寫到暫存區，收完再 put()"""
+    return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.upload")
+
+  def put(self, tmp_path, digest=None):
+    """
+    將暫存檔收進 blob store 並取得一個引用，回傳 digest。
+    已存在相同內容時直接丟棄暫存檔 (去重)。
+    """
+    if digest is None:
+      digest = hash_file(tmp_path)
+    size = os.path.getsize(tmp_path)
+    blob_path = self.path(digest)
+
+    with self.lock:
+      self._orphaned.discard(digest)  # 等待刪除的 blob 又被上傳，繼續使用
+      if os.path.exists(blob_path):
+        os.remove(tmp_path)
+      else:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+      self.db_manager.acquire_blob(digest, size)
+    return digest
+
+  def release(self, digest):
+    """釋放一個引用，沒有人使用時刪除實體檔案"""
+    if not digest:
+      return
+    with self.lock:
+      remaining = self.db_manager.release_blob(digest)
+      if remaining == 0:
+        if self._pins.get(digest):
+          self._orphaned.add(digest)
+          print(f"[Storage] Blob {digest} still in transfer, removing later")
+        else:
+          self._remove(digest)
+
+  def pin(self, digest):
+    """傳輸開始前呼叫：unpin() 之前 blob 檔案不會被刪除"""
+    with self.lock:
+      self._pins[digest] = self._pins.get(digest, 0) + 1
+
+  def unpin(self, digest):
+    with self.lock:
+      count = self._pins.get(digest, 0) - 1
+      if count > 0:
+        self._pins[digest] = count
+        return
+      self._pins.pop(digest, None)
+      if digest in self._orphaned:
+        self._orphaned.discard(digest)
+        self._remove(digest)
+
+  def pinned(self, digest):
+    with self.lock:
+      return self._pins.get(digest, 0)
+
+  def _remove(self, digest):
+    """(呼叫者需持有 lock) 刪除實體檔案與快取"""
+    blob_path = self.path(digest)
+    if os.path.exists(blob_path):
+      os.remove(blob_path)
+      print(f"[Storage] Removed blob {digest}")
+    self._verified.pop(digest, None)
+    self._segments.pop(digest, None)
+
+  def verify(self, digest):
+    """確認 blob 內容與 hash 相符；同一檔案 (大小、修改時間不變) 只驗證一次"""
+    blob_path = self.path(digest)
+    try:
+      st = os.stat(blob_path)
+    except FileNotFoundError:
+      return False
+
+    stamp = (st.st_size, st.st_mtime_ns)
+    if self._verified.get(digest) == stamp:
+      return True
+    if hash_file(blob_path) != digest:
+      return False
+    self._verified[digest] = stamp
+    return True
+
+  def segment_hashes(self, digest, segment_size=SEGMENT_SIZE):
+    """
+    blob 每 segment_size bytes 一段的 sha256 列表 (分段下載時讓 Client 逐段驗證)。
+    計算一次後快取，檔案 (大小、修改時間) 改變時重算。
+    """
+    blob_path = self.path(digest)
+    st = os.stat(blob_path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = self._segments.get(digest)
+    if cached is not None and cached[0] == stamp and cached[1] == segment_size:
+      return cached[2]
+
+    hashes = []
+    buf = bytearray(min(HASH_CHUNK_SIZE, segment_size))
+    view = memoryview(buf)
+    with open(blob_path, "rb", buffering=0) as f:
+      while True:
+        h = hashlib.sha256()
+        remaining = segment_size
+        while remaining:
+          n = f.readinto(view[: min(len(buf), remaining)])
+          if not n:
+            break
+          h.update(view[:n])
+          remaining -= n
+        if remaining == segment_size:
+          break  # 已讀到檔尾
+        hashes.append(h.hexdigest())
+        if remaining:
+          break
+
+    self._segments[digest] = (stamp, segment_size, hashes)
+    return hashes
+
+  def manifest(self, digest):
+    """
+    取得遊戲包的逐檔清單 {path: {"size", "sha256"}}。
+    第一次使用時由 zip 內容計算並存進 DB，之後直接讀取；不是合法 zip 時回傳 None。
+    """
+    manifest = self.db_manager.get_blob_manifest(digest)
+    if manifest is not None:
+      return manifest
+    try:
+      manifest = manifest_from_zip(self.path(digest))
+    except (OSError, zipfile.BadZipFile):
+      return None
+    self.db_manager.set_blob_manifest(digest, manifest)
+    return manifest
+
+  def migrate_legacy(self):
+    """把舊版 storage/{name}_{version}.zip 的遊戲包搬進 blob store (啟動時執行一次)"""
+    storage_dir = os.path.dirname(self.blob_dir)
+    for name, version in self.db_manager.list_games_without_blob():
+      safe_filename = f"{name}_{version}.zip".replace(" ", "_")
+      legacy_path = os.path.join(storage_dir, safe_filename)
+      if not os.path.exists(legacy_path):
+        print(f"[Storage] Legacy package missing for {name} {version}")
+        continue
+      digest = self.put(legacy_path)
+      self.db_manager.set_game_blob(name, digest)
+      print(f"[Storage] Migrated {safe_filename} -> {digest}")
@@ -0,0 +1,146 @@
+# server/catalogue.py
+
+import secrets
+import threading
+from collections import deque
+
+from common.codec import CODEC_JSON
+from common.constants import Command
+from common.protocol import encode_frame
+
+# 保留最近幾筆變動紀錄，Client 落後更多時直接回傳完整列表
+CHANGELOG_SIZE = 1024
+
+
+class CatalogueCache:
+  """
+  商城列表 (LIST_ALL_GAMES) 的記憶體快取。
+
+  商城內容只會在 UPLOAD / UPDATE / DELETE / RATE 後改變，
+  這些 handler 成功後呼叫 invalidate() 讓版本號 +1 並丟棄快取；
+  其餘時間 LIST_ALL_GAMES 直接送出預先編碼好的封包 bytes，不需查 DB 或 json.dumps
+  (每種 codec 與是否壓縮的組合各快取一份)。
+
+  版本以 ETag ("<epoch>:<version>") 對外公開。epoch 每次 Server 啟動都不同，
+  因此重啟後舊的 ETag 一律失效，Client 會重新拿完整列表。
+  """
+
+  def __init__(self, db_manager):
+    self.db_manager = db_manager
+    self.lock = threading.Lock()  # 保護 version、changelog 與快取內容
+    self._build_lock = threading.Lock()  # 同一時間只讓一個 thread 重建快取
+    self.epoch = secrets.token_hex(4)
+    self.version = 0
+    self._changelog = deque(maxlen=CHANGELOG_SIZE)  # [(version, game_name)]
+    self._games = None
+    self._responses = {}  # {(codec, compress): 完整列表的封包 bytes}
+
+  def _make_etag(self, version):
+    return f"{self.epoch}:{version}"
+
+  def _parse_etag(self, etag):
+    """解析 Client 送來的 ETag，不屬於這次啟動 (或格式錯誤) 回傳 None"""
+    if not isinstance(etag, str):
+      return None
+    epoch, _, version = etag.partition(":")
+    if epoch != self.epoch or not version.isdigit():
+      return None
+    return int(version)
+
+  def invalidate(self, game_name):
+    """商城內容已變更：版本號 +1、記錄變動的遊戲並清除快取"""
+    with self.lock:
+      self.version += 1
+      self._changelog.append((self.version, game_name))
+      self._games = None
+      self._responses = {}
+
+  def get_games(self):
+    """回傳 (games, version)，必要時從 DB 重建"""
+    with self.lock:
+      if self._games is not None:
+        return self._games, self.version
+      version = self.version
+
+    games = self.db_manager.list_all_games()
+
+    with self.lock:
+      # 查詢期間若又被 invalidate，這份資料可能已過期，不寫回快取
+      if self.version == version:
+        self._games = games
+    return games, version
+
+  def get_response(self, etag=None, codec=CODEC_JSON, compress=False) -> bytes:
+    """
+    回傳 LIST_ALL_GAMES 回應的完整封包 (Header + Body)，以 codec 編碼 (compress 時壓縮)。
+    etag 為 Client 上次拿到的版本，可能回傳：
+      - {"not_modified": True, "etag"}           : 沒有變動
+      - {"delta": True, "etag", "changed", "removed"} : 只有變動的部分
+      - {"games", "etag"}                          : 完整列表
+    """
+    since = self._parse_etag(etag)
+    if since is not None:
+      response = self._get_delta_response(since, codec, compress)
+      if response is not None:
+        return response
+
+    key = (codec, compress)
+    with self.lock:
+      response = self._responses.get(key)
+      if response is not None:
+        return response
+
+    with self._build_lock:
+      # 等鎖期間可能已有其他 thread 重建完成
+      with self.lock:
+        response = self._responses.get(key)
+        if response is not None:
+          return response
+
+      games, version = self.get_games()
+      response = encode_frame(
+        Command.LIST_ALL_GAMES,
+        {"games": games, "etag": self._make_etag(version)},
+        codec,
+        compress,
+      )
+
+      with self.lock:
+        if self.version == version:
+          self._responses[key] = response
+      return response
+
+  def _get_delta_response(self, since, codec, compress):
+    """組出 since 之後的差異回應；無法用差異表示時回傳 None (改送完整列表)"""
+    with self.lock:
+      version = self.version
+      if since == version:
+        return encode_frame(
+          Command.LIST_ALL_GAMES,
+          {"not_modified": True, "etag": self._make_etag(version)},
+          codec,
+          compress,
+        )
+      # 版本比目前還新 (不該發生) 或紀錄已被截斷
+      oldest = self._changelog[0][0] if self._changelog else version + 1
+      if since > version or since < oldest - 1:
+        return None
+      names = {name for v, name in self._changelog if v > since}
+
+    games, games_version = self.get_games()
+    # 變動太多時差異不會比較小
+    if games_version != version or len(names) * 2 > max(len(games), 1):
+      return None
+
+    by_name = {g["name"]: g for g in games}
+    return encode_frame(
+      Command.LIST_ALL_GAMES,
+      {
+        "delta": True,
+        "etag": self._make_etag(version),
+        "changed": [by_name[n] for n in sorted(names) if n in by_name],
+        "removed": [n for n in sorted(names) if n not in by_name],
+      },
+      codec,
+      compress,
+    )
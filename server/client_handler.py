@@ -3,48 +3,155 @@
 import threading
 import socket
 import os
-import zipfile
-import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from common.codec import choose_codec
 from common.constants import Command, Status
-from common.protocol import recv_request, send_request, recv_file, send_file
-
-STORAGE_DIR = "server/storage"
+from common.manifest import (
+  build_zip_from_zip,
+  is_safe_path,
+  manifest_from_zip,
+  merge_delta,
+)
+from common.protocol import (
+  recv_frame,
+  replying_to,
+  send_frame,
+  send_request,
+  recv_file,
+  send_file,
+  get_codec,
+  set_codec,
+  choose_compression,
+  get_compression,
+  set_compression,
+)
+from server.blob_store import SEGMENT_SIZE
+from server.ingest import (
+  DEPLOY_FAILED,
+  MAX_PACKAGE_SIZE,
+  PackageIngest,
+  validate_package,
+)
+from server.room_manager import ROOM_PAGE_SIZE
+
+# ADMIN_STATS 只接受從這些位址 (本機) 連入的查詢
+ADMIN_HOSTS = ("127.0.0.1", "::1")
+
+# 每條連線同時處理的 pipelined 請求上限，超過時暫停讀取該連線
+PIPELINE_DEPTH = 8
+
+# 這些指令即使帶 Request ID 也依序處理：會改變登入狀態，或直接在 socket 上串流檔案
+# (處理前先等同一連線進行中的請求完成，處理完才讀下一個封包)
+SERIAL_COMMANDS = frozenset(
+  {
+    Command.LOGIN,
+    Command.LOGOUT,
+    Command.UPLOAD_GAME,
+    Command.UPDATE_GAME,
+    Command.DOWNLOAD_GAME,
+  }
+)
+
+# 可改走資料通道 (請求帶 data_channel) 的檔案傳輸指令，此時控制連線上不會有串流
+TRANSFER_COMMANDS = (Command.UPLOAD_GAME, Command.UPDATE_GAME, Command.DOWNLOAD_GAME)
+
+
+def is_serial(cmd: Command, data: dict, transfer_server=None):
+  """
+  這個請求是否必須等同一連線的其他請求處理完才開始。
+  沒有資料通道 (transfer_server 為 None) 時，帶 data_channel 的請求仍會在控制連線上串流檔案，
+  必須依序處理，否則其他 pipelined 回應會插進檔案內容中。
+  """
+  if cmd in TRANSFER_COMMANDS and data.get("data_channel") and transfer_server:
+    return False
+  return cmd in SERIAL_COMMANDS
 
 
 class ClientHandler(threading.Thread):
   def __init__(
-    self, client_sock: socket.socket, client_addr: tuple, db_manager, room_manager=None
+    self,
+    client_sock: socket.socket,
+    client_addr: tuple,
+    db_manager,
+    room_manager=None,
+    catalogue=None,
+    blob_store=None,
+    deployer=None,
+    transfer_server=None,
   ):
     super().__init__()
     self.client_sock = client_sock
     self.client_addr = client_addr
     self.db_manager = db_manager
     self.room_manager = room_manager
+    self.catalogue = catalogue  # 所有連線共用的 CatalogueCache
+    self.blob_store = blob_store  # 遊戲包儲存區 (BlobStore)
+    self.deployer = deployer  # 背景解壓縮到 installed_games (Deployer)
+    # 資料通道 (TransferServer)，None 時只用控制連線
+    self.transfer_server = transfer_server
     self.running = True
     self.user = None  # 用來儲存登入後的使用者資訊 (User ID/Name)
     self.role = None
+    self.send_lock = threading.Lock()  # 同時處理多個請求時，回應逐一完整寫出
 
   def run(self):
     """執行緒的主要進入點"""
     print(f"[Server] New connection from {self.client_addr}")
+    pipeline = None  # 第一次收到 pipelined 請求時才建立
+    pending = set()
 
     try:
       while self.running:
         # 1. 接收封包
-        cmd, data = recv_request(self.client_sock)
+        cmd, data, request_id = recv_frame(self.client_sock)
 
         # 若 cmd 為 None，代表連線斷開
         if cmd is None:
           break
 
         # 2. 處理指令 (Dispatch)
-        self.handle_command(cmd, data)
+        if request_id is None or is_serial(cmd, data, self.transfer_server):
+          wait(pending)
+          pending.clear()
+          self.run_command(cmd, data, request_id)
+          continue
+
+        # 帶 Request ID 的獨立指令交給這條連線的 thread pool 同時處理
+        if pipeline is None:
+          pipeline = ThreadPoolExecutor(
+            PIPELINE_DEPTH, thread_name_prefix=f"pipeline-{self.client_addr[1]}"
+          )
+        if len(pending) >= PIPELINE_DEPTH:
+          _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        pending.add(pipeline.submit(self.run_pipelined, cmd, data, request_id))
 
     except Exception as e:
       print(f"[Server] Error handling client {self.client_addr}: {e}")
     finally:
+      if pipeline is not None:
+        pipeline.shutdown(wait=True)
       self.close_connection()
 
+  def run_command(self, cmd: Command, data: dict, request_id=None):
+    """處理一個請求，回應帶上它的 Request ID (沒有則為一般回應)"""
+    with replying_to(self.client_sock, request_id, self.send_lock):
+      self.handle_command(cmd, data)
+
+  def run_pipelined(self, cmd: Command, data: dict, request_id):
+    """
+    與其他請求同時處理的 pipelined 請求。
+    發生錯誤時回覆 ERROR 而不是斷線，Client 不會一直等不到這個 ID 的回應。
+    """
+    with replying_to(self.client_sock, request_id, self.send_lock):
+      try:
+        self.handle_command(cmd, data)
+      except Exception as e:
+        print(f"[Server] Error handling {cmd} from {self.client_addr}: {e}")
+        try:
+          send_request(self.client_sock, Command.ERROR, {"msg": str(e)})
+        except OSError:
+          pass
+
   def handle_command(self, cmd: Command, data: dict):
     """根據 OpCode 分發請求"""
     print(f"[Server] Received Command: {cmd} from {self.client_addr}")
@@ -54,7 +161,7 @@ class ClientHandler(threading.Thread):
     elif cmd == Command.LOGOUT:
       self._handle_logout()
     elif cmd == Command.LIST_ALL_GAMES:
-      self._handle_list_all_games()
+      self._handle_list_all_games(data)
     elif cmd == Command.UPLOAD_GAME:
       self._handle_upload_game(data)
     elif cmd == Command.LIST_MY_GAMES:
@@ -63,6 +170,8 @@ class ClientHandler(threading.Thread):
       self._handle_update_game(data)
     elif cmd == Command.DOWNLOAD_GAME:
       self._handle_download_game(data)
+    elif cmd == Command.GET_GAME_INFO:
+      self._handle_get_game_info(data)
     elif cmd == Command.CREATE_ROOM:
       self._handle_create_room(data)
     elif cmd == Command.RATE_GAME:
@@ -71,6 +180,8 @@ class ClientHandler(threading.Thread):
       self._handle_list_rooms(data)
     elif cmd == Command.DELETE_GAME:
       self._handle_delete_game(data)
+    elif cmd == Command.ADMIN_STATS:
+      self._handle_admin_stats()
     else:
       # 未知的指令
       print(f"[Server] Unhandled command: {cmd}")
@@ -86,11 +197,7 @@ class ClientHandler(threading.Thread):
       self.user = username
       self.role = role
       print(f"[Server] {role} {username} logged in.")
-      send_request(
-        self.client_sock,
-        Command.LOGIN,
-        {"status": Status.SUCCESS.value, "msg": "Login successful"},
-      )
+      self._send_login_success("Login successful", data)
     else:
       # 嘗試註冊 (Auto-Register for Homework convenience)
       success, msg = self.db_manager.register_user(role, username, password)
@@ -98,14 +205,7 @@ class ClientHandler(threading.Thread):
         self.user = username
         self.role = role
         print(f"[Server] New {role} {username} registered and logged in.")
-        send_request(
-          self.client_sock,
-          Command.LOGIN,
-          {
-            "status": Status.SUCCESS.value,
-            "msg": "Account created and logged in",
-          },
-        )
+        self._send_login_success("Account created and logged in", data)
       else:
         print(f"[Server] Login failed for {username}: {msg}")
         send_request(
@@ -117,6 +217,29 @@ class ClientHandler(threading.Thread):
           },
         )
 
+  def _send_login_success(self, msg, data: dict):
+    """
+    回覆登入成功並協商 codec 與壓縮：從 Client 提出的 codecs / compression 中各選一個，
+    這個回覆仍以 JSON 不壓縮送出，之後 Server 送出的封包改用選定的設定。
+    pipelining 告訴 Client 可以送出帶 Request ID 的請求；data_port 為資料通道的 Port。
+    """
+    codec = choose_codec(data.get("codecs"))
+    compression = choose_compression(data.get("compression"))
+    send_request(
+      self.client_sock,
+      Command.LOGIN,
+      {
+        "status": Status.SUCCESS.value,
+        "msg": msg,
+        "codec": codec,
+        "compression": compression,
+        "pipelining": True,
+        "data_port": self.transfer_server.port if self.transfer_server else None,
+      },
+    )
+    set_codec(self.client_sock, codec)
+    set_compression(self.client_sock, compression)
+
   def _handle_logout(self):
     print(f"[Server] User {self.user} logged out.")
     self.user = None
@@ -126,11 +249,11 @@ class ClientHandler(threading.Thread):
     """
     D1: 處理遊戲上架
     Flow:
-    1. 接收 Metadata (JSON)
-    2. 檢查 DB 是否允許上架
-    3. 回覆 READY
-    4. 接收 File Stream
-    5. 更新 DB
+    1. 接收 Metadata (JSON)，檢查大小上限
+    2. 回覆 READY (請求帶 data_channel 時附上 token，之後的步驟改在資料通道上進行)
+    3. 接收 File Stream (邊收邊算 hash、檢查 zip signature)
+    4. 檢查 zip 結構後收進 blob store
+    5. 更新 DB 並回覆，解壓縮交給背景的 Deployer
     """
     print("[Server Debug] Entering _handle_upload_game")
     game_name = data.get("name")
@@ -142,77 +265,131 @@ class ClientHandler(threading.Thread):
       print("[Server Debug] Missing fields")
       send_request(self.client_sock, Command.ERROR, {"msg": "Missing fields"})
       return
+    if not self._check_package_size(file_size):
+      return
 
-    print("[Server Debug] Checking storage dir...")
-    # 2. 準備儲存路徑
-    if not os.path.exists(STORAGE_DIR):
-      try:
-        os.makedirs(STORAGE_DIR)
-        print(f"[Server Debug] Created dir: {STORAGE_DIR}")
-      except Exception as e:
-        print(f"[Server Error] Failed to create dir: {e}")
-        return
-
-    # 檔名格式: name_version.zip (防止檔名衝突)
-    safe_filename = f"{game_name}_{version}.zip".replace(" ", "_")
-    save_path = os.path.join(STORAGE_DIR, safe_filename)
-
-    # 3. 告訴 Client 可以開始傳了
+    # 2. 告訴 Client 可以開始傳了
+    user = self.user
+    if self._offer_data_channel(
+      Command.UPLOAD_GAME,
+      data,
+      {"status": Status.SUCCESS.value, "msg": "Ready to receive"},
+      lambda sock: self._receive_upload(sock, data, user),
+    ):
+      return
     send_request(
       self.client_sock,
       Command.UPLOAD_GAME,
       {"status": Status.SUCCESS.value, "msg": "Ready to receive"},
     )
+    self._receive_upload(self.client_sock, data, user)
 
-    try:
-      print(f"[Server] Receiving file for {game_name} ({file_size} bytes)...")
+  def _receive_upload(self, sock, data: dict, user):
+    """上架的 3~5 步：從 sock (控制連線或資料通道) 接收遊戲包、寫入 DB 並回覆"""
+    game_name = data.get("name")
+    version = data.get("version")
+    file_size = data.get("file_size")
 
-      # 4. 接收檔案串流
-      recv_file(self.client_sock, file_size, save_path)
-      print(f"[Server] File received: {save_path}")
+    # 3~4. 接收並收進 blob store
+    print(f"[Server] Receiving file for {game_name} ({file_size} bytes)...")
+    digest = self._ingest_package(sock, file_size)
+    if digest is None:
+      return
+    print(f"[Server] File received: {self.blob_store.path(digest)}")
+
+    # 5. 更新資料庫
+    # 這裡假設 exe_path 是開發者填寫的「解壓縮後的啟動檔路徑」，需存入 DB
+    exe_path = data.get("exe_path", "")
+    success, msg = self.db_manager.add_game(
+      game_name,
+      version,
+      user,
+      data.get("description"),
+      data.get("type"),
+      exe_path,
+      digest,
+    )
 
-      # 我們使用 RoomManager 管理的路徑
-      install_dir = self.room_manager.get_game_dir(game_name)
-      if not os.path.exists(install_dir):
-        os.makedirs(install_dir)
+    if success:
+      self._catalogue_changed(game_name)
+      deploy_status = self.deployer.submit(game_name, version, digest)
+      send_request(
+        sock,
+        Command.UPLOAD_GAME,
+        {
+          "status": Status.SUCCESS.value,
+          "msg": "Upload complete",
+          "deploy_status": deploy_status,
+        },
+      )
+    else:
+      # DB 寫入失敗，釋放剛收進來的 blob
+      self.blob_store.release(digest)
+      send_request(sock, Command.ERROR, {"msg": f"DB Error: {msg}"})
 
-      try:
-        print(f"[Server] Installing (Unzipping) {game_name}...")
-        with zipfile.ZipFile(save_path, "r") as zip_ref:
-          zip_ref.extractall(install_dir)
-      except Exception as e:
-        print(f"[Server] Unzip failed: {e}")
-        send_request(
-          self.client_sock, Command.ERROR, {"msg": f"Server unzip failed: {e}"}
-        )
-        return
+  def _offer_data_channel(self, cmd, data, response, transfer, cleanup=None):
+    """
+    Client 要求 (data_channel) 且 Server 有資料通道時，登記 transfer 並回覆帶 token 的
+    response，回傳 True；否則回傳 False，由呼叫者照舊在控制連線上傳輸。
+    """
+    if not data.get("data_channel") or self.transfer_server is None:
+      return False
+    response = dict(
+      response,
+      token=self.transfer_server.issue(cmd, transfer, cleanup),
+      data_port=self.transfer_server.port,
+    )
+    send_request(self.client_sock, cmd, response)
+    return True
 
-      # 5. 更新資料庫
-      # 這裡假設 exe_path 是開發者填寫的「解壓縮後的啟動檔路徑」，需存入 DB
-      exe_path = data.get("exe_path", "")
-      success, msg = self.db_manager.add_game(
-        game_name,
-        version,
-        self.user,
-        data.get("description"),
-        data.get("type"),
-        exe_path,
-      )
+  def _check_package_size(self, file_size):
+    """傳送前先檢查宣告的大小，超過上限直接拒絕 (不必浪費頻寬收完)"""
+    if isinstance(file_size, int) and 0 < file_size <= MAX_PACKAGE_SIZE:
+      return True
+    send_request(
+      self.client_sock,
+      Command.ERROR,
+      {"msg": f"Invalid package size (limit {MAX_PACKAGE_SIZE} bytes)"},
+    )
+    return False
 
-      if success:
-        send_request(
-          self.client_sock,
-          Command.UPLOAD_GAME,
-          {"status": Status.SUCCESS.value, "msg": "Upload complete"},
-        )
-      else:
-        # DB 寫入失敗，刪除檔案
+  def _ingest_package(self, sock, file_size, base_digest=None, manifest=None):
+    """
+    從 sock 接收遊戲包並收進 blob store，回傳 digest；失敗時已回覆錯誤並回傳 None。
+    一般上傳的 hash 在接收時就算好；差異更新則先以舊版組出完整遊戲包。
+    """
+    save_path = self.blob_store.new_temp_path()
+    ingest = PackageIngest()
+    try:
+      try:
+        recv_file(sock, file_size, save_path, hasher=ingest)
+      except ValueError as e:
+        # 資料還沒收完就中止，串流已經對不齊，只能斷線 (資料通道則由 TransferServer 關閉)
+        print(f"[Server] Rejected package: {e}")
         os.remove(save_path)
-        send_request(self.client_sock, Command.ERROR, {"msg": f"DB Error: {msg}"})
-
+        send_request(sock, Command.ERROR, {"msg": str(e)})
+        if sock is self.client_sock:
+          self.running = False
+        return None
+
+      validate_package(save_path)
+      if base_digest:
+        save_path = self._apply_delta(save_path, base_digest, manifest)
+        # 組出的完整遊戲包同樣要檢查，逐檔清單也依實際內容重新計算，
+        # 不直接採用 Client 送來的 manifest (size 等欄位未經驗證)
+        validate_package(save_path)
+        merged_manifest = manifest_from_zip(save_path)
+        digest = self.blob_store.put(save_path)
+        self.db_manager.set_blob_manifest(digest, merged_manifest)
+      else:
+        digest = self.blob_store.put(save_path, ingest.hexdigest())
+      return digest
     except Exception as e:
       print(f"[Server] Upload failed: {e}")
-      send_request(self.client_sock, Command.ERROR, {"msg": str(e)})
+      if os.path.exists(save_path):
+        os.remove(save_path)
+      send_request(sock, Command.ERROR, {"msg": str(e)})
+      return None
 
   def _handle_list_my_games(self):
     if not self.user:
@@ -220,146 +397,353 @@ class ClientHandler(threading.Thread):
       return
 
     games = self.db_manager.list_my_games(self.user)
+    for game in games:
+      game["deploy_status"] = self._deploy_status(game["name"])
     send_request(self.client_sock, Command.LIST_MY_GAMES, {"games": games})
 
+  def _deploy_status(self, game_name):
+    """背景部署狀態 (沒有部署紀錄時由 Deployer 依上線版本判斷)"""
+    status = self.deployer.get_status(game_name)
+    return status["state"] if status else DEPLOY_FAILED
+
   def _handle_update_game(self, data: dict):
     """
     D2: 更新遊戲流程
-    邏輯與 Upload 相似，但會檢查權限並覆蓋檔案
+    邏輯與 Upload 相似，但會檢查權限並覆蓋檔案。
+    差異更新：Client 帶 base_version 與新版完整 manifest，只上傳有變動的檔案，
+    Server 以舊版遊戲包補齊其餘檔案後組出新版完整遊戲包。
     """
     game_name = data.get("name")
-    new_version = data.get("version")
     file_size = data.get("file_size")
+    manifest = data.get("manifest")
+    base_digest = None
 
-    # 1. 權限與存在檢查
-    # 檔名更新為新版本
-    safe_filename = f"{game_name}_{new_version}.zip".replace(" ", "_")
-    save_path = os.path.join(STORAGE_DIR, safe_filename)
+    if manifest is not None:
+      current_version, base_digest = self.db_manager.get_game_release(game_name)
+      if current_version != data.get("base_version") or not base_digest:
+        send_request(
+          self.client_sock,
+          Command.UPDATE_GAME,
+          {
+            "status": Status.ERR_VERSION_MISMATCH.value,
+            "version": current_version,
+            "msg": f"Server version is {current_version}, delta base is outdated",
+          },
+        )
+        return
+
+    if not self._check_package_size(file_size):
+      return
 
-    # 2. 回覆 Ready
+    # 差異更新的基底在組出新版前不能被刪除 (例如同時有其他更新或下架)
+    if base_digest:
+      self.blob_store.pin(base_digest)
+
+    def unpin_base():
+      if base_digest:
+        self.blob_store.unpin(base_digest)
+
+    # 1. 回覆 Ready (權限在更新 DB 時檢查)
+    user = self.user
+    if self._offer_data_channel(
+      Command.UPDATE_GAME,
+      data,
+      {"status": Status.SUCCESS.value, "msg": "Ready to receive update"},
+      lambda sock: self._receive_update(sock, data, user, base_digest),
+      unpin_base,
+    ):
+      return
     send_request(
       self.client_sock,
       Command.UPDATE_GAME,
       {"status": Status.SUCCESS.value, "msg": "Ready to receive update"},
     )
-
     try:
-      print(f"[Server] Receiving update for {game_name}...")
-      recv_file(self.client_sock, file_size, save_path)
+      self._receive_update(self.client_sock, data, user, base_digest)
+    finally:
+      unpin_base()
 
-      # ==========================================
-      # [Fix] 自動部署：解壓縮覆蓋 installed_games
-      # ==========================================
-      print(f"[Server] Deploying update for {game_name}...")
+  def _receive_update(self, sock, data: dict, user, base_digest):
+    """更新的 2~3 步：從 sock (控制連線或資料通道) 接收新版遊戲包、更新 DB 並回覆"""
+    game_name = data.get("name")
+    new_version = data.get("version")
+    manifest = data.get("manifest")
 
-      # 取得安裝路徑 (例如 server/installed_games/TicTacToe)
-      install_dir = self.room_manager.get_game_dir(game_name)
+    # 2. 接收並收進 blob store
+    print(f"[Server] Receiving update for {game_name}...")
+    digest = self._ingest_package(sock, data.get("file_size"), base_digest, manifest)
+    if digest is None:
+      return
 
-      # 如果資料夾已存在，先刪除舊版以確保乾淨更新
-      if os.path.exists(install_dir):
-        try:
-          shutil.rmtree(install_dir)
-          print(f"[Server] Removed old version at {install_dir}")
-        except Exception as e:
-          print(f"[Server Warning] Failed to clean install dir: {e}")
+    # 3. 更新 DB
+    # 注意: update_game_version 會檢查 author 是否正確
+    new_exe_path = data.get("exe_path")
+    success, msg, old_digest = self.db_manager.update_game_version(
+      game_name, user, new_version, new_exe_path, digest
+    )
+
+    if success:
+      # 舊版遊戲包少了一個引用 (沒有其他遊戲共用時會被刪除)；
+      # 還在傳送舊版的下載已 pin 住它，檔案等傳輸結束才刪除
+      self.blob_store.release(old_digest)
+      self._catalogue_changed(game_name)
+      deploy_status = self.deployer.submit(game_name, new_version, digest)
+      send_request(
+        sock,
+        Command.UPDATE_GAME,
+        {
+          "status": Status.SUCCESS.value,
+          "msg": "Update success",
+          "deploy_status": deploy_status,
+        },
+      )
+    else:
+      # 權限不足或遊戲不存在，釋放剛上傳的檔案
+      self.blob_store.release(digest)
+      send_request(sock, Command.ERROR, {"msg": msg})
 
-      # 建立新資料夾
-      if not os.path.exists(install_dir):
-        os.makedirs(install_dir)
+  def _apply_delta(self, delta_path, base_digest, manifest):
+    """以舊版遊戲包 + 收到的差異 zip 組出新版完整遊戲包，回傳暫存檔路徑"""
+    full_path = self.blob_store.new_temp_path()
+    try:
+      merge_delta(self.blob_store.path(base_digest), delta_path, manifest, full_path)
+    except Exception:
+      if os.path.exists(full_path):
+        os.remove(full_path)
+      raise
+    finally:
+      os.remove(delta_path)
+    print(f"[Server] Delta applied on {base_digest[:12]} ({len(manifest)} files)")
+    return full_path
 
-      # 解壓縮新版檔案
-      try:
-        with zipfile.ZipFile(save_path, "r") as zip_ref:
-          zip_ref.extractall(install_dir)
-        print(f"[Server] Deployment complete. {game_name} updated to {new_version}.")
-      except Exception as e:
-        print(f"[Server Error] Unzip failed: {e}")
-        send_request(
-          self.client_sock, Command.ERROR, {"msg": f"Server unzip failed: {e}"}
-        )
-        return
-      # ==========================================
+  def _handle_get_game_info(self, data: dict):
+    """P1: 回傳遊戲目前版本與逐檔清單 (差異更新用)"""
+    game_name = data.get("name")
+    version, digest = self.db_manager.get_game_release(game_name)
+    if not version:
+      send_request(self.client_sock, Command.ERROR, {"msg": "Game not found"})
+      return
 
-      # 3. 更新 DB
-      # 注意: update_game_version 會檢查 author 是否正確
-      new_exe_path = data.get("exe_path")
-      success, msg = self.db_manager.update_game_version(
-        game_name, self.user, new_version, new_exe_path
-      )
+    send_request(
+      self.client_sock,
+      Command.GET_GAME_INFO,
+      {
+        "status": Status.SUCCESS.value,
+        "name": game_name,
+        "version": version,
+        "digest": digest,
+        "manifest": self.blob_store.manifest(digest) if digest else None,
+        "deploy_status": self._deploy_status(game_name),
+      },
+    )
 
-      if success:
-        send_request(
-          self.client_sock,
-          Command.UPDATE_GAME,
-          {"status": Status.SUCCESS.value, "msg": "Update success"},
-        )
-      else:
-        # 權限不足或遊戲不存在，刪除剛上傳的檔案
-        if os.path.exists(save_path):
-          os.remove(save_path)
-        send_request(self.client_sock, Command.ERROR, {"msg": msg})
+  def _handle_list_all_games(self, data: dict):
+    """P1: 回傳所有遊戲列表 (Client 帶 etag 時只回傳差異)"""
+    if self.catalogue is None:
+      games = self.db_manager.list_all_games()
+      send_request(self.client_sock, Command.LIST_ALL_GAMES, {"games": games})
+      return
 
-    except Exception as e:
-      print(f"[Server] Update failed: {e}")
-      send_request(self.client_sock, Command.ERROR, {"msg": str(e)})
+    # 快取命中時直接送出預先編碼好的封包
+    response = self.catalogue.get_response(
+      data.get("etag"),
+      get_codec(self.client_sock),
+      get_compression(self.client_sock) is not None,
+    )
+    send_frame(self.client_sock, response)
 
-  def _handle_list_all_games(self):
-    """P1: 回傳所有遊戲列表"""
-    games = self.db_manager.list_all_games()
-    print(f"[Server Debug] DB returned games: {games}")
-    send_request(self.client_sock, Command.LIST_ALL_GAMES, {"games": games})
+  def _catalogue_changed(self, game_name):
+    """商城內容有變動 (上架/更新/下架/評分)，讓 LIST_ALL_GAMES 快取失效"""
+    if self.catalogue is not None:
+      self.catalogue.invalidate(game_name)
 
   def _handle_download_game(self, data: dict):
-    """P2: 處理玩家下載請求"""
+    """
+    P2: 處理玩家下載請求
+    支援續傳：Client 可帶 offset (與選填的 length) 只下載部分內容，
+    並帶上 .part 檔對應的 version，版本已更新時回傳 ERR_VERSION_MISMATCH 讓 Client 重新下載。
+    分段下載：大檔案且 Client 帶 segments 時只回傳每段的 sha256，不送檔案；
+    Client 再以多條資料連線各自請求一段 (offset + length)。
+    """
     game_name = data.get("name")
 
     # 1. 從 DB 查詢遊戲最新版本資訊
-    # 我們需要確保 DB Manager 有 get_game_info 方法 (稍後確認 db_manager.py)
-    # 這裡假設 list_all_games 回傳的資訊裡包含 version，或者我們直接查 DB
-
-    # 為了簡便，我們直接查 DB 取得版本
-    # 注意：這裡假設你 server/db_manager.py 的 list_all_games 已經回傳正確資訊
-    # 我們稍微擴充一下邏輯：先查版本 -> 組出檔名 -> 傳送
+    # 流程：先查版本 -> 組出檔名 -> 傳送
+    version, digest = self.db_manager.get_game_release(game_name)
 
-    conn = self.db_manager._get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT version FROM games WHERE name = ?", (game_name,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
+    if not version:
       send_request(self.client_sock, Command.ERROR, {"msg": "Game not found"})
       return
 
-    version = row[0]
-    # 根據 D1/D2 的儲存規則，檔名是 name_version.zip
-    safe_filename = f"{game_name}_{version}.zip".replace(" ", "_")
-    file_path = os.path.join(STORAGE_DIR, safe_filename)
+    expected_version = data.get("version")
+    if expected_version is not None and expected_version != version:
+      send_request(
+        self.client_sock,
+        Command.DOWNLOAD_GAME,
+        {
+          "status": Status.ERR_VERSION_MISMATCH.value,
+          "version": version,
+          "msg": f"Version changed to {version}, restart download",
+        },
+      )
+      return
+
+    # 傳輸結束前 pin 住遊戲包，期間遊戲被更新或下架只會延後刪除檔案
+    if digest:
+      self.blob_store.pin(digest)
+    handed_off = False
+    try:
+      handed_off = self._serve_download(data, game_name, version, digest)
+    finally:
+      if digest and not handed_off:
+        self.blob_store.unpin(digest)
+
+  def _serve_download(self, data, game_name, version, digest):
+    """
+    下載的 2~4 步 (遊戲包已 pin 住)。交給資料通道傳送時回傳 True，
+    之後由傳輸的 cleanup (傳完或 token 逾時) 負責 unpin。
+    """
+    # 遊戲包以內容 hash 存放，直接由 digest 找到檔案
+    file_path = self.blob_store.path(digest) if digest else None
 
-    if not os.path.exists(file_path):
+    if not file_path or not os.path.exists(file_path):
       send_request(
         self.client_sock, Command.ERROR, {"msg": "Game file missing on server"}
       )
-      return
+      return False
+
+    if not self.blob_store.verify(digest):
+      print(f"[Server Error] Blob {digest} of {game_name} is corrupted")
+      send_request(
+        self.client_sock, Command.ERROR, {"msg": "Game file corrupted on server"}
+      )
+      return False
 
     file_size = os.path.getsize(file_path)
 
-    # 2. 告訴 Client 準備接收 (包含版本號，讓 Client 更新本地紀錄)
-    send_request(
-      self.client_sock,
-      Command.DOWNLOAD_GAME,
-      {"status": Status.SUCCESS.value, "version": version, "file_size": file_size},
+    # 2. 檢查請求的範圍 [offset, offset + length)
+    try:
+      offset = int(data.get("offset", 0))
+      length = data.get("length")
+      length = file_size - offset if length is None else int(length)
+    except (TypeError, ValueError):
+      send_request(self.client_sock, Command.ERROR, {"msg": "Invalid range"})
+      return False
+
+    if offset < 0 or length < 0 or offset + length > file_size:
+      send_request(
+        self.client_sock,
+        Command.ERROR,
+        {"msg": f"Invalid range {offset}+{length} (file size {file_size})"},
+      )
+      return False
+
+    # 差異下載：Client 帶上已安裝檔案的 hash ({path: sha256})，只送出不同的檔案
+    manifest = self.blob_store.manifest(digest)
+    have = data.get("have")
+    response = {}
+    delta_path = None
+    if isinstance(have, dict) and manifest is not None and offset == 0:
+      response["removed"] = sorted(p for p in have if p not in manifest)
+      delta_path = self._build_download_delta(digest, manifest, have)
+      if delta_path:
+        file_path = delta_path
+        file_size = length = os.path.getsize(delta_path)
+        response["delta"] = True
+
+    # 3. 告訴 Client 準備接收 (包含版本號，讓 Client 更新本地紀錄)
+    # file_size 為完整檔案大小，length 為這次實際會送出的 bytes 數
+    response.update(
+      {
+        "status": Status.SUCCESS.value,
+        "version": version,
+        "file_size": file_size,
+        "offset": offset,
+        "length": length,
+        "digest": digest,  # 完整遊戲包的 sha256
+      }
     )
+    # 指定 length 的是分段請求，manifest 已在第一個回應給過
+    if data.get("length") is None:
+      response["manifest"] = manifest  # Client 安裝後存成 manifest.json，下次差異下載用
+
+    if (
+      data.get("segments")
+      and delta_path is None
+      and offset == 0
+      and data.get("length") is None
+      and self.transfer_server is not None
+      and file_size > SEGMENT_SIZE
+    ):
+      response["segment_size"] = SEGMENT_SIZE
+      response["segment_hashes"] = self.blob_store.segment_hashes(digest, SEGMENT_SIZE)
+      send_request(self.client_sock, Command.DOWNLOAD_GAME, response)
+      return False
+
+    def cleanup():
+      if delta_path and os.path.exists(delta_path):
+        os.remove(delta_path)
+
+    def transfer(sock):
+      # 資料通道上先確認 token 有效，再送出檔案
+      send_request(
+        sock,
+        Command.DOWNLOAD_GAME,
+        {"status": Status.SUCCESS.value, "offset": offset, "length": length},
+      )
+      self._send_package(sock, game_name, file_path, offset, length)
+
+    def release_transfer():
+      cleanup()
+      self.blob_store.unpin(digest)
+
+    if self._offer_data_channel(
+      Command.DOWNLOAD_GAME, data, response, transfer, release_transfer
+    ):
+      return True
+    send_request(self.client_sock, Command.DOWNLOAD_GAME, response)
+
+    # 4. 傳送檔案
+    try:
+      self._send_package(self.client_sock, game_name, file_path, offset, length)
+    finally:
+      cleanup()
+    return False
 
-    # 3. 傳送檔案
+  def _send_package(self, sock, game_name, file_path, offset, length):
     try:
-      print(f"[Server] Sending {safe_filename} to player...")
-      send_file(self.client_sock, file_path)
+      print(f"[Server] Sending {game_name} [{offset}:{offset + length}] to player...")
+      send_file(sock, file_path, offset, length)
       # 注意: 下載通常不需要像上傳那樣再做一次 Handshake 確認，
       # 因為 Client 收到 header 知道長度後就會自己讀完。
     except Exception as e:
       print(f"[Server] Download error: {e}")
 
+  def _build_download_delta(self, digest, manifest, have):
+    """
+    從完整遊戲包挑出 hash 與 Client 不同的檔案打包成差異 zip，回傳暫存檔路徑。
+    變動的內容超過一半時直接送完整遊戲包比較划算，回傳 None。
+    """
+    changed = [
+      path
+      for path, entry in manifest.items()
+      if have.get(path) != entry["sha256"] and is_safe_path(path)
+    ]
+    total_size = sum(entry["size"] for entry in manifest.values())
+    changed_size = sum(manifest[path]["size"] for path in changed)
+    if changed_size * 2 > total_size:
+      return None
+
+    delta_path = self.blob_store.new_temp_path()
+    try:
+      build_zip_from_zip(self.blob_store.path(digest), delta_path, changed)
+    except Exception as e:
+      print(f"[Server] Failed to build delta for {digest[:12]}: {e}")
+      if os.path.exists(delta_path):
+        os.remove(delta_path)
+      return None
+    return delta_path
+
   def _handle_create_room(self, data: dict):
     """P3 Update: 建立房間並回傳 Game Server Port"""
     if not self.user:
@@ -371,9 +755,23 @@ class ClientHandler(threading.Thread):
       send_request(self.client_sock, Command.ERROR, {"msg": "Game name required"})
       return
 
+    # 房間人數上限 (選填)，額滿的房間不會出現在 open 列表也不能加入
+    max_players = data.get("max_players")
+    if max_players is not None and (
+      not isinstance(max_players, int) or max_players < 1
+    ):
+      send_request(self.client_sock, Command.ERROR, {"msg": "Invalid max_players"})
+      return
+
     try:
       # 呼叫新的 create_room，取得 room_id 和 port
-      room_id, port = self.room_manager.create_room(self.user, game_name)
+      # wait=False 時不等 Game Server 就緒，Client 之後從 LIST_ROOMS 的 state 查詢
+      room_id, port = self.room_manager.create_room(
+        self.user,
+        game_name,
+        wait=data.get("wait", True),
+        max_players=max_players,
+      )
 
       # 回傳詳細資訊給 Client
       send_request(
@@ -383,6 +781,7 @@ class ClientHandler(threading.Thread):
           "status": Status.SUCCESS.value,
           "room_id": room_id,
           "port": port,  # <--- 新增 Port
+          "state": self.room_manager.get_state(room_id),
           "msg": "Room created",
         },
       )
@@ -396,6 +795,25 @@ class ClientHandler(threading.Thread):
       print(f"[Server] Create room error: {e}")
       send_request(self.client_sock, Command.ERROR, {"msg": str(e)})
 
+  def _handle_admin_stats(self):
+    """管理查詢：房間分布與各 host 行程的負載 (房間數、CPU)"""
+    if not self.client_addr or self.client_addr[0] not in ADMIN_HOSTS:
+      send_request(
+        self.client_sock,
+        Command.ERROR,
+        {
+          "status": Status.ERR_PERMISSION_DENIED.value,
+          "msg": "Admin stats are only available locally",
+        },
+      )
+      return
+
+    send_request(
+      self.client_sock,
+      Command.ADMIN_STATS,
+      {"status": Status.SUCCESS.value, **self.room_manager.get_stats()},
+    )
+
   def close_connection(self):
     """清理資源"""
     print(f"[Server] Closing connection {self.client_addr}")
@@ -424,6 +842,7 @@ class ClientHandler(threading.Thread):
     )
 
     if success:
+      self._catalogue_changed(game_name)
       send_request(
         self.client_sock,
         Command.RATE_GAME,
@@ -433,31 +852,34 @@ class ClientHandler(threading.Thread):
       send_request(self.client_sock, Command.ERROR, {"msg": msg})
 
   def _handle_list_rooms(self, data: dict):
-    """回傳目前所有活躍的房間列表"""
-    # 這裡我們需要去 room_manager 拿資料
-    # room_manager.rooms 結構: {room_id: {'game':..., 'port':..., 'players':...}}
-
-    # 為了避免直接傳送 process 物件導致錯誤，我們只挑選需要的資訊
-    active_rooms = []
-
-    # 注意：需確保 thread safety，建議在 room_manager 加一個 get_all_rooms() 方法
-    # 但為了快速實作，我們先直接讀取 (假設 Python dict read 是 atomic 或影響不大)
-    # 更好的做法是在 room_manager.py 加一個方法
-
-    if self.room_manager:
-      with self.room_manager.lock:  # 鎖住以確保資料一致
-        for r_id, info in self.room_manager.rooms.items():
-          active_rooms.append(
-            {
-              "room_id": r_id,
-              "game_name": info["game"],
-              "host": info["host"],
-              "current_players": len(info["players"]),
-              "port": info["port"],  # 重要：加入房間需要這個 Port
-            }
-          )
+    """
+    回傳房間列表 (一頁)。可選的篩選與分頁參數：
+    game / host / open (只列可加入的房間)、sort (newest / oldest)、
+    cursor (上一頁的 next_cursor)、limit。
+    """
+    sort = data.get("sort", "newest")
+    if sort not in ("newest", "oldest"):
+      send_request(self.client_sock, Command.ERROR, {"msg": f"Invalid sort: {sort}"})
+      return
 
-    send_request(self.client_sock, Command.LIST_ROOMS, {"rooms": active_rooms})
+    try:
+      rooms, next_cursor = self.room_manager.list_rooms(
+        game=data.get("game"),
+        host=data.get("host"),
+        open_only=bool(data.get("open", False)),
+        newest_first=sort == "newest",
+        cursor=data.get("cursor"),
+        limit=int(data.get("limit", ROOM_PAGE_SIZE)),
+      )
+    except (TypeError, ValueError):
+      send_request(self.client_sock, Command.ERROR, {"msg": "Invalid cursor or limit"})
+      return
+
+    send_request(
+      self.client_sock,
+      Command.LIST_ROOMS,
+      {"rooms": rooms, "next_cursor": next_cursor},
+    )
 
   def _handle_delete_game(self, data: dict):
     """D3: 處理下架請求 (強力刪除版)"""
@@ -472,40 +894,24 @@ class ClientHandler(threading.Thread):
       send_request(self.client_sock, Command.ERROR, {"msg": "Game name required"})
       return
 
-    # 1. 操作 DB 刪除 (取得 version 只是參考用)
-    success, msg, _ = self.db_manager.delete_game(game_name, self.user)
+    # 1. 操作 DB 刪除 (取得遊戲包的 digest 以釋放引用)
+    success, msg, digest = self.db_manager.delete_game(game_name, self.user)
 
     if not success:
       send_request(self.client_sock, Command.ERROR, {"msg": msg})
       return
 
+    self._catalogue_changed(game_name)
+
     print(f"[Server] Deleting all files related to '{game_name}'...")
 
     # 2. 刪除安裝目錄 (server/installed_games/GameName)
-    if self.room_manager:
-      install_dir = self.room_manager.get_game_dir(game_name)
-      if os.path.exists(install_dir):
-        try:
-          shutil.rmtree(install_dir)
-          print(f"[Server] Removed install dir: {install_dir}")
-        except Exception as e:
-          print(f"[Server Error] Failed to remove dir: {e}")
-
-    # 3. [Fix] 暴力搜尋並刪除 Storage 中的 Zip 檔
-    # 不管版本號是什麼，只要是這個遊戲的 zip 都刪除
-    if os.path.exists(STORAGE_DIR):
-      try:
-        # 檔名規則通常是 Name_Version.zip，且空格會被換成底線
-        safe_name = game_name.replace(" ", "_")
-
-        for filename in os.listdir(STORAGE_DIR):
-          # 檢查檔名是否以 "GameName_" 開頭且是 .zip
-          if filename.startswith(f"{safe_name}_") and filename.endswith(".zip"):
-            file_path = os.path.join(STORAGE_DIR, filename)
-            os.remove(file_path)
-            print(f"[Server] Removed storage file: {file_path}")
-      except Exception as e:
-        print(f"[Server Error] Failed to clean storage: {e}")
+    # 與部署工作排在同一佇列，避免還沒解壓完的舊工作又把目錄建回來
+    self.deployer.remove(game_name)
+
+    # 3. 釋放遊戲包引用 (沒有其他遊戲共用相同內容時才會刪除檔案，
+    #    進行中的下載 pin 住的檔案等傳輸結束才刪除)
+    self.blob_store.release(digest)
 
     send_request(
       self.client_sock,
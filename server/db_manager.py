@@ -3,20 +3,79 @@
 import sqlite3
 import threading
 import hashlib
+import json
 import os
+import queue
+from contextlib import contextmanager
 
 DB_PATH = "gamestore.db"
 
+# 讀取連線池大小 (WAL 模式下多個 reader 可與 writer 同時進行)
+READER_POOL_SIZE = 8
+
+# 每條連線快取的 prepared statement 數量 (sqlite3 依 SQL 字串重用)
+STATEMENT_CACHE_SIZE = 256
+
+# 每條連線的 page cache，負值代表 KiB (約 16 MB)
+CACHE_SIZE_KIB = 16000
+
+# 遇到 SQLITE_BUSY 時最多等待的秒數
+BUSY_TIMEOUT = 10.0
+
 
 class DBManager:
-  def __init__(self, db_path=DB_PATH):
+  def __init__(self, db_path=DB_PATH, pool_size=READER_POOL_SIZE):
     self.db_path = db_path
+    # 寫入鎖：同一時間只有一個 writer；讀取不需要這把鎖
     self.lock = threading.Lock()
+    self._writer = self._connect()
+    self._readers = queue.Queue()
+    for _ in range(pool_size):
+      self._readers.put(self._connect())
     self._init_tables()
 
-  def _get_conn(self):
-    """取得資料庫連線 (每個執行緒獨立連線)"""
-    return sqlite3.connect(self.db_path)
+  def _connect(self):
+    """建立一條長駐連線並套用 WAL 與效能相關 PRAGMA"""
+    conn = sqlite3.connect(
+      self.db_path,
+      timeout=BUSY_TIMEOUT,
+      check_same_thread=False,  # 連線由 pool 在 thread 間借還，不會同時被兩個 thread 使用
+      cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL 模式下 NORMAL 仍能保證一致性，只是斷電時可能遺失最後幾筆 commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+  @contextmanager
+  def _reader(self):
+    """從連線池借一條讀取連線，用完歸還"""
+    conn = self._readers.get()
+    try:
+      yield conn.cursor()
+    finally:
+      self._readers.put(conn)
+
+  @contextmanager
+  def _writer_cursor(self):
+    """取得唯一的寫入連線；正常離開時 commit，發生例外則 rollback"""
+    with self.lock:
+      cursor = self._writer.cursor()
+      try:
+        yield cursor
+        self._writer.commit()
+      except BaseException:
+        self._writer.rollback()
+        raise
+
+  def close(self):
+    """關閉所有連線 (Server 結束時呼叫)"""
+    with self.lock:
+      self._writer.close()
+    while not self._readers.empty():
+      self._readers.get_nowait().close()
 
   def _hash_password(self, password):
     """簡單的密碼雜湊"""
@@ -63,16 +122,41 @@ class DBManager:
             );
         """
 
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
+    # 遊戲包 blob (content-addressed) 與引用數
+    create_blobs_table = """
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0
+            );
+        """
+
+    # 索引：評分彙總 (GROUP BY game_name 只需掃 index) 與開發者遊戲列表
+    create_indexes = [
+      "CREATE INDEX IF NOT EXISTS idx_reviews_game_rating ON reviews (game_name, rating);",
+      "CREATE INDEX IF NOT EXISTS idx_games_author ON games (author);",
+    ]
+
+    with self._writer_cursor() as cursor:
       cursor.execute(create_developers_table)
       cursor.execute(create_players_table)
       cursor.execute(create_games_table)
       cursor.execute(create_reviews_table)
-      conn.commit()
-      conn.close()
-      print("[DB] Database initialized.")
+      cursor.execute(create_blobs_table)
+      self._add_missing_columns(cursor, "games", {"blob_digest": "TEXT"})
+      # 遊戲包的逐檔清單 (JSON)，差異更新時使用
+      self._add_missing_columns(cursor, "blobs", {"manifest": "TEXT"})
+      for create_index in create_indexes:
+        cursor.execute(create_index)
+    print("[DB] Database initialized.")
+
+  def _add_missing_columns(self, cursor, table, columns):
+    """舊版資料庫升級：補上新增的欄位"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in columns.items():
+      if column not in existing:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
 
   # --- User Management ---
 
@@ -81,202 +165,238 @@ class DBManager:
     table = "developers" if role == "dev" else "players"
     pwd_hash = self._hash_password(password)
 
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
-      try:
+    try:
+      with self._writer_cursor() as cursor:
         cursor.execute(
           f"INSERT INTO {table} (username, password_hash) VALUES (?, ?)",
           (username, pwd_hash),
         )
-        conn.commit()
-        return True, "Registration successful"
-      except sqlite3.IntegrityError:
-        return False, "Username already exists"
-      except Exception as e:
-        return False, str(e)
-      finally:
-        conn.close()
+      return True, "Registration successful"
+    except sqlite3.IntegrityError:
+      return False, "Username already exists"
+    except Exception as e:
+      return False, str(e)
 
   def validate_login(self, role, username, password):
     """驗證登入 (role: 'dev' or 'player')"""
     table = "developers" if role == "dev" else "players"
     pwd_hash = self._hash_password(password)
 
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
+    with self._reader() as cursor:
       cursor.execute(
         f"SELECT password_hash FROM {table} WHERE username = ?", (username,)
       )
       row = cursor.fetchone()
-      conn.close()
 
-      if row and row[0] == pwd_hash:
-        return True
-      return False
+    if row and row[0] == pwd_hash:
+      return True
+    return False
 
   # --- Game Management ---
 
-  def add_game(self, name, version, author, description, game_type, exe_path):
+  def add_game(
+    self, name, version, author, description, game_type, exe_path, blob_digest=None
+  ):
     """D1: 上架新遊戲"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
-      try:
+    try:
+      with self._writer_cursor() as cursor:
         cursor.execute(
           """
-                    INSERT INTO games (name, version, author, description, game_type, exe_path)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    INSERT INTO games (name, version, author, description, game_type, exe_path, blob_digest)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                     """,
-          (name, version, author, description, game_type, exe_path),
+          (name, version, author, description, game_type, exe_path, blob_digest),
         )
-        conn.commit()
-        return True, "Game uploaded successfully"
-      except sqlite3.IntegrityError:
-        return False, "Game name already exists"
-      except Exception as e:
-        return False, str(e)
-      finally:
-        conn.close()
-
-  def update_game_version(self, name, author, new_version, new_exe_path):
-    """D2: 更新遊戲版本 (需檢查作者權限)"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
-
+      return True, "Game uploaded successfully"
+    except sqlite3.IntegrityError:
+      return False, "Game name already exists"
+    except Exception as e:
+      return False, str(e)
+
+  def update_game_version(
+    self, name, author, new_version, new_exe_path, blob_digest=None
+  ):
+    """
+    D2: 更新遊戲版本 (需檢查作者權限)
+    回傳 (success, msg, old_blob_digest)，舊的 blob 由呼叫者釋放引用。
+    """
+    with self._writer_cursor() as cursor:
       # 1. 檢查遊戲是否存在且作者是否正確
-      cursor.execute("SELECT author FROM games WHERE name = ?", (name,))
+      cursor.execute("SELECT author, blob_digest FROM games WHERE name = ?", (name,))
       row = cursor.fetchone()
       if not row:
-        conn.close()
-        return False, "Game not found"
+        return False, "Game not found", None
       if row[0] != author:
-        conn.close()
-        return False, "Permission denied: You are not the author"
+        return False, "Permission denied: You are not the author", None
 
       # 2. 更新
       cursor.execute(
         """
-                UPDATE games 
-                SET version = ?, exe_path = ?
+                UPDATE games
+                SET version = ?, exe_path = ?, blob_digest = ?
                 WHERE name = ?
                 """,
-        (new_version, new_exe_path, name),
+        (new_version, new_exe_path, blob_digest, name),
       )
-      conn.commit()
-      conn.close()
-      return True, "Game updated successfully"
+      return True, "Game updated successfully", row[1]
 
   def delete_game(self, name, author):
-    """D3: 下架遊戲 (需檢查權限)"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
-
-      # 1. 權限檢查
-      cursor.execute("SELECT author, version FROM games WHERE name = ?", (name,))
-      row = cursor.fetchone()
-      if not row:
-        conn.close()
-        return False, "Game not found", None
-
-      if row[0] != author:
-        conn.close()
-        return False, "Permission denied", None
-
-      version = row[1]  # 記住版本號以便後續刪除檔案
-
-      # 2. 刪除資料庫紀錄
-      try:
+    """
+    D3: 下架遊戲 (需檢查權限)
+    回傳 (success, msg, blob_digest)，blob 由呼叫者釋放引用。
+    """
+    try:
+      with self._writer_cursor() as cursor:
+        # 1. 權限檢查
+        cursor.execute("SELECT author, blob_digest FROM games WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        if not row:
+          return False, "Game not found", None
+
+        if row[0] != author:
+          return False, "Permission denied", None
+
+        blob_digest = row[1]  # 記住遊戲包以便後續刪除檔案
+
+        # 2. 刪除資料庫紀錄
         cursor.execute("DELETE FROM games WHERE name = ?", (name,))
         # 選擇性：連同該遊戲的評論一起刪除，保持資料乾淨
         cursor.execute("DELETE FROM reviews WHERE game_name = ?", (name,))
-        conn.commit()
-        return True, "Game deleted", version
-      except Exception as e:
-        return False, str(e), None
-      finally:
-        conn.close()
+        return True, "Game deleted", blob_digest
+    except Exception as e:
+      return False, str(e), None
+
+  def get_game_release(self, name):
+    """取得遊戲目前的 (version, blob_digest)，找不到回傳 (None, None)"""
+    with self._reader() as cursor:
+      cursor.execute("SELECT version, blob_digest FROM games WHERE name = ?", (name,))
+      row = cursor.fetchone()
+    return (row[0], row[1]) if row else (None, None)
 
   def list_all_games(self):
     """P1 & P4: 列出所有遊戲 (含評分資訊)"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
+    with self._reader() as cursor:
+      # [P4] 評分資訊以單一 LEFT JOIN + GROUP BY 彙總，避免每個遊戲各查一次 (N+1)
       cursor.execute(
-        "SELECT id, name, version, author, description, game_type, exe_path FROM games"
+        """
+                SELECT g.id, g.name, g.version, g.author, g.description, g.game_type,
+                       g.exe_path, r.avg_rating, COALESCE(r.review_count, 0)
+                FROM games g
+                LEFT JOIN (
+                    SELECT game_name, AVG(rating) AS avg_rating, COUNT(*) AS review_count
+                    FROM reviews
+                    GROUP BY game_name
+                ) r ON r.game_name = g.name
+                ORDER BY g.id
+                """
       )
       rows = cursor.fetchall()
 
-      games = []
-      for r in rows:
-        game_name = r[1]
-
-        # [P4 Fix] 額外查詢評分資訊
-        # 計算該遊戲的平均分與評論總數
-        cursor.execute(
-          "SELECT AVG(rating), COUNT(*) FROM reviews WHERE game_name = ?", (game_name,)
-        )
-        rating_row = cursor.fetchone()
-
-        # 處理 None (還沒人評分) 的情況
-        avg_rating = round(rating_row[0], 1) if rating_row and rating_row[0] else 0.0
-        review_count = rating_row[1] if rating_row else 0
-
-        games.append(
-          {
-            "id": r[0],
-            "name": r[1],
-            "version": r[2],
-            "author": r[3],
-            "description": r[4],
-            "type": r[5],
-            "exe_path": r[6],
-            "rating": avg_rating,  # 新增欄位
-            "rating_count": review_count,  # 新增欄位
-          }
-        )
-
-      conn.close()
-      return games
+    games = []
+    for r in rows:
+      # 處理 None (還沒人評分) 的情況
+      avg_rating = round(r[7], 1) if r[7] else 0.0
+
+      games.append(
+        {
+          "id": r[0],
+          "name": r[1],
+          "version": r[2],
+          "author": r[3],
+          "description": r[4],
+          "type": r[5],
+          "exe_path": r[6],
+          "rating": avg_rating,  # 新增欄位
+          "rating_count": r[8],  # 新增欄位
+        }
+      )
+    return games
 
   def list_my_games(self, author_name):
     """列出特定作者的遊戲"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
+    with self._reader() as cursor:
       cursor.execute(
         "SELECT name, version, game_type FROM games WHERE author = ?", (author_name,)
       )
       rows = cursor.fetchall()
-      conn.close()
 
-      games = []
-      for r in rows:
-        games.append({"name": r[0], "version": r[1], "type": r[2]})
-      return games
+    games = []
+    for r in rows:
+      games.append({"name": r[0], "version": r[1], "type": r[2]})
+    return games
 
   def add_review(self, game_name, player_name, rating, comment):
     """P4: 新增或更新評分"""
-    with self.lock:
-      conn = self._get_conn()
-      cursor = conn.cursor()
-      try:
+    try:
+      with self._writer_cursor() as cursor:
         # 使用 UPSERT (若重複則更新)
         cursor.execute(
           """
                     INSERT INTO reviews (game_name, player_name, rating, comment)
                     VALUES (?, ?, ?, ?)
-                    ON CONFLICT(game_name, player_name) 
+                    ON CONFLICT(game_name, player_name)
                     DO UPDATE SET rating=excluded.rating, comment=excluded.comment
                     """,
           (game_name, player_name, rating, comment),
         )
-        conn.commit()
-        return True, "Review submitted"
-      except Exception as e:
-        return False, str(e)
-      finally:
-        conn.close()
+      return True, "Review submitted"
+    except Exception as e:
+      return False, str(e)
+
+  # --- Blob Storage ---
+
+  def acquire_blob(self, digest, size):
+    """blob 引用數 +1 (不存在時建立)"""
+    with self._writer_cursor() as cursor:
+      cursor.execute(
+        """
+                INSERT INTO blobs (digest, size, refcount) VALUES (?, ?, 1)
+                ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1
+                """,
+        (digest, size),
+      )
+
+  def release_blob(self, digest):
+    """blob 引用數 -1，回傳剩餘引用數；歸零時移除紀錄"""
+    with self._writer_cursor() as cursor:
+      cursor.execute(
+        "UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,)
+      )
+      cursor.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,))
+      row = cursor.fetchone()
+      if not row or row[0] <= 0:
+        cursor.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        return 0
+      return row[0]
+
+  def get_blob_manifest(self, digest):
+    """取得 blob 的逐檔清單，尚未建立時回傳 None"""
+    with self._reader() as cursor:
+      cursor.execute("SELECT manifest FROM blobs WHERE digest = ?", (digest,))
+      row = cursor.fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+  def set_blob_manifest(self, digest, manifest):
+    with self._writer_cursor() as cursor:
+      cursor.execute(
+        "UPDATE blobs SET manifest = ? WHERE digest = ?",
+        (json.dumps(manifest), digest),
+      )
+
+  def set_game_blob(self, name, digest):
+    with self._writer_cursor() as cursor:
+      cursor.execute("UPDATE games SET blob_digest = ? WHERE name = ?", (digest, name))
+
+  def list_game_releases(self):
+    """所有已存進 blob store 的遊戲目前的 (name, version, blob_digest)"""
+    with self._reader() as cursor:
+      cursor.execute(
+        "SELECT name, version, blob_digest FROM games WHERE blob_digest IS NOT NULL"
+      )
+      return cursor.fetchall()
+
+  def list_games_without_blob(self):
+    """舊版資料 (尚未搬進 blob store) 的 (name, version)"""
+    with self._reader() as cursor:
+      cursor.execute("SELECT name, version FROM games WHERE blob_digest IS NULL")
+      return cursor.fetchall()
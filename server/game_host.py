@@ -0,0 +1,266 @@
+# server/game_host.py
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from server.warm_pool import READY_TIMEOUT
+
+HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "host_worker.py")
+
+# 遊戲包裡有這個檔案 (定義 RoomHandler) 代表支援多房間共用行程
+HANDLER_MODULE = "room_handler.py"
+
+# 預設的 host 行程數：0 = 關閉 hosted 模式 (需要時以 --host-workers 開啟)。
+# 同一個 host 行程裡執行的是不同開發者上傳的 room_handler.py，彼此沒有任何隔離
+# (可以讀寫其他房間的狀態、拖慢或弄垮整個行程)，只適合信任所有上架遊戲的部署
+DEFAULT_HOST_WORKERS = 0
+
+# CPU 使用率超過這個值 (1.0 = 一顆核心) 的 host 視為忙碌，新房間優先放到其他 host
+HOST_CPU_BUSY = 0.8
+
+
+def supports_hosting(game_dir):
+  """版本目錄是否宣告支援 in-process hosting"""
+  return os.path.isfile(os.path.join(game_dir, HANDLER_MODULE))
+
+
+class GameHost:
+  """
+  Lobby 端控制一個 host_worker.py 行程：同一行程以 event loop 執行許多房間。
+  行程在第一次建立房間時才啟動，結束後下次建立房間會重新啟動。
+
+  stdin 送出 create / close 指令，背景 thread 讀 stdout 的 ready / failed / exit 事件；
+  房間結束的資訊 (exit code、錯誤、traceback) 由 pop_exit() 取走。
+  行程本身結束時，上面所有房間都視為結束。
+  """
+
+  def __init__(self, env=None, cwd=None):
+    self.env = env
+    self.cwd = cwd
+    self.lock = threading.Lock()
+    self.process = None
+    self._pending = {}  # {room_id: (process, Event, result)}，等待 ready / failed
+    self._running = {}  # {room_id: process}
+    self._exits = {}  # {room_id: {"exit_code", "error", "stderr_tail"}}
+    self.cpu = 0.0  # host 最近回報的 CPU 使用率
+
+  def start_room(self, room_id, port, game_dir, timeout=READY_TIMEOUT):
+    """請 host 開始執行房間並等待它開始 listen，回傳 (成功與否, 錯誤訊息)"""
+    event = threading.Event()
+    result = {}
+    with self.lock:
+      process = self._ensure_process()
+      self._pending[room_id] = (process, event, result)
+      sent = self._send(
+        process,
+        {"op": "create", "room_id": room_id, "port": port, "game_dir": game_dir},
+      )
+    if not sent:
+      with self.lock:
+        self._pending.pop(room_id, None)
+      return False, "Game host is not running"
+
+    if not event.wait(timeout):
+      with self.lock:
+        self._pending.pop(room_id, None)
+      self.close_room(room_id)
+      return False, "Game host did not respond"
+    return result["ok"], result.get("error")
+
+  def close_room(self, room_id):
+    with self.lock:
+      process = self._running.get(room_id, self.process)
+      if process is not None:
+        self._send(process, {"op": "close", "room_id": room_id})
+
+  def is_running(self, room_id):
+    with self.lock:
+      return room_id in self._running
+
+  def pop_exit(self, room_id):
+    with self.lock:
+      return self._exits.pop(room_id, None)
+
+  def room_count(self):
+    with self.lock:
+      return len(self._running)
+
+  def stats(self):
+    with self.lock:
+      alive = self.process is not None and self.process.poll() is None
+      return {
+        "pid": self.process.pid if alive else None,
+        "alive": alive,
+        "rooms": len(self._running),
+        "starting": len(self._pending),
+        "cpu": self.cpu if alive else 0.0,
+      }
+
+  def shutdown(self):
+    with self.lock:
+      process, self.process = self.process, None
+    if process is not None:
+      try:
+        process.stdin.close()
+      except OSError:
+        pass
+      process.kill()
+      process.wait()
+
+  def _ensure_process(self):
+    """(呼叫者需持有 lock) 取得執行中的 host 行程，沒有就啟動"""
+    if self.process is None or self.process.poll() is not None:
+      self.process = subprocess.Popen(
+        [sys.executable, HOST_SCRIPT],
+        cwd=self.cwd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,  # 事件串流
+        stderr=None,  # 遊戲的輸出直接顯示在主控台
+        env=self.env,
+        text=True,
+      )
+      threading.Thread(
+        target=self._read_events,
+        args=(self.process,),
+        name=f"game-host-{self.process.pid}",
+        daemon=True,
+      ).start()
+      print(f"[GameHost] Started host process {self.process.pid}")
+    return self.process
+
+  def _send(self, process, message):
+    try:
+      process.stdin.write(json.dumps(message) + "\n")
+      process.stdin.flush()
+      return True
+    except (OSError, ValueError):
+      return False  # host 已經結束
+
+  def _read_events(self, process):
+    for line in process.stdout:
+      try:
+        message = json.loads(line)
+      except ValueError:
+        continue
+      self._on_event(process, message)
+
+    # host 行程結束：上面所有房間一起結束
+    exit_code = process.wait()
+    process.stdout.close()
+    with self.lock:
+      if process is self.process:
+        self.cpu = 0.0
+      for room_id in [r for r, p in self._running.items() if p is process]:
+        del self._running[room_id]
+        self._exits[room_id] = {
+          "exit_code": exit_code,
+          "error": "Game host exited",
+          "stderr_tail": [],
+        }
+      waiting = [r for r, (p, _, _) in self._pending.items() if p is process]
+      for room_id in waiting:
+        _, event, result = self._pending.pop(room_id)
+        result.update(ok=False, error="Game host exited")
+        event.set()
+    print(f"[GameHost] Host process {process.pid} exited ({exit_code})")
+
+  def _on_event(self, process, message):
+    event_name = message.get("event")
+    room_id = message.get("room_id")
+    with self.lock:
+      if event_name == "stats":
+        if process is self.process:
+          self.cpu = message.get("cpu", 0.0)
+      elif event_name in ("ready", "failed"):
+        pending = self._pending.pop(room_id, None)
+        if event_name == "ready":
+          if pending is None:
+            # 等待已逾時 (start_room 已送出 close)，不列入執行中
+            return
+          self._running[room_id] = process
+        if pending is not None:
+          _, event, result = pending
+          result.update(ok=event_name == "ready", error=message.get("error"))
+          event.set()
+      elif event_name == "exit":
+        if self._running.pop(room_id, None) is not None:
+          self._exits[room_id] = {
+            "exit_code": message.get("exit_code"),
+            "error": message.get("error"),
+            "stderr_tail": message.get("stderr_tail", []),
+          }
+
+
+class HostPool:
+  """
+  多個 GameHost 行程 (預設每顆核心一個)，讓 hosted 房間分散到各核心。
+  新房間放到最閒的 host：先避開 CPU 忙碌的，再選房間數最少的 (尚未啟動的 host 為 0)。
+  介面與 GameHost 相同，RoomManager 不需要知道房間在哪個 host。
+  """
+
+  def __init__(self, size, env=None, cwd=None):
+    self.hosts = [GameHost(env, cwd) for _ in range(max(size, 1))]
+    self.lock = threading.Lock()
+    self._placement = {}  # {room_id: host index}
+    self._loads = [0] * len(self.hosts)  # 各 host 分配到 (還沒回收) 的房間數
+
+  def _pick_host(self):
+    """(呼叫者需持有 lock) 回傳最閒的 host index"""
+    return min(
+      range(len(self.hosts)),
+      key=lambda i: (
+        self.hosts[i].cpu >= HOST_CPU_BUSY,
+        self._loads[i],
+        self.hosts[i].cpu,
+      ),
+    )
+
+  def _unplace(self, room_id):
+    with self.lock:
+      index = self._placement.pop(room_id, None)
+      if index is None:
+        return None
+      self._loads[index] -= 1
+      return self.hosts[index]
+
+  def start_room(self, room_id, port, game_dir, timeout=READY_TIMEOUT):
+    with self.lock:
+      index = self._pick_host()
+      self._placement[room_id] = index
+      self._loads[index] += 1
+    ready, error = self.hosts[index].start_room(room_id, port, game_dir, timeout)
+    if not ready:
+      self._unplace(room_id)
+    return ready, error
+
+  def _host_of(self, room_id):
+    with self.lock:
+      index = self._placement.get(room_id)
+      return self.hosts[index] if index is not None else None
+
+  def close_room(self, room_id):
+    host = self._host_of(room_id)
+    if host is not None:
+      host.close_room(room_id)
+
+  def is_running(self, room_id):
+    host = self._host_of(room_id)
+    return host is not None and host.is_running(room_id)
+
+  def pop_exit(self, room_id):
+    host = self._unplace(room_id)
+    return host.pop_exit(room_id) if host is not None else None
+
+  def room_count(self):
+    return sum(host.room_count() for host in self.hosts)
+
+  def stats(self):
+    """每個 host 的負載 (給管理查詢用)"""
+    return [dict(host.stats(), worker=i) for i, host in enumerate(self.hosts)]
+
+  def shutdown(self):
+    for host in self.hosts:
+      host.shutdown()
@@ -0,0 +1,74 @@
+# server/game_worker.py
+"""
+預先啟動的 Game Server worker (warm pool)。
+
+由 RoomManager 以遊戲版本目錄為 cwd 啟動：
+1. 先完成 Python 啟動並編譯好 server.py，透過 status pipe 回報 "idle"
+2. 從 stdin 讀一行 JSON 指派 ({"port": ..., "room_id": ...})
+3. 以 server.py --port <port> --room_id <id> 的參數執行遊戲
+4. 遊戲第一次呼叫 socket.listen() 時回報 "ready" (真正可以連線了)
+
+status pipe 關閉 (EOF) 代表 worker 已經結束。
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+GAME_SCRIPT = "server.py"
+
+
+def _report(status_fd, event):
+  try:
+    os.write(status_fd, f"{event}\n".encode())
+  except OSError:
+    pass  # Lobby 已不再等待
+
+
+def _hook_listen(status_fd):
+  """第一次 listen() 成功後回報 ready，之後關閉 status pipe"""
+  original_listen = socket.socket.listen
+
+  def listen(self, *args):
+    original_listen(self, *args)
+    socket.socket.listen = original_listen
+    _report(status_fd, "ready")
+    os.close(status_fd)
+
+  socket.socket.listen = listen
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--status-fd", type=int, required=True)
+  args = parser.parse_args()
+
+  script_path = os.path.abspath(GAME_SCRIPT)
+  with open(script_path, "rb") as f:
+    code = compile(f.read(), script_path, "exec")
+
+  # 讓 server.py 能 import 同目錄的模組
+  sys.path.insert(0, os.path.dirname(script_path))
+  _report(args.status_fd, "idle")
+
+  # 等待指派 (stdin 關閉代表 Lobby 不需要這個 worker 了)
+  line = sys.stdin.readline()
+  if not line:
+    return
+  assignment = json.loads(line)
+
+  sys.argv = [
+    GAME_SCRIPT,
+    "--port",
+    str(assignment["port"]),
+    "--room_id",
+    str(assignment["room_id"]),
+  ]
+  _hook_listen(args.status_fd)
+  exec(code, {"__name__": "__main__", "__file__": script_path})
+
+
+if __name__ == "__main__":
+  main()
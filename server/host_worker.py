@@ -0,0 +1,197 @@
+# server/host_worker.py
+"""
+多房間共用的 Game Host 行程 (in-process hosting)。
+
+遊戲包若附上 room_handler.py 並定義 RoomHandler 類別，房間就不必各自啟動
+server.py 行程，而是由這個行程在同一個 event loop 裡同時執行許多房間：
+
+  class RoomHandler:
+    def __init__(self, room):
+      # room.room_id / room.port / room.close(exit_code=0, error=None)
+      ...
+
+    async def on_player(self, reader, writer):
+      # 每個玩家連線呼叫一次 (asyncio StreamReader / StreamWriter)
+      ...
+
+遊戲結束時呼叫 room.close()，相當於 server.py 行程結束；
+on_player 丟出例外時房間以 exit code 1 結束。
+RoomHandler 必須全程使用 asyncio (不可 blocking)，否則會拖慢同一行程的其他房間；
+同一版本的房間共用一個已載入的模組，檔案路徑請以 __file__ 為基準。
+
+與 Lobby 的溝通 (每行一個 JSON)：
+  stdin  (指令)  {"op": "create", "room_id", "port", "game_dir"}
+                 {"op": "close", "room_id"}
+  stdout (事件)  {"event": "ready" | "failed" | "exit", "room_id", ...}
+                 {"event": "stats", "rooms", "cpu"} (每 STATS_INTERVAL 秒)
+遊戲的 print 會被導向 stderr，不會混進事件串流。stdin 關閉代表 Lobby 已結束。
+
+注意：同一個行程裡的 RoomHandler 可能來自不同開發者上傳的遊戲，彼此沒有任何隔離
+(共用記憶體、event loop 與檔案權限)，所以 hosted 模式預設關閉，
+需以 server/main.py 的 --host-workers 明確開啟。
+"""
+
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+HANDLER_MODULE = "room_handler.py"
+HANDLER_CLASS = "RoomHandler"
+
+# 房間異常結束時回報的 traceback 行數
+STDERR_TAIL_LINES = 20
+
+# 回報負載 (房間數、CPU 使用率) 的間隔 (秒)
+STATS_INTERVAL = 1.0
+
+
+class HostedRoom:
+  """交給 RoomHandler 的房間物件"""
+
+  def __init__(self, host, room_id, port, game_dir):
+    self.room_id = room_id
+    self.port = port
+    self.game_dir = game_dir
+    self.handler = None
+    self.server = None
+    self.closed = False
+    self._host = host
+    self._tasks = set()  # 各玩家連線的 task
+
+  def close(self, exit_code=0, error=None):
+    """遊戲結束：關閉房間並中斷其餘玩家連線"""
+    self._host.finish(self, exit_code, error)
+
+  async def _on_connect(self, reader, writer):
+    task = asyncio.current_task()
+    self._tasks.add(task)
+    try:
+      await self.handler.on_player(reader, writer)
+    except asyncio.CancelledError:
+      pass  # 房間已結束
+    except Exception as e:
+      traceback.print_exc()
+      tail = traceback.format_exc().splitlines()
+      self._host.finish(self, 1, f"{type(e).__name__}: {e}", tail)
+    finally:
+      self._tasks.discard(task)
+      writer.close()
+
+
+class RoomHost:
+  def __init__(self, events):
+    self.events = events
+    self.rooms = {}  # {room_id: HostedRoom}
+    self._handlers = {}  # {game_dir: RoomHandler 類別}
+    self._module_ids = itertools.count()
+
+  def emit(self, event, room_id=None, **fields):
+    self.events.write(json.dumps({"event": event, "room_id": room_id, **fields}))
+    self.events.write("\n")
+    self.events.flush()
+
+  async def report_stats(self):
+    """定期回報房間數與這段時間的 CPU 使用率 (1.0 = 佔滿一顆核心)"""
+    last_wall, last_cpu = time.monotonic(), time.process_time()
+    while True:
+      await asyncio.sleep(STATS_INTERVAL)
+      wall, cpu = time.monotonic(), time.process_time()
+      usage = (cpu - last_cpu) / max(wall - last_wall, 1e-6)
+      last_wall, last_cpu = wall, cpu
+      self.emit("stats", rooms=len(self.rooms), cpu=round(usage, 3))
+
+  def dispatch(self, message):
+    op = message.get("op")
+    if op == "create":
+      asyncio.get_running_loop().create_task(
+        self.create(message["room_id"], message["port"], message["game_dir"])
+      )
+    elif op == "close":
+      room = self.rooms.get(message["room_id"])
+      if room is not None:
+        self.finish(room, None, "Closed by lobby")
+
+  async def create(self, room_id, port, game_dir):
+    room = HostedRoom(self, room_id, port, game_dir)
+    try:
+      room.handler = self._load_handler(game_dir)(room)
+      room.server = await asyncio.start_server(room._on_connect, "0.0.0.0", port)
+    except Exception as e:
+      traceback.print_exc()
+      self.emit("failed", room_id, error=f"{type(e).__name__}: {e}")
+      return
+    self.rooms[room_id] = room
+    self.emit("ready", room_id)
+
+  def finish(self, room, exit_code, error=None, stderr_tail=()):
+    if room.closed:
+      return
+    room.closed = True
+    self.rooms.pop(room.room_id, None)
+    if room.server is not None:
+      room.server.close()
+    current = asyncio.current_task()
+    for task in list(room._tasks):
+      if task is not current:
+        task.cancel()
+
+    # 該版本已經沒有房間了：忘記模組，讓舊版本目錄可以被清掉
+    if not any(r.game_dir == room.game_dir for r in self.rooms.values()):
+      handler_class = self._handlers.pop(room.game_dir, None)
+      if handler_class is not None:
+        sys.modules.pop(handler_class.__module__, None)
+
+    self.emit(
+      "exit",
+      room.room_id,
+      exit_code=exit_code,
+      error=error,
+      stderr_tail=list(stderr_tail)[-STDERR_TAIL_LINES:],
+    )
+
+  def _load_handler(self, game_dir):
+    """載入 (並快取) 版本目錄中的 RoomHandler 類別"""
+    handler_class = self._handlers.get(game_dir)
+    if handler_class is None:
+      path = os.path.join(game_dir, HANDLER_MODULE)
+      name = f"_hosted_room_handler_{next(self._module_ids)}"
+      spec = importlib.util.spec_from_file_location(name, path)
+      module = importlib.util.module_from_spec(spec)
+      sys.modules[name] = module
+      try:
+        spec.loader.exec_module(module)
+        handler_class = getattr(module, HANDLER_CLASS)
+      except BaseException:
+        sys.modules.pop(name, None)
+        raise
+      self._handlers[game_dir] = handler_class
+    return handler_class
+
+
+def main():
+  events = sys.stdout
+  sys.stdout = sys.stderr  # 遊戲的 print 不可混進事件串流
+
+  loop = asyncio.new_event_loop()
+  asyncio.set_event_loop(loop)
+  host = RoomHost(events)
+
+  def read_commands():
+    for line in sys.stdin:
+      if line.strip():
+        loop.call_soon_threadsafe(host.dispatch, json.loads(line))
+    loop.call_soon_threadsafe(loop.stop)  # Lobby 關閉了 stdin
+
+  threading.Thread(target=read_commands, name="host-commands", daemon=True).start()
+  loop.create_task(host.report_stats())
+  loop.run_forever()
+
+
+if __name__ == "__main__":
+  main()
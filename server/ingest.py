@@ -0,0 +1,232 @@
+# server/ingest.py
+
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import zipfile
+
+from common.manifest import is_safe_path
+from server.room_manager import release_name
+
+# 單一遊戲包 (zip) 的大小上限，超過時在開始傳送前就拒絕
+MAX_PACKAGE_SIZE = 512 * 1024 * 1024
+
+# 解壓縮後的總大小與檔案數上限 (避免 zip bomb)
+MAX_EXTRACTED_SIZE = 2 * 1024 * 1024 * 1024
+MAX_PACKAGE_FILES = 10000
+
+# zip 檔開頭的 signature (一般 zip / 空的 zip)
+ZIP_MAGICS = (b"PK\x03\x04", b"PK\x05\x06")
+
+# 背景清理舊版本目錄的間隔 (秒)
+GC_INTERVAL = 60
+
+# 部署狀態
+DEPLOY_PENDING = "pending"
+DEPLOY_RUNNING = "deploying"
+DEPLOY_READY = "ready"
+DEPLOY_FAILED = "failed"
+
+
+class PackageIngest:
+  """
+  接收遊戲包時逐段處理 (傳給 recv_file 的 hasher)：
+  邊收邊計算 sha256，並在收到前幾個 bytes 時就確認是 zip，不是的話立刻中止。
+  """
+
+  def __init__(self):
+    self._hash = hashlib.sha256()
+    self._head = b""
+
+  def update(self, chunk):
+    if len(self._head) < 4:
+      self._head += bytes(chunk[: 4 - len(self._head)])
+      if len(self._head) == 4 and self._head not in ZIP_MAGICS:
+        raise ValueError("Package is not a zip file")
+    self._hash.update(chunk)
+
+  def hexdigest(self):
+    return self._hash.hexdigest()
+
+
+def validate_package(zip_path):
+  """
+  只讀 zip 的 central directory 檢查結構 (不解壓縮)：
+  路徑不可跳出安裝目錄，檔案數與解壓縮後大小不可超過上限。
+  不合格時丟出 ValueError。
+  """
+  try:
+    with zipfile.ZipFile(zip_path, "r") as zf:
+      infos = zf.infolist()
+  except zipfile.BadZipFile as e:
+    raise ValueError(f"Invalid zip: {e}")
+
+  if len(infos) > MAX_PACKAGE_FILES:
+    raise ValueError(f"Too many files in package ({len(infos)})")
+
+  total_size = 0
+  for info in infos:
+    if not is_safe_path(info.filename.rstrip("/")):
+      raise ValueError(f"Unsafe path in package: {info.filename}")
+    total_size += info.file_size
+  if total_size > MAX_EXTRACTED_SIZE:
+    raise ValueError(f"Package too large when extracted ({total_size} bytes)")
+
+
+class Deployer:
+  """
+  背景部署：把已收進 blob store 的遊戲包解壓縮到 installed_games。
+  上傳的回覆不必等解壓縮完成，部署進度以 get_status() 查詢
+  (GET_GAME_INFO / LIST_MY_GAMES 會帶上 deploy_status)。
+
+  每個版本解壓到自己的目錄後才切換 RoomManager 的 CURRENT，
+  執行中的房間繼續使用舊版目錄，沒有房間使用後再由 GC 刪除。
+
+  只有一個 worker thread，同一遊戲的部署依序執行；
+  佇列中已被更新版本取代的工作會直接略過。
+
+  部署狀態只存在記憶體：Server 重啟後由 resume() 把 DB 版本與 CURRENT 不一致的遊戲
+  重新排入部署，沒有紀錄的遊戲則依 CURRENT 是否指向 DB 中的版本判斷狀態。
+  """
+
+  def __init__(
+    self, room_manager, blob_store, db_manager=None, gc_interval=GC_INTERVAL
+  ):
+    self.room_manager = room_manager
+    self.blob_store = blob_store
+    self.db_manager = db_manager
+    self.lock = threading.Lock()
+    self._status = {}  # {game_name: {"state", "version", "msg"}}
+    self._latest = {}  # {game_name: 最新一次 submit 的 digest (None 代表刪除)}
+    self._queue = queue.Queue()
+    self._gc_interval = gc_interval
+    self._worker = threading.Thread(target=self._run, name="deployer", daemon=True)
+    self._worker.start()
+
+  def submit(self, game_name, version, digest):
+    """排入部署工作，回傳目前狀態"""
+    with self.lock:
+      self._latest[game_name] = digest
+      self._status[game_name] = {
+        "state": DEPLOY_PENDING,
+        "version": version,
+        "msg": "",
+      }
+    self._queue.put((game_name, version, digest))
+    return DEPLOY_PENDING
+
+  def remove(self, game_name):
+    """排入刪除安裝目錄的工作 (與部署同一佇列，避免刪除後又被解壓回來)"""
+    with self.lock:
+      self._latest[game_name] = None
+      self._status.pop(game_name, None)
+    self._queue.put((game_name, None, None))
+
+  def resume(self):
+    """
+    Server 啟動時呼叫：上線版本 (CURRENT) 不是 DB 中最新版本的遊戲重新排入部署
+    (例如上傳完成、尚未解壓縮時 Server 就被關閉)。回傳排入的遊戲數。
+    """
+    count = 0
+    for game_name, version, digest in self.db_manager.list_game_releases():
+      current = self.room_manager.get_current_release(game_name)
+      if current != release_name(version, digest):
+        print(f"[Deployer] Resuming deploy of {game_name} {version}")
+        self.submit(game_name, version, digest)
+        count += 1
+    return count
+
+  def get_status(self, game_name):
+    with self.lock:
+      status = self._status.get(game_name)
+      if status:
+        return dict(status)
+    return self._release_status(game_name)
+
+  def _release_status(self, game_name):
+    """沒有部署紀錄時，依 CURRENT 是否指向 DB 中的版本判斷；遊戲不存在時回傳 None"""
+    if self.db_manager is None:
+      return None
+    version, digest = self.db_manager.get_game_release(game_name)
+    if version is None:
+      return None
+    current = self.room_manager.get_current_release(game_name)
+    if digest:
+      deployed = current == release_name(version, digest)
+    else:
+      deployed = current is not None  # 尚未搬進 blob store 的舊版安裝
+    return {
+      "state": DEPLOY_READY if deployed else DEPLOY_FAILED,
+      "version": version,
+      "msg": "" if deployed else "Not deployed",
+    }
+
+  def join(self):
+    """等待目前佇列中的工作全部完成"""
+    self._queue.join()
+
+  def _set_status(self, game_name, digest, state, msg=""):
+    with self.lock:
+      # 已經有更新的 submit，舊工作的結果不再更新狀態
+      if self._latest.get(game_name) == digest and game_name in self._status:
+        self._status[game_name]["state"] = state
+        self._status[game_name]["msg"] = msg
+
+  def _run(self):
+    while True:
+      try:
+        game_name, version, digest = self._queue.get(timeout=self._gc_interval)
+      except queue.Empty:
+        # 閒置時定期清掉已經沒有房間使用的舊版本
+        self._collect_garbage()
+        continue
+      try:
+        with self.lock:
+          superseded = self._latest.get(game_name) != digest
+        if superseded:
+          continue
+        if digest is None:
+          self._remove_install_dir(game_name)
+        else:
+          self._deploy(game_name, version, digest)
+      except Exception as e:
+        print(f"[Deployer] Deploy {game_name} {version} failed: {e}")
+        self._set_status(game_name, digest, DEPLOY_FAILED, str(e))
+      finally:
+        self._queue.task_done()
+
+  def _deploy(self, game_name, version, digest):
+    self._set_status(game_name, digest, DEPLOY_RUNNING)
+    release = release_name(version, digest)
+    release_dir = self.room_manager.get_release_dir(game_name, release)
+
+    # 先解壓到暫存目錄，完成後才改名成版本目錄，避免出現解壓到一半的版本
+    if not os.path.isdir(release_dir):
+      staging_dir = release_dir + ".staging"
+      if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+      with zipfile.ZipFile(self.blob_store.path(digest), "r") as zip_ref:
+        zip_ref.extractall(staging_dir)
+      os.replace(staging_dir, release_dir)
+
+    # 切換上線版本 (之後建立的房間使用新版)
+    self.room_manager.activate_release(game_name, release)
+
+    # 逐檔清單也在背景建立，之後的差異更新直接使用
+    self.blob_store.manifest(digest)
+    self._set_status(game_name, digest, DEPLOY_READY)
+    print(f"[Deployer] {game_name} {version} deployed to {release_dir}")
+    self._collect_garbage(game_name)
+
+  def _remove_install_dir(self, game_name):
+    # 不再能建立新房間；執行中房間的版本目錄等房間結束後才刪除
+    self.room_manager.deactivate_game(game_name)
+    self._collect_garbage(game_name)
+
+  def _collect_garbage(self, game_name=None):
+    try:
+      self.room_manager.collect_garbage(game_name)
+    except Exception as e:
+      print(f"[Deployer] Garbage collection failed: {e}")
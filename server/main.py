@@ -1,5 +1,6 @@
 # server/main.py
 
+import argparse
 import socket
 import sys
 import os
@@ -10,10 +11,23 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from server.client_handler import ClientHandler
 from server.db_manager import DBManager
 from server.room_manager import RoomManager
+from server.catalogue import CatalogueCache
+from server.blob_store import BlobStore
+from server.ingest import Deployer
+from server.warm_pool import WARM_POOL_SIZE
+from server.game_host import DEFAULT_HOST_WORKERS
+from server.port_allocator import ROOM_PORT_MAX, ROOM_PORT_MIN, parse_port_range
+from server.transfer_server import TransferServer
 
 # 設定起始 Port 為 30000
 START_PORT = 30000
 
+# listen() 的 backlog，避免連線尖峰時 SYN 被丟棄
+LISTEN_BACKLOG = 128
+
+ENGINE_THREAD = "thread"
+ENGINE_ASYNCIO = "asyncio"
+
 
 def bind_server(host, start_port, max_attempts=100):
   """
@@ -39,35 +53,142 @@ def bind_server(host, start_port, max_attempts=100):
   )
 
 
+def serve_threaded(
+  server_socket,
+  db_manager,
+  room_manager,
+  catalogue,
+  blob_store,
+  deployer,
+  transfer_server=None,
+):
+  """Thread 模式：每個連線一個 ClientHandler thread"""
+  while True:
+    # 2. 等待連線 (Blocking)
+    client_sock, addr = server_socket.accept()
+
+    # print(f"[Server] New connection from {addr}")
+
+    # 3. 建立並啟動 Handler Thread
+    handler = ClientHandler(
+      client_sock,
+      addr,
+      db_manager,
+      room_manager,
+      catalogue,
+      blob_store,
+      deployer,
+      transfer_server,
+    )
+    handler.start()
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Game Store Lobby Server")
+  parser.add_argument(
+    "--engine",
+    choices=[ENGINE_THREAD, ENGINE_ASYNCIO],
+    default=ENGINE_THREAD,
+    help="thread: 每個連線一個 thread / asyncio: 單一 event loop",
+  )
+  parser.add_argument("--host", default="0.0.0.0", help="Host to bind")
+  parser.add_argument(
+    "--port", type=int, default=START_PORT, help="起始 Port (被佔用時自動 +1)"
+  )
+  parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="asyncio 模式下處理 DB / 檔案 I/O 的 executor thread 數",
+  )
+  parser.add_argument(
+    "--warm-pool",
+    type=int,
+    default=WARM_POOL_SIZE,
+    help="每個最近被玩的遊戲預先啟動幾個閒置 Game Server (0 = 關閉)",
+  )
+  parser.add_argument(
+    "--host-workers",
+    type=int,
+    default=DEFAULT_HOST_WORKERS,
+    help=(
+      "執行 hosted 房間 (room_handler.py) 的 host 行程數，建議每顆核心一個；"
+      "預設 0 = 一律用 server.py。注意：不同遊戲上傳的 room_handler.py "
+      "會在同一行程中執行、彼此沒有隔離，只在信任所有上架遊戲時開啟"
+    ),
+  )
+  parser.add_argument(
+    "--room-ports",
+    type=parse_port_range,
+    default=(ROOM_PORT_MIN, ROOM_PORT_MAX),
+    help=f"分配給 Game Server 的 Port 範圍 (預設 {ROOM_PORT_MIN}-{ROOM_PORT_MAX})",
+  )
+  return parser.parse_args()
+
+
 def main():
+  args = parse_args()
+
   # 使用 0.0.0.0 以便讓外部 (助教的 Client) 可以連入
-  host = "0.0.0.0"
+  host = args.host
 
   try:
     # 1. 自動尋找可用 Port (從 30000 開始)
-    server_socket, port = bind_server(host, START_PORT)
+    server_socket, port = bind_server(host, args.port)
+
+    server_socket.listen(LISTEN_BACKLOG)  # Backlog size
 
-    server_socket.listen(5)  # Backlog size
+    # 資料通道 (遊戲包上傳 / 下載) 使用下一個可用的 Port，Client 登入時會得知
+    transfer_socket, data_port = bind_server(host, port + 1)
+    transfer_socket.listen(LISTEN_BACKLOG)
+    transfer_server = TransferServer(transfer_socket)
+    transfer_server.start()
 
     print(f"========================================")
-    print(f" Game Store Server Started ")
+    print(f" Game Store Server Started ({args.engine} engine)")
     print(f" Listening on {host}:{port}")
+    print(f" Data channel on {host}:{data_port}")
     print(f"========================================")
     print(f" [IMPORTANT] Client please connect to Port: {port}")
     print(f"========================================")
 
     db_manager = DBManager()
-    room_manager = RoomManager()
-
-    while True:
-      # 2. 等待連線 (Blocking)
-      client_sock, addr = server_socket.accept()
-
-      # print(f"[Server] New connection from {addr}")
-
-      # 3. 建立並啟動 Handler Thread
-      handler = ClientHandler(client_sock, addr, db_manager, room_manager)
-      handler.start()
+    room_manager = RoomManager(
+      warm_pool_size=args.warm_pool,
+      host_workers=args.host_workers,
+      port_range=args.room_ports,
+    )
+    catalogue = CatalogueCache(db_manager)
+    blob_store = BlobStore(db_manager)
+    blob_store.migrate_legacy()
+    deployer = Deployer(room_manager, blob_store, db_manager)
+    deployer.resume()
+
+    if args.engine == ENGINE_ASYNCIO:
+      # 延遲 import，thread 模式不需要載入 asyncio
+      from server.async_server import run_async_server, DEFAULT_EXECUTOR_WORKERS
+
+      run_async_server(
+        server_socket,
+        db_manager,
+        room_manager,
+        catalogue,
+        blob_store,
+        deployer,
+        LISTEN_BACKLOG,
+        args.workers or DEFAULT_EXECUTOR_WORKERS,
+        transfer_server,
+      )
+    else:
+      serve_threaded(
+        server_socket,
+        db_manager,
+        room_manager,
+        catalogue,
+        blob_store,
+        deployer,
+        transfer_server,
+      )
 
   except KeyboardInterrupt:
     print("\n[Server] Server shutting down...")
@@ -76,6 +197,8 @@ def main():
   finally:
     if "server_socket" in locals():
       server_socket.close()
+    if "transfer_socket" in locals():
+      transfer_socket.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+# server/port_allocator.py
+
+import collections
+import random
+import socket
+import threading
+
+# 分配給 Game Server 的 Port 範圍：避開 Lobby (30000 起) 與 Linux 預設的
+# ephemeral range (32768-60999)，連出去的連線不會佔到房間的 Port
+ROOM_PORT_MIN = 20000
+ROOM_PORT_MAX = 29999
+
+
+def parse_port_range(text):
+  """'20000-29999' -> (20000, 29999)"""
+  low, _, high = text.partition("-")
+  low, high = int(low), int(high or low)
+  if not 0 < low <= high < 65536:
+    raise ValueError(f"Invalid port range: {text}")
+  return low, high
+
+
+class PortAllocator:
+  """
+  在固定範圍內分配房間 Port (in-memory free list)。
+
+  使用中的 Port 不會再分配出去，房間之間不會搶同一個 Port；
+  被其他程式佔用或仍在 TIME_WAIT 的 Port 在分配時以 bind 檢查後跳過。
+  歸還的 Port 排到最後，避免剛結束的房間 (TIME_WAIT) 立刻被重用；
+  free list 從範圍內隨機位置開始，Lobby 重啟後不會馬上重用上次的低號 Port。
+  """
+
+  def __init__(self, low=ROOM_PORT_MIN, high=ROOM_PORT_MAX):
+    self.low = low
+    self.high = high
+    self.lock = threading.Lock()
+    self._free = collections.deque(range(low, high + 1))
+    self._free.rotate(-random.randrange(len(self._free)))
+    self._used = set()
+
+  def allocate(self):
+    """取得一個可用的 Port，範圍內全部用完時丟出 RuntimeError"""
+    with self.lock:
+      for _ in range(len(self._free)):
+        port = self._free.popleft()
+        if self._is_bindable(port):
+          self._used.add(port)
+          return port
+        self._free.append(port)  # 被其他程式佔用，之後再試
+    raise RuntimeError(f"No free port in range {self.low}-{self.high}")
+
+  def release(self, port):
+    with self.lock:
+      if port in self._used:
+        self._used.remove(port)
+        self._free.append(port)
+
+  def in_use(self):
+    with self.lock:
+      return len(self._used)
+
+  def _is_bindable(self, port):
+    # 不設 SO_REUSEADDR：上傳的遊戲不一定會設，TIME_WAIT 中的 Port 要一併跳過，
+    # 否則遊戲 bind 時會 EADDRINUSE
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+      try:
+        probe.bind(("", port))
+        return True
+      except OSError:
+        return False
@@ -0,0 +1,60 @@
+# server/room_index.py
+
+import bisect
+
+
+def room_seq(room_id):
+  """Room ID ("17-a3f9") 中的序號，即房間的建立順序"""
+  return int(str(room_id).split("-", 1)[0])
+
+
+class RoomIndex:
+  """
+  依建立順序 (Room ID 的序號) 排列的 room_id 集合。
+  新房間的序號一定最大，加入是 O(1) append；
+  分頁時以 bisect 從 cursor (上一頁最後一個序號) 之後開始，不必從頭掃。
+  """
+
+  def __init__(self):
+    self._seqs = []  # 遞增排序
+    self._ids = {}  # {seq: room_id}
+
+  def __len__(self):
+    return len(self._seqs)
+
+  def __contains__(self, room_id):
+    return room_seq(room_id) in self._ids
+
+  def __iter__(self):
+    return (self._ids[seq] for seq in self._seqs)
+
+  def add(self, room_id):
+    seq = room_seq(room_id)
+    if seq in self._ids:
+      return
+    if not self._seqs or seq > self._seqs[-1]:
+      self._seqs.append(seq)
+    else:
+      bisect.insort(self._seqs, seq)
+    self._ids[seq] = room_id
+
+  def discard(self, room_id):
+    seq = room_seq(room_id)
+    if self._ids.pop(seq, None) is None:
+      return
+    del self._seqs[bisect.bisect_left(self._seqs, seq)]
+
+  def iter_from(self, cursor=None, newest_first=True):
+    """從 cursor 之後 (不含) 依序產生 room_id；cursor 為 None 時從頭開始"""
+    if newest_first:
+      end = len(self._seqs)
+      if cursor is not None:
+        end = bisect.bisect_left(self._seqs, cursor)
+      for i in range(end - 1, -1, -1):
+        yield self._ids[self._seqs[i]]
+    else:
+      start = 0
+      if cursor is not None:
+        start = bisect.bisect_right(self._seqs, cursor)
+      for i in range(start, len(self._seqs)):
+        yield self._ids[self._seqs[i]]
@@ -1,97 +1,299 @@
 # server/room_manager.py
 
 import threading
-import socket
-import subprocess
-import sys
 import os
+import collections
+import itertools
+import re
+import secrets
+import shutil
 import time
 
+from server.game_host import DEFAULT_HOST_WORKERS, HostPool, supports_hosting
+from server.port_allocator import ROOM_PORT_MAX, ROOM_PORT_MIN, PortAllocator
+from server.room_index import RoomIndex, room_seq
+from server.stderr_drain import StderrDrain
+from server.warm_pool import WarmPool
+
+# installed_games/<game>/CURRENT 記錄目前上線的版本目錄名稱
+CURRENT_FILE = "CURRENT"
+
+# 舊版 (單一目錄) 安裝搬移後的版本目錄名稱
+LEGACY_RELEASE = "legacy"
+
+# 房間狀態
+ROOM_STARTING = "starting"
+ROOM_READY = "ready"
+ROOM_FAILED = "failed"
+
+# 房間的執行方式：獨立的 server.py 行程 / 在共用的 Game Host 行程中執行
+MODE_PROCESS = "process"
+MODE_HOSTED = "hosted"
+
+# 啟動失敗的房間在列表中保留的秒數
+FAILED_ROOM_TTL = 30.0
+
+# 背景檢查 Game Server 是否結束的間隔 (秒)
+REAP_INTERVAL = 1.0
+
+# 保留最近幾筆已結束房間的紀錄 (結束代碼、時長、stderr)
+ROOM_HISTORY_SIZE = 1000
+
+# Room ID 的隨機後綴長度 (bytes)；序號可預測，後綴需有 64 bits 才無法被暴力猜中
+ROOM_ID_SUFFIX_BYTES = 8
+
+# list_rooms 每頁預設 / 最多回傳的房間數
+ROOM_PAGE_SIZE = 50
+MAX_ROOM_PAGE_SIZE = 200
+
+
+def release_name(version, digest):
+  """版本目錄名稱：<version>-<digest 前 12 碼> (version 只保留安全字元)"""
+  safe_version = re.sub(r"[^0-9A-Za-z._-]", "_", str(version))
+  return f"{safe_version}-{digest[:12]}"
+
 
 class RoomManager:
-  def __init__(self, base_game_dir="server/installed_games"):
-    self.rooms = {}  # {room_id: {'process': PopenObj, 'port': int, 'host': str, 'game': str}}
+  """
+  管理遊戲房間 (Game Server process) 與 Server 端的遊戲安裝目錄。
+
+  每個版本解壓到獨立目錄 installed_games/<game>/<release>/，
+  上線版本由 CURRENT 檔指定 (以 os.replace 原子切換)。
+  房間建立時固定使用當下的版本並計入引用數，
+  舊版本要等沒有房間使用後才由 collect_garbage() 刪除。
+
+  房間另外依建立順序建索引 (全部、各遊戲、各房主、可加入的房間)，
+  list_rooms() 從最小的索引以 cursor 分頁，不需要掃過所有房間。
+
+  背景的 reaper thread 定期回收已結束的 Game Server：
+  移除房間、釋放版本引用與 pipe，並把結束代碼與時長記進 history。
+
+  版本目錄附有 room_handler.py 的遊戲 (見 server/host_worker.py) 不另開行程，
+  房間交給 host_workers 個共用的 host 行程執行 (mode 為 hosted，放到最閒的 host)；
+  host_workers=0 (預設) 時一律用 server.py。hosted 房間之間沒有行程隔離，
+  因此需要明確開啟 (見 server/game_host.py 的 DEFAULT_HOST_WORKERS)。
+  """
+
+  def __init__(
+    self,
+    base_game_dir="server/installed_games",
+    warm_pool_size=0,
+    reap_interval=REAP_INTERVAL,
+    host_workers=DEFAULT_HOST_WORKERS,
+    port_range=(ROOM_PORT_MIN, ROOM_PORT_MAX),
+  ):
+    self.rooms = {}  # {room_id: {'process': PopenObj, 'port': int, 'host': str, 'game': str, 'release': str, 'state': str}}
     self.lock = threading.Lock()
     self.base_game_dir = base_game_dir
+    self.release_refs = {}  # {(game, release): 使用中的房間數}
+    self.room_order = RoomIndex()  # 所有房間
+    self.rooms_by_game = {}  # {game: RoomIndex}
+    self.rooms_by_host = {}  # {host: RoomIndex}
+    self.open_rooms = RoomIndex()  # 已就緒且還有空位的房間
+    self._room_seq = itertools.count(1)
+    self.ports = PortAllocator(*port_range)  # 房間 Port，房間被移除時才歸還
+    self.warm_pool = WarmPool(warm_pool_size)  # 預先啟動的 Game Server worker
+    self.stderr_drain = StderrDrain()  # 持續讀掉執行中 Game Server 的 stderr
+    self.history = collections.deque(maxlen=ROOM_HISTORY_SIZE)  # 已結束的房間
+    self._listeners = []  # 房間被移除時呼叫 callback(room_id, record)
+    # 支援 in-process hosting 的遊戲共用的 host 行程 (第一次使用時才啟動)
+    self.game_host = None
+    if host_workers > 0:
+      self.game_host = HostPool(host_workers, self._game_env(), os.getcwd())
 
     # 建立存放解壓後遊戲的目錄
     if not os.path.exists(self.base_game_dir):
       os.makedirs(self.base_game_dir)
+    self._migrate_flat_installs()
 
-  def _get_free_port(self):
-    """找一個閒置的 Port"""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-      s.bind(("", 0))
-      return s.getsockname()[1]
+    threading.Thread(
+      target=self._reap_loop, args=(reap_interval,), name="room-reaper", daemon=True
+    ).start()
 
-  def create_room(self, host, game_name):
-    """啟動遊戲 Server 並回傳 Room ID 與 Port"""
+  def create_room(self, host, game_name, wait=True, max_players=None):
+    """
+    建立房間並回傳 (Room ID, Port)。
+    lock 內只做預約 (版本、ID、Port，狀態為 starting)，啟動 Game Server 與等待就緒都在 lock 外，
+    不會擋住其他 thread 的 join_room / LIST_ROOMS。
+    wait=True 時等到就緒才回傳 (失敗丟出例外)；wait=False 時在背景啟動，狀態可由 get_state() 查詢。
+    max_players 為房間人數上限 (None 代表不限制)，額滿後 join_room 會拒絕。
+    """
     with self.lock:
-      # 1. 檢查 Server 端有沒有這個遊戲的執行檔
-      game_server_path = os.path.join(self.base_game_dir, game_name, "server.py")
+      # 1. 檢查 Server 端有沒有這個遊戲的執行檔 (使用目前上線的版本)
+      release = self._read_current(game_name)
+      if release is None:
+        raise FileNotFoundError(f"Game not deployed: {game_name}")
+      game_dir = self.get_release_dir(game_name, release)
+      game_server_path = os.path.join(game_dir, "server.py")
 
-      if not os.path.exists(game_server_path):
+      if self.game_host is not None and supports_hosting(game_dir):
+        mode = MODE_HOSTED
+      elif os.path.exists(game_server_path):
+        mode = MODE_PROCESS
+      else:
         raise FileNotFoundError(f"Server script not found: {game_server_path}")
 
       # 2. 分配 ID 與 Port
-      import random
-
-      room_id = str(random.randint(1000, 9999))
-      port = self._get_free_port()
-
-      # 3. 準備啟動參數
-      # 注意：我們會傳入環境變數，確保它能找到 project root (避免 Import Error)
-      env = os.environ.copy()
-      project_root = os.getcwd()  # 假設你是從專案根目錄執行 main.py
-      if "PYTHONPATH" in env:
-        env["PYTHONPATH"] = project_root + os.pathsep + env["PYTHONPATH"]
-      else:
-        env["PYTHONPATH"] = project_root
-
-      cmd = [sys.executable, "server.py", "--port", str(port), "--room_id", room_id]
-
-      print(f"[RoomMgr] Spawning game server for {game_name} on port {port}...")
-      print(f"[RoomMgr] CWD: {os.path.dirname(game_server_path)}")
-      print(f"[RoomMgr] CMD: {cmd}")
+      room_id = self._new_room_id()
+      port = self.ports.allocate()
 
-      # 4. 啟動 Game Server (關鍵修改：加入 stderr 捕捉與錯誤檢查)
-      try:
-        process = subprocess.Popen(
-          cmd,
-          cwd=os.path.dirname(game_server_path),
-          stdout=sys.stdout,  # 讓它的 print 直接顯示在主控台方便看
-          stderr=subprocess.PIPE,  # 捕捉錯誤輸出
-          env=env,  # 傳入環境變數
-          text=True,  # 讓 stderr 讀出來是字串
-        )
-      except Exception as e:
-        print(f"[RoomMgr] Failed to execute subprocess: {e}")
-        raise e
-
-      # 5. 健康檢查：給它 0.5 秒，看它是不是立刻就死了
-      time.sleep(0.5)
-      if process.poll() is not None:
-        # 如果 poll() 不是 None，代表已經結束 (Crashed)
-        _, stderr_output = process.communicate()
-        print(f"!!! [Game Server Crash] !!!")
-        print(f"Error Message:\n{stderr_output}")
-        print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-        raise RuntimeError(
-          f"Game Server crashed immediately. Check console for details."
-        )
-
-      # 6. 記錄房間資訊
+      # 3. 預約房間 (版本計入引用數，GC 不會刪掉它)
       self.rooms[room_id] = {
         "host": host,
         "game": game_name,
         "port": port,
-        "process": process,
+        "process": None,
         "players": [host],
+        "max_players": max_players,
+        "release": release,
+        "state": ROOM_STARTING,
+        "mode": mode,
+        "error": None,
+        "created_at": time.time(),
+        "updated_at": time.monotonic(),
       }
+      self.room_order.add(room_id)
+      self.rooms_by_game.setdefault(game_name, RoomIndex()).add(room_id)
+      self.rooms_by_host.setdefault(host, RoomIndex()).add(room_id)
+      key = (game_name, release)
+      self.release_refs[key] = self.release_refs.get(key, 0) + 1
 
-      print(f"[RoomMgr] Room {room_id} created successfully.")
+    # 4. 在 lock 外啟動 Game Server
+    if not wait:
+      threading.Thread(
+        target=self._launch_room,
+        args=(room_id, game_dir),
+        name=f"room-{room_id}",
+        daemon=True,
+      ).start()
       return room_id, port
 
+    self._launch_room(room_id, game_dir)
+    with self.lock:
+      room = self.rooms[room_id]
+      if room["state"] != ROOM_READY:
+        raise RuntimeError(f"{room['error']}. Check console for details.")
+    return room_id, port
+
+  def _new_room_id(self):
+    """遞增序號 (保證不重複) 加上隨機後綴，例如 17-a3f9"""
+    return f"{next(self._room_seq)}-{secrets.token_hex(ROOM_ID_SUFFIX_BYTES)}"
+
+  def _launch_room(self, room_id, game_dir):
+    """啟動 (或從 warm pool 取得) Game Server，等它開始 listen 後把房間標成 ready"""
+    with self.lock:
+      room = self.rooms[room_id]
+      game_name, release, port = room["game"], room["release"], room["port"]
+
+    if room["mode"] == MODE_HOSTED:
+      self._launch_hosted_room(room_id, game_dir)
+      return
+
+    print(f"[RoomMgr] Starting game server for {game_name} on port {port}...")
+    worker = None
+    try:
+      # warm pool 中預先啟動好的 worker，沒有就現場啟動
+      worker = self.warm_pool.take(game_name, release, game_dir, self._game_env())
+      with self.lock:
+        room["process"] = worker.process
+      try:
+        worker.assign(port, room_id)
+      except OSError:
+        pass  # worker 已經結束，下面的 wait_ready 會回報失敗
+      ready = worker.wait_ready(port)
+    except Exception as e:
+      print(f"[RoomMgr] Failed to execute subprocess: {e}")
+      self._mark_failed(room_id, str(e))
+      return
+
+    if not ready:
+      # 還沒就緒就結束了 (Crashed)
+      worker.kill()
+      _, stderr_output = worker.process.communicate()
+      print(f"!!! [Game Server Crash] !!!")
+      print(f"Error Message:\n{stderr_output}")
+      print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!")
+      self._mark_failed(room_id, "Game Server crashed immediately")
+      return
+
+    with self.lock:
+      room["state"] = ROOM_READY
+      room["updated_at"] = time.monotonic()
+      self._update_open(room_id, room)
+    self.stderr_drain.add(worker.process)
+    print(f"[RoomMgr] Room {room_id} created successfully.")
+
+  def _launch_hosted_room(self, room_id, game_dir):
+    """在共用的 Game Host 行程中開房間 (不需要啟動新的 Python 行程)"""
+    with self.lock:
+      room = self.rooms[room_id]
+    try:
+      ready, error = self.game_host.start_room(room_id, room["port"], game_dir)
+    except Exception as e:
+      ready, error = False, str(e)
+    if not ready:
+      print(f"[RoomMgr] Hosted room {room_id} failed: {error}")
+      self._mark_failed(room_id, error or "Game host failed to start room")
+      return
+
+    with self.lock:
+      room["state"] = ROOM_READY
+      room["updated_at"] = time.monotonic()
+      self._update_open(room_id, room)
+    print(f"[RoomMgr] Room {room_id} created in game host.")
+
+  def _is_alive(self, room_id, room):
+    """(呼叫者需持有 lock) 已就緒的房間是否仍在執行"""
+    if room["mode"] == MODE_HOSTED:
+      return self.game_host.is_running(room_id)
+    return room["process"].poll() is None
+
+  def _update_open(self, room_id, room):
+    """(呼叫者需持有 lock) 依狀態與人數更新可加入房間的索引"""
+    max_players = room["max_players"]
+    if room["state"] == ROOM_READY and (
+      max_players is None or len(room["players"]) < max_players
+    ):
+      self.open_rooms.add(room_id)
+    else:
+      self.open_rooms.discard(room_id)
+
+  def _mark_failed(self, room_id, error):
+    """啟動失敗：房間保留 FAILED_ROOM_TTL 秒讓列表看得到，版本引用立即釋放"""
+    with self.lock:
+      room = self.rooms[room_id]
+      room["state"] = ROOM_FAILED
+      room["error"] = error
+      room["updated_at"] = time.monotonic()
+      self._release_ref(room["game"], room["release"])
+      room["release"] = None
+
+  def get_state(self, room_id):
+    with self.lock:
+      room = self.rooms.get(room_id)
+      return room["state"] if room else None
+
+  def get_stats(self):
+    """管理查詢：房間數量分布、各 host 行程的負載與 warm pool 狀態"""
+    by_state = collections.Counter()
+    by_mode = collections.Counter()
+    with self.lock:
+      for info in self.rooms.values():
+        by_state[info["state"]] += 1
+        by_mode[info["mode"]] += 1
+      total = len(self.rooms)
+      by_game = {game: len(ids) for game, ids in self.rooms_by_game.items()}
+    return {
+      "rooms": total,
+      "by_state": dict(by_state),
+      "by_mode": dict(by_mode),
+      "by_game": by_game,
+      "hosts": self.game_host.stats() if self.game_host else [],
+      "ports_in_use": self.ports.in_use(),
+      "warm_workers": self.warm_pool.total_idle(),
+      "finished": len(self.history),
+    }
+
   def join_room(self, room_id, player_name):
     """加入房間，回傳該房間的 Port"""
     with self.lock:
@@ -99,15 +301,290 @@ class RoomManager:
         return None, "Room not found"
 
       room = self.rooms[room_id]
-      # 檢查 Game Server 是否還活著
-      if room["process"].poll() is not None:
-        del self.rooms[room_id]
+      if room["state"] == ROOM_STARTING:
+        return None, "Room is still starting"
+      if room["state"] == ROOM_FAILED:
+        return None, "Room failed to start"
+      # 檢查 Game Server 是否還活著 (房間由 reaper 回收)
+      if not self._is_alive(room_id, room):
         return None, "Game server is dead"
 
       if player_name not in room["players"]:
+        max_players = room["max_players"]
+        if max_players is not None and len(room["players"]) >= max_players:
+          return None, "Room is full"
         room["players"].append(player_name)
+        self._update_open(room_id, room)
 
       return room["port"], "Joined"
 
+  def _game_env(self):
+    """Game Server 的環境變數，確保它能找到 project root (避免 Import Error)"""
+    env = os.environ.copy()
+    project_root = os.getcwd()  # 假設你是從專案根目錄執行 main.py
+    if "PYTHONPATH" in env:
+      env["PYTHONPATH"] = project_root + os.pathsep + env["PYTHONPATH"]
+    else:
+      env["PYTHONPATH"] = project_root
+    return env
+
+  def _drop_room(self, room_id):
+    """移除房間紀錄並釋放它使用的版本與 Port (呼叫者需持有 lock)，回傳房間資料"""
+    room = self.rooms.pop(room_id)
+    self.room_order.discard(room_id)
+    self.open_rooms.discard(room_id)
+    self._unindex(self.rooms_by_game, room["game"], room_id)
+    self._unindex(self.rooms_by_host, room["host"], room_id)
+    self.ports.release(room["port"])
+    if room["release"] is not None:
+      self._release_ref(room["game"], room["release"])
+    return room
+
+  @staticmethod
+  def _unindex(index, key, room_id):
+    room_ids = index.get(key)
+    if room_ids is not None:
+      room_ids.discard(room_id)
+      if not room_ids:
+        del index[key]
+
+  def get_room(self, room_id):
+    """房間的公開資訊 (不含 process)，不存在時回傳 None"""
+    with self.lock:
+      room = self.rooms.get(room_id)
+      if room is None:
+        return None
+      info = {k: v for k, v in room.items() if k != "process"}
+      info["players"] = list(room["players"])
+      return info
+
+  def list_rooms(
+    self,
+    game=None,
+    host=None,
+    open_only=False,
+    newest_first=True,
+    cursor=None,
+    limit=ROOM_PAGE_SIZE,
+  ):
+    """
+    分頁列出房間 (公開資訊)，回傳 (rooms, next_cursor)。
+    依建立順序排列 (newest_first=False 為最舊的在前)；
+    cursor 為上一頁回傳的 next_cursor，沒有下一頁時 next_cursor 為 None。
+    從符合條件中最小的索引開始走，只看到湊滿一頁 (多看一筆判斷有沒有下一頁) 為止。
+    """
+    limit = max(1, min(limit, MAX_ROOM_PAGE_SIZE))
+    cursor = int(cursor) if cursor is not None else None
+    with self.lock:
+      candidates = [self.open_rooms if open_only else self.room_order]
+      if game is not None:
+        candidates.append(self.rooms_by_game.get(game, RoomIndex()))
+      if host is not None:
+        candidates.append(self.rooms_by_host.get(host, RoomIndex()))
+      index = min(candidates, key=len)
+
+      page = []
+      next_cursor = None
+      for room_id in index.iter_from(cursor, newest_first):
+        room = self.rooms[room_id]
+        if (
+          (game is not None and room["game"] != game)
+          or (host is not None and room["host"] != host)
+          or (open_only and room_id not in self.open_rooms)
+        ):
+          continue
+        if len(page) == limit:
+          next_cursor = str(room_seq(page[-1]["room_id"]))
+          break
+        page.append(self._public_room(room_id, room))
+    return page, next_cursor
+
+  def _public_room(self, room_id, room):
+    """(呼叫者需持有 lock) LIST_ROOMS 回傳的房間資訊"""
+    return {
+      "room_id": room_id,
+      "game_name": room["game"],
+      "host": room["host"],
+      "current_players": len(room["players"]),
+      "max_players": room["max_players"],
+      "port": room["port"],  # 加入房間需要這個 Port
+      "state": room["state"],  # starting / ready / failed
+    }
+
+  def rooms_of_game(self, game_name):
+    with self.lock:
+      return list(self.rooms_by_game.get(game_name, ()))
+
+  def rooms_of_host(self, host):
+    with self.lock:
+      return list(self.rooms_by_host.get(host, ()))
+
+  def _release_ref(self, game_name, release):
+    key = (game_name, release)
+    self.release_refs[key] -= 1
+    if self.release_refs[key] <= 0:
+      del self.release_refs[key]
+
   def get_game_dir(self, game_name):
+    """遊戲的根目錄 (底下是各版本目錄與 CURRENT)"""
     return os.path.join(self.base_game_dir, game_name)
+
+  def get_release_dir(self, game_name, release):
+    return os.path.join(self.base_game_dir, game_name, release)
+
+  def get_current_dir(self, game_name):
+    """目前上線版本的目錄，尚未部署時回傳 None"""
+    release = self._read_current(game_name)
+    return self.get_release_dir(game_name, release) if release else None
+
+  def get_current_release(self, game_name):
+    """目前上線的版本目錄名稱，尚未部署時回傳 None"""
+    return self._read_current(game_name)
+
+  def _read_current(self, game_name):
+    try:
+      with open(os.path.join(self.get_game_dir(game_name), CURRENT_FILE)) as f:
+        return f.read().strip() or None
+    except FileNotFoundError:
+      return None
+
+  def activate_release(self, game_name, release):
+    """把 CURRENT 原子地切換到新版本：之後建立的房間使用新版，既有房間不受影響"""
+    pointer = os.path.join(self.get_game_dir(game_name), CURRENT_FILE)
+    with open(pointer + ".tmp", "w") as f:
+      f.write(release)
+    with self.lock:
+      os.replace(pointer + ".tmp", pointer)
+    # 舊版本的閒置 worker 用不到了
+    self.warm_pool.discard(game_name, keep_release=release)
+
+  def deactivate_game(self, game_name):
+    """下架：移除 CURRENT，不再能建立新房間 (檔案交給 collect_garbage 清理)"""
+    pointer = os.path.join(self.get_game_dir(game_name), CURRENT_FILE)
+    with self.lock:
+      if os.path.exists(pointer):
+        os.remove(pointer)
+    self.warm_pool.discard(game_name)
+
+  def collect_garbage(self, game_name=None):
+    """
+    刪除不是目前版本、也沒有房間在使用的版本目錄；
+    已下架且全部清空的遊戲連同根目錄一起刪除。
+    需與部署在同一個 thread 執行 (Deployer)，避免刪到正在解壓的目錄。
+    """
+    games = [game_name] if game_name else os.listdir(self.base_game_dir)
+    doomed = []
+    # 先回收已結束的房間，釋放它們的版本
+    self.reap()
+    with self.lock:
+      for game in games:
+        game_dir = self.get_game_dir(game)
+        if not os.path.isdir(game_dir):
+          continue
+        current = self._read_current(game)
+        for entry in os.listdir(game_dir):
+          if entry == current or entry == CURRENT_FILE:
+            continue
+          if self.release_refs.get((game, entry), 0) == 0:
+            doomed.append(os.path.join(game_dir, entry))
+
+    for path in doomed:
+      if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+      else:
+        os.remove(path)
+      print(f"[RoomMgr] Removed unused release {path}")
+
+    for game in games:
+      game_dir = self.get_game_dir(game)
+      if os.path.isdir(game_dir) and not os.listdir(game_dir):
+        os.rmdir(game_dir)
+
+  def subscribe(self, callback):
+    """註冊房間移除事件：callback(room_id, record)，在 lock 外呼叫"""
+    self._listeners.append(callback)
+
+  def reap(self):
+    """回收已結束的 Game Server 與過期的失敗房間，回傳被移除的 room_id"""
+    now = time.monotonic()
+    with self.lock:
+      finished = [
+        room_id
+        for room_id, info in self.rooms.items()
+        if (info["state"] == ROOM_READY and not self._is_alive(room_id, info))
+        or (info["state"] == ROOM_FAILED and now - info["updated_at"] > FAILED_ROOM_TTL)
+      ]
+      removed = [(room_id, self._drop_room(room_id)) for room_id in finished]
+
+    for room_id, room in removed:
+      record = self._finish_room(room_id, room)
+      for callback in self._listeners:
+        try:
+          callback(room_id, record)
+        except Exception as e:
+          print(f"[RoomMgr] Room listener failed: {e}")
+    return finished
+
+  def _finish_room(self, room_id, room):
+    """釋放行程的 pipe 並寫入歷史紀錄"""
+    process = room["process"]
+    exit_code = None
+    error = room["error"]
+    stderr_tail = []
+    if room["mode"] == MODE_HOSTED:
+      exit_info = self.game_host.pop_exit(room_id)
+      if exit_info is not None:
+        exit_code = exit_info["exit_code"]
+        error = error or exit_info["error"]
+        stderr_tail = exit_info["stderr_tail"]
+    elif process is not None:
+      exit_code = process.returncode
+      if room["state"] == ROOM_READY:
+        stderr_tail = self.stderr_drain.pop_tail(process.pid)
+      if process.stdin and not process.stdin.closed:
+        try:
+          process.stdin.close()
+        except OSError:
+          pass
+
+    record = {
+      "room_id": room_id,
+      "game": room["game"],
+      "host": room["host"],
+      "state": room["state"],
+      "mode": room["mode"],
+      "exit_code": exit_code,
+      "duration": round(time.time() - room["created_at"], 3),
+      "error": error,
+      "stderr_tail": stderr_tail,
+    }
+    self.history.append(record)
+    print(
+      f"[RoomMgr] Room {room_id} ({room['game']}) ended: "
+      f"exit={exit_code}, {record['duration']}s"
+    )
+    return record
+
+  def _reap_loop(self, interval):
+    while True:
+      time.sleep(interval)
+      try:
+        self.reap()
+      except Exception as e:
+        print(f"[RoomMgr] Reaper error: {e}")
+
+  def _migrate_flat_installs(self):
+    """舊版直接解壓在 installed_games/<game>/ 的遊戲，搬進 legacy 版本目錄"""
+    for game in os.listdir(self.base_game_dir):
+      game_dir = self.get_game_dir(game)
+      if not os.path.isdir(game_dir) or self._read_current(game):
+        continue
+      entries = os.listdir(game_dir)
+      if "server.py" not in entries:
+        continue
+      legacy_dir = self.get_release_dir(game, LEGACY_RELEASE)
+      os.makedirs(legacy_dir)
+      for entry in entries:
+        os.replace(os.path.join(game_dir, entry), os.path.join(legacy_dir, entry))
+      self.activate_release(game, LEGACY_RELEASE)
+      print(f"[RoomMgr] Migrated flat install of {game} to {legacy_dir}")
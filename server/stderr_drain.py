@@ -0,0 +1,123 @@
+# server/stderr_drain.py
+
+import collections
+import os
+import selectors
+import threading
+
+# 每個 Game Server 保留最後幾行 stderr (結束時記進歷史紀錄)
+STDERR_TAIL_LINES = 20
+
+# 單行保留的最大長度 (bytes)，避免沒有換行的輸出無限累積
+STDERR_LINE_LIMIT = 1000
+
+# 每次從 pipe 讀取的大小
+READ_SIZE = 4096
+
+# 取出 stderr 前等待 pipe 讀到 EOF 的時間 (秒)，讓最後幾行也能收到
+EOF_WAIT = 0.2
+
+# selectors 能否監看 pipe (Windows 只支援 socket)
+SELECT_PIPES = os.name == "posix"
+
+
+class StderrDrain:
+  """
+  持續讀掉 Game Server 的 stderr，避免 pipe 滿了讓遊戲卡住，
+  並保留最後 STDERR_TAIL_LINES 行供 crash 分析。
+
+  POSIX 上所有 pipe 由同一個 thread 以 selector 讀取；
+  其他平台每個行程各開一個 daemon thread。EOF 時自動關閉 pipe。
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self._tails = {}  # {pid: deque[str]}
+    self._partial = {}  # {pid: 還沒遇到換行的 bytes}
+    self._closed = {}  # {pid: threading.Event}，pipe 讀到 EOF 時 set
+    if SELECT_PIPES:
+      self._selector = selectors.DefaultSelector()
+      # 用一條 pipe 叫醒 select，讓新註冊的 stderr 立刻生效
+      self._wakeup_r, self._wakeup_w = os.pipe()
+      self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+      self._pending = []
+      threading.Thread(target=self._run, name="stderr-drain", daemon=True).start()
+
+  def add(self, process):
+    """開始讀取 process.stderr"""
+    pid = process.pid
+    with self.lock:
+      self._tails[pid] = collections.deque(maxlen=STDERR_TAIL_LINES)
+      self._partial[pid] = b""
+      self._closed[pid] = threading.Event()
+    if SELECT_PIPES:
+      with self.lock:
+        self._pending.append(process)
+      os.write(self._wakeup_w, b"\0")
+    else:
+      threading.Thread(
+        target=self._drain_blocking, args=(process,), daemon=True
+      ).start()
+
+  def pop_tail(self, pid, timeout=EOF_WAIT):
+    """取出並忘記該行程收集到的 stderr 最後幾行 (行程應已結束)"""
+    with self.lock:
+      closed = self._closed.get(pid)
+    if closed is not None:
+      closed.wait(timeout)
+    with self.lock:
+      tail = self._tails.pop(pid, ())
+      partial = self._partial.pop(pid, b"")
+      self._closed.pop(pid, None)
+    lines = list(tail)
+    if partial:
+      lines.append(partial.decode(errors="replace"))
+    return lines
+
+  def _feed(self, pid, data):
+    with self.lock:
+      if pid not in self._tails:
+        return
+      buf = self._partial[pid] + data
+      *lines, partial = buf.split(b"\n")
+      self._partial[pid] = partial[:STDERR_LINE_LIMIT]
+      for line in lines:
+        line = line[:STDERR_LINE_LIMIT]
+        self._tails[pid].append(line.decode(errors="replace"))
+
+  def _eof(self, process):
+    process.stderr.close()
+    with self.lock:
+      closed = self._closed.get(process.pid)
+    if closed is not None:
+      closed.set()
+
+  def _run(self):
+    while True:
+      for key, _ in self._selector.select():
+        if key.data is None:
+          os.read(self._wakeup_r, READ_SIZE)
+          with self.lock:
+            pending, self._pending = self._pending, []
+          for process in pending:
+            self._selector.register(
+              process.stderr.fileno(), selectors.EVENT_READ, process
+            )
+          continue
+
+        process = key.data
+        data = os.read(key.fd, READ_SIZE)
+        if data:
+          self._feed(process.pid, data)
+        else:
+          self._selector.unregister(key.fd)
+          self._eof(process)
+
+  def _drain_blocking(self, process):
+    fd = process.stderr.fileno()
+    while True:
+      data = os.read(fd, READ_SIZE)
+      if not data:
+        break
+      self._feed(process.pid, data)
+    self._eof(process)
@@ -0,0 +1,145 @@
+# server/transfer_server.py
+
+import secrets
+import threading
+import time
+
+from common.constants import Command
+from common.protocol import recv_request, send_request
+
+# Token 發出後多久內必須在資料通道上使用，逾時作廢
+TRANSFER_TOKEN_TTL = 30.0
+
+# 資料連線連上後，多久內要送出帶 token 的第一個封包
+HANDSHAKE_TIMEOUT = 10.0
+
+# 串流檔案時對方多久沒有讀取 / 送出資料就中斷 (每次 send / recv 各自計時)
+TRANSFER_IDLE_TIMEOUT = 60.0
+
+# 沒有新連線時，每隔多久清掉逾時的 token (執行 cleanup，例如刪除差異下載的暫存檔)
+TOKEN_SWEEP_INTERVAL = 5.0
+
+
+class TransferTokens:
+  """
+  資料通道的一次性 token。
+  控制連線上的 handler 先檢查完請求，把實際的傳輸 (transfer(sock)) 登記起來換得 token，
+  Client 帶著 token 連上資料通道時取出執行。
+  cleanup 在傳輸結束或 token 逾時作廢時呼叫 (例如刪除差異下載的暫存檔)。
+  """
+
+  def __init__(self, ttl=TRANSFER_TOKEN_TTL):
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self._tokens = {}  # {token: (expires_at, cmd, transfer, cleanup)}
+
+  def issue(self, cmd, transfer, cleanup=None):
+    token = secrets.token_urlsafe(16)
+    with self.lock:
+      expired = self._pop_expired()
+      self._tokens[token] = (time.monotonic() + self.ttl, cmd, transfer, cleanup)
+    self._run_cleanups(expired)
+    return token
+
+  def claim(self, token, cmd):
+    """取出 token 對應的 (transfer, cleanup)，只能用一次；無效、逾時或指令不符時回傳 None"""
+    with self.lock:
+      expired = self._pop_expired()
+      entry = self._tokens.get(token) if isinstance(token, str) else None
+      if entry is not None and entry[1] == cmd:
+        del self._tokens[token]
+      else:
+        entry = None
+    self._run_cleanups(expired)
+    return None if entry is None else (entry[2], entry[3])
+
+  def sweep(self):
+    """作廢所有逾時的 token 並執行它們的 cleanup"""
+    with self.lock:
+      expired = self._pop_expired()
+    self._run_cleanups(expired)
+
+  def pending(self):
+    with self.lock:
+      return len(self._tokens)
+
+  def _pop_expired(self):
+    """(呼叫者需持有 lock) 移除逾時的 token，回傳它們的 cleanup"""
+    now = time.monotonic()
+    expired = [t for t, entry in self._tokens.items() if entry[0] <= now]
+    return [self._tokens.pop(t)[3] for t in expired]
+
+  def _run_cleanups(self, cleanups):
+    for cleanup in cleanups:
+      if cleanup is not None:
+        cleanup()
+
+
+class TransferServer:
+  """
+  資料通道：另一個 Port 專門傳送遊戲包，大檔案串流時控制連線仍可處理其他請求，
+  同一個玩家也能同時下載多個遊戲。
+
+  每條資料連線只做一次傳輸：第一個封包為 UPLOAD_GAME / UPDATE_GAME / DOWNLOAD_GAME，
+  內容只有 {"token"}；token 有效時由 transfer 接手 (回覆、串流檔案與結果)，否則回覆 ERROR。
+  每條資料連線一個 thread，兩種 Lobby engine 共用。
+  串流期間 socket 保留 idle_timeout，停止讀寫的對方不會一直佔住 thread 與傳輸。
+  accept 每 sweep_interval 秒逾時一次順便清掉逾時的 token，
+  Server 閒置時暫存檔也不會留得比 token 的 TTL 久太多。
+  """
+
+  def __init__(
+    self,
+    server_socket,
+    tokens=None,
+    idle_timeout=TRANSFER_IDLE_TIMEOUT,
+    sweep_interval=TOKEN_SWEEP_INTERVAL,
+  ):
+    self.server_socket = server_socket
+    self.tokens = tokens or TransferTokens()
+    self.idle_timeout = idle_timeout
+    self.sweep_interval = sweep_interval
+    self.port = server_socket.getsockname()[1]
+
+  def start(self):
+    threading.Thread(target=self._serve, name="transfer-server", daemon=True).start()
+
+  def issue(self, cmd, transfer, cleanup=None):
+    return self.tokens.issue(cmd, transfer, cleanup)
+
+  def _serve(self):
+    self.server_socket.settimeout(self.sweep_interval)
+    while True:
+      try:
+        sock, addr = self.server_socket.accept()
+      except TimeoutError:
+        self.tokens.sweep()
+        continue
+      except OSError:
+        return  # listening socket 已關閉
+      threading.Thread(
+        target=self._handle, args=(sock, addr), name="transfer", daemon=True
+      ).start()
+
+  def _handle(self, sock, addr):
+    with sock:
+      sock.settimeout(HANDSHAKE_TIMEOUT)
+      cmd, data = recv_request(sock)
+      if cmd is None:
+        return
+
+      claimed = self.tokens.claim(data.get("token"), cmd)
+      if claimed is None:
+        send_request(sock, Command.ERROR, {"msg": "Invalid or expired transfer token"})
+        return
+
+      # socket.sendfile 支援有限的 timeout (每次等待可寫時計時)，逾時丟出 TimeoutError
+      sock.settimeout(self.idle_timeout)
+      transfer, cleanup = claimed
+      try:
+        transfer(sock)
+      except Exception as e:
+        print(f"[Transfer] Error serving {addr}: {e}")
+      finally:
+        if cleanup is not None:
+          cleanup()
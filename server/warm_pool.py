@@ -0,0 +1,229 @@
+# server/warm_pool.py
+
+import collections
+import json
+import os
+import queue
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+WORKER_SCRIPT = os.path.join(
+  os.path.dirname(os.path.abspath(__file__)), "game_worker.py"
+)
+
+# 每個遊戲 (版本) 預先啟動的閒置 worker 數
+WARM_POOL_SIZE = 1
+
+# 最多替幾個最近被玩的遊戲保留 warm worker (其餘的閒置 worker 會被關掉)
+WARM_POOL_MAX_GAMES = 8
+
+# 等待 worker 啟動完成 / 遊戲開始 listen 的時間上限 (秒)
+WORKER_IDLE_TIMEOUT = 10.0
+READY_TIMEOUT = 5.0
+
+# status pipe 需要 pass_fds (POSIX)；其他平台改用 bind 探測 Port
+HANDSHAKE_SUPPORTED = os.name == "posix"
+PROBE_INTERVAL = 0.05
+
+
+class GameWorker:
+  """
+  一個 game_worker.py 子行程。
+  stdin 用來送出房間指派，另開一條 status pipe 接收 idle / ready 回報。
+  """
+
+  def __init__(self, cwd, env):
+    self.cwd = cwd
+    self._buf = b""
+    self._status_fd = None
+    self._closed = False  # status pipe 已 EOF (worker 結束)
+    cmd = [sys.executable, WORKER_SCRIPT]
+    popen_kwargs = {}
+    if HANDSHAKE_SUPPORTED:
+      self._status_fd, write_fd = os.pipe()
+      cmd += ["--status-fd", str(write_fd)]
+      popen_kwargs["pass_fds"] = (write_fd,)
+
+    try:
+      self.process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        stdin=subprocess.PIPE,
+        stdout=sys.stdout,  # 讓它的 print 直接顯示在主控台方便看
+        stderr=subprocess.PIPE,  # 捕捉錯誤輸出
+        env=env,
+        text=True,
+        **popen_kwargs,
+      )
+    finally:
+      if HANDSHAKE_SUPPORTED:
+        os.close(write_fd)
+
+  def wait_for(self, event, timeout):
+    """等待 worker 回報 event；worker 結束 (EOF) 或逾時回傳 False"""
+    deadline = time.monotonic() + timeout
+    while True:
+      while b"\n" in self._buf:
+        line, self._buf = self._buf.split(b"\n", 1)
+        if line.decode() == event:
+          return True
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return False
+      readable, _, _ = select.select([self._status_fd], [], [], remaining)
+      if not readable:
+        return False
+      chunk = os.read(self._status_fd, 4096)
+      if not chunk:
+        self._closed = True
+        return False
+      self._buf += chunk
+
+  def assign(self, port, room_id):
+    self.process.stdin.write(json.dumps({"port": port, "room_id": room_id}) + "\n")
+    self.process.stdin.flush()
+
+  def wait_ready(self, port, timeout=READY_TIMEOUT):
+    """
+    等遊戲真正開始 listen。逾時但行程還活著時視為就緒
+    (遊戲可能不是用 socket.listen 接受連線)。
+    """
+    if HANDSHAKE_SUPPORTED:
+      ready = self.wait_for("ready", timeout)
+      self.close_status()
+      if self._closed:
+        return False  # 還沒 listen 就結束了
+    else:
+      ready = self._probe_port(port, timeout)
+    if not ready and self.process.poll() is None:
+      print(f"[WarmPool] No readiness signal from {self.cwd}, assuming ready")
+      return True
+    return ready
+
+  def _probe_port(self, port, timeout):
+    """
+    沒有 status pipe 時改用 bind 探測：Port 已被綁定 (EADDRINUSE) 代表遊戲開始 listen 了。
+    不用 connect 探測，以免佔掉遊戲的玩家名額。
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+      if self.process.poll() is not None:
+        return False
+      with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        try:
+          probe.bind(("", port))
+        except OSError:
+          return True
+      time.sleep(PROBE_INTERVAL)
+    return False
+
+  def close_status(self):
+    if self._status_fd is not None:
+      os.close(self._status_fd)
+      self._status_fd = None
+
+  def kill(self):
+    self.close_status()
+    if self.process.poll() is None:
+      self.process.kill()
+    self.process.wait()
+
+
+class WarmPool:
+  """
+  依 (遊戲, 版本) 保留預先啟動好的閒置 GameWorker。
+  create_room 取用後在背景補回，只保留最近被玩的 max_games 個遊戲；
+  遊戲切換版本或下架時，舊版本的閒置 worker 會被關掉。
+  """
+
+  def __init__(self, size=WARM_POOL_SIZE, max_games=WARM_POOL_MAX_GAMES):
+    self.size = size if HANDSHAKE_SUPPORTED else 0
+    self.max_games = max_games
+    self.lock = threading.Lock()
+    # {(game, release): deque[GameWorker]}，順序即最近使用順序 (最舊的在前)
+    self._idle = collections.OrderedDict()
+    self._refill_queue = queue.Queue()
+    if self.size > 0:
+      threading.Thread(target=self._refill_loop, name="warm-pool", daemon=True).start()
+
+  def take(self, game_name, release, cwd, env):
+    """取出一個閒置 worker；沒有時直接啟動新的 (cold start)"""
+    key = (game_name, release)
+    worker = None
+    with self.lock:
+      workers = self._idle.get(key)
+      while workers:
+        candidate = workers.popleft()
+        if candidate.process.poll() is None:
+          worker = candidate
+          break
+        candidate.kill()
+
+    if self.size > 0:
+      self._refill_queue.put((key, cwd, env))
+    return worker or GameWorker(cwd, env)
+
+  def discard(self, game_name, keep_release=None):
+    """關掉某遊戲除了 keep_release 以外所有版本的閒置 worker"""
+    with self.lock:
+      doomed = [
+        key for key in self._idle if key[0] == game_name and key[1] != keep_release
+      ]
+      workers = [w for key in doomed for w in self._idle.pop(key)]
+    for worker in workers:
+      worker.kill()
+
+  def idle_count(self, game_name, release):
+    with self.lock:
+      return len(self._idle.get((game_name, release), ()))
+
+  def total_idle(self):
+    with self.lock:
+      return sum(len(workers) for workers in self._idle.values())
+
+  def shutdown(self):
+    with self.lock:
+      workers = [w for ws in self._idle.values() for w in ws]
+      self._idle.clear()
+    for worker in workers:
+      worker.kill()
+
+  def _refill_loop(self):
+    while True:
+      key, cwd, env = self._refill_queue.get()
+      try:
+        self._refill(key, cwd, env)
+      except Exception as e:
+        print(f"[WarmPool] Failed to prestart worker for {key[0]}: {e}")
+
+  def _refill(self, key, cwd, env):
+    evicted = []
+    with self.lock:
+      workers = self._idle.setdefault(key, collections.deque())
+      self._idle.move_to_end(key)
+      missing = self.size - len(workers)
+      # 超過 max_games 時關掉最久沒人玩的遊戲的 worker
+      while len(self._idle) > self.max_games:
+        _, old_workers = self._idle.popitem(last=False)
+        evicted.extend(old_workers)
+    for worker in evicted:
+      worker.kill()
+
+    for _ in range(missing):
+      if not os.path.isdir(cwd):
+        return  # 版本已被清掉
+      worker = GameWorker(cwd, env)
+      if not worker.wait_for("idle", WORKER_IDLE_TIMEOUT):
+        worker.kill()
+        print(f"[WarmPool] Worker for {key[0]} failed to start")
+        return
+      with self.lock:
+        if key in self._idle:
+          self._idle[key].append(worker)
+          worker = None
+      if worker is not None:
+        worker.kill()  # 這段期間版本被淘汰了
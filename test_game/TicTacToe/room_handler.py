@@ -0,0 +1,114 @@
+import asyncio
+
+# 與 server.py 相同的遊戲邏輯，改寫成 asyncio 版本，
+# 讓 Lobby 可以把房間放進共用的 Game Host 行程執行 (不必每房一個行程)
+
+WIN_CONDITIONS = [
+  (0, 1, 2),
+  (3, 4, 5),
+  (6, 7, 8),  # Rows
+  (0, 3, 6),
+  (1, 4, 7),
+  (2, 5, 8),  # Cols
+  (0, 4, 8),
+  (2, 4, 6),  # Diagonals
+]
+
+
+class RoomHandler:
+  def __init__(self, room):
+    self.room = room
+    self.players = []  # 存放 [(reader, writer), ...]
+    self.board = [" " for _ in range(9)]
+    self.current_turn = 0  # 0 for Player 1 (X), 1 for Player 2 (O)
+    print(f"[Game Room {room.room_id}] Listening on port {room.port}")
+
+  async def on_player(self, reader, writer):
+    """每位玩家連線時呼叫；第二位玩家到齊後開始遊戲"""
+    if len(self.players) >= 2:
+      return  # 房間已滿 (連線會被關閉)
+
+    self.players.append((reader, writer))
+    player_id = len(self.players)
+    print(f"[Game Room {self.room.room_id}] Player {player_id} connected")
+
+    msg = f"Welcome! You are Player {player_id} ({'X' if player_id == 1 else 'O'})."
+    if player_id == 1:
+      msg += " Waiting for opponent..."
+      await self.send_msg(writer, msg)
+      # 第一位玩家的連線保持開著，由第二位玩家的 task 進行遊戲，房間結束時被取消
+      await asyncio.Event().wait()
+
+    await self.send_msg(writer, msg)
+    await self.broadcast("Game Start!")
+    try:
+      await self.game_loop()
+    finally:
+      self.room.close()
+
+  async def game_loop(self):
+    while True:
+      current_idx = self.current_turn % 2
+      reader, player = self.players[current_idx]
+      _, opponent = self.players[(self.current_turn + 1) % 2]
+      symbol = "X" if current_idx == 0 else "O"
+
+      await self.broadcast(f"\n{self.format_board()}\n")
+      await self.send_msg(opponent, "Waiting for opponent's move...")
+
+      while True:
+        await self.send_msg(
+          player, f"Your turn ({symbol}). Enter position (0-8): INPUT_REQ"
+        )
+        data = await reader.read(1024)
+        if not data:  # Client 斷線
+          print(f"Player {current_idx + 1} disconnected.")
+          return
+        move_str = data.decode("utf-8").strip()
+        if move_str.isdigit():
+          pos = int(move_str)
+          if 0 <= pos <= 8 and self.board[pos] == " ":
+            self.board[pos] = symbol
+            break
+          await self.send_msg(player, "Invalid move. Try again.")
+        else:
+          await self.send_msg(player, "Invalid input. Please enter a number 0-8.")
+
+      winner = self.check_winner()
+      if winner:
+        await self.broadcast(f"\n{self.format_board()}\n")
+        if winner == "Draw":
+          await self.broadcast("Game Over! It's a Draw!")
+        else:
+          await self.broadcast(f"Game Over! Player {current_idx + 1} ({winner}) wins!")
+        return
+      self.current_turn += 1
+
+  def format_board(self):
+    b = self.board
+    return (
+      f" {b[0]} | {b[1]} | {b[2]} \n"
+      f"---+---+---\n"
+      f" {b[3]} | {b[4]} | {b[5]} \n"
+      f"---+---+---\n"
+      f" {b[6]} | {b[7]} | {b[8]} "
+    )
+
+  def check_winner(self):
+    for x, y, z in WIN_CONDITIONS:
+      if self.board[x] == self.board[y] == self.board[z] and self.board[x] != " ":
+        return self.board[x]
+    if " " not in self.board:
+      return "Draw"
+    return None
+
+  async def send_msg(self, writer, msg):
+    try:
+      writer.write(msg.encode("utf-8"))
+      await writer.drain()
+    except ConnectionError as e:
+      print(f"Send error: {e}")
+
+  async def broadcast(self, msg):
+    for _, writer in self.players:
+      await self.send_msg(writer, msg)
@@ -0,0 +1,127 @@
+# tests/test_blob_store.py
+
+import hashlib
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.blob_store import BlobStore, hash_file
+from server.db_manager import DBManager
+
+
+def write_temp(store, content):
+  path = store.new_temp_path()
+  with open(path, "wb") as f:
+    f.write(content)
+  return path
+
+
+def test_dedup_and_refcount():
+  """相同內容只存一份，引用數歸零才刪除檔案"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+
+    d1 = store.put(write_temp(store, b"same bytes"))
+    d2 = store.put(write_temp(store, b"same bytes"))
+    assert d1 == d2
+    assert os.listdir(store.tmp_dir) == []
+    assert hash_file(store.path(d1)) == d1
+
+    store.release(d1)
+    assert os.path.exists(store.path(d1))
+    store.release(d1)
+    assert not os.path.exists(store.path(d1))
+    db.close()
+
+
+def test_verify_detects_corruption():
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+
+    digest = store.put(write_temp(store, os.urandom(4096)))
+    assert store.verify(digest)
+    with open(store.path(digest), "ab") as f:
+      f.write(b"tampered")
+    assert not store.verify(digest)
+    db.close()
+
+
+def test_pinned_blob_outlives_release():
+  """傳輸中 (pin) 的 blob 引用數歸零後延後到 unpin 才刪除；期間重新上傳則保留"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+
+    digest = store.put(write_temp(store, b"old release"))
+    store.pin(digest)
+    store.pin(digest)
+    store.release(digest)
+    assert os.path.exists(store.path(digest))
+    store.unpin(digest)
+    assert os.path.exists(store.path(digest))
+    store.unpin(digest)
+    assert not os.path.exists(store.path(digest))
+
+    digest = store.put(write_temp(store, b"old release"))
+    store.pin(digest)
+    store.release(digest)
+    assert store.put(write_temp(store, b"old release")) == digest
+    store.unpin(digest)
+    assert os.path.exists(store.path(digest)) and store.pinned(digest) == 0
+    db.close()
+
+
+def test_segment_hashes():
+  """每段各自的 sha256，最後一段可以不滿；內容改變後重新計算"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+
+    content = os.urandom(10_000)
+    digest = store.put(write_temp(store, content))
+    expected = [
+      hashlib.sha256(content[i : i + 4096]).hexdigest() for i in (0, 4096, 8192)
+    ]
+    assert store.segment_hashes(digest, 4096) == expected
+    assert store.segment_hashes(digest, 5000) == [
+      hashlib.sha256(content[:5000]).hexdigest(),
+      hashlib.sha256(content[5000:]).hexdigest(),
+    ]
+
+    with open(store.path(digest), "ab") as f:
+      f.write(b"x")
+    assert len(store.segment_hashes(digest, 5000)) == 3
+    db.close()
+
+
+def test_migrate_legacy_package():
+  """舊版 storage/{name}_{version}.zip 啟動時要搬進 blob store"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    storage = os.path.join(tmp, "storage")
+    store = BlobStore(db, storage)
+
+    db.add_game("My Game", "1.0", "dev", "", "CLI", "game.py")
+    with open(os.path.join(storage, "My_Game_1.0.zip"), "wb") as f:
+      f.write(b"legacy package")
+
+    store.migrate_legacy()
+    version, digest = db.get_game_release("My Game")
+    assert version == "1.0" and digest
+    assert os.path.exists(store.path(digest))
+    assert not os.path.exists(os.path.join(storage, "My_Game_1.0.zip"))
+    assert db.list_games_without_blob() == []
+    db.close()
+
+
+if __name__ == "__main__":
+  test_dedup_and_refcount()
+  test_verify_detects_corruption()
+  test_pinned_blob_outlives_release()
+  test_segment_hashes()
+  test_migrate_legacy_package()
+  print("\n>>> Blob Store Test SUCCESS! <<<")
@@ -0,0 +1,91 @@
+# tests/test_catalogue.py
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import HEADER_STRUCT, decode_payload
+from server.catalogue import CatalogueCache, CHANGELOG_SIZE
+
+
+class FakeDB:
+  """只實作 list_all_games 的假 DBManager，並記錄被查詢的次數"""
+
+  def __init__(self):
+    self.games = {}
+    self.queries = 0
+
+  def list_all_games(self):
+    self.queries += 1
+    return [dict(g) for g in sorted(self.games.values(), key=lambda g: g["id"])]
+
+  def put(self, game_id, name, version="1.0"):
+    self.games[name] = {"id": game_id, "name": name, "version": version}
+
+
+def decode(frame):
+  _, cmd_value = HEADER_STRUCT.unpack(frame[: HEADER_STRUCT.size])
+  return decode_payload(cmd_value, frame[HEADER_STRUCT.size :])[1]
+
+
+def test_cached_bytes_and_invalidation():
+  db = FakeDB()
+  for i in range(10):
+    db.put(i, f"game_{i}")
+  cache = CatalogueCache(db)
+
+  first = cache.get_response()
+  assert cache.get_response() is first  # 快取命中直接回傳同一份 bytes
+  assert db.queries == 1
+  assert len(decode(first)["games"]) == 10
+
+  db.put(0, "game_0", "2.0")
+  cache.invalidate("game_0")
+  full = decode(cache.get_response())
+  assert full["games"][0]["version"] == "2.0"
+  assert full["etag"] != decode(first)["etag"]
+
+
+def test_delta_and_not_modified():
+  db = FakeDB()
+  for i in range(10):
+    db.put(i, f"game_{i}")
+  cache = CatalogueCache(db)
+  etag = decode(cache.get_response())["etag"]
+
+  assert decode(cache.get_response(etag))["not_modified"]
+
+  db.put(3, "game_3", "1.1")
+  cache.invalidate("game_3")
+  del db.games["game_5"]
+  cache.invalidate("game_5")
+
+  delta = decode(cache.get_response(etag))
+  assert delta["delta"]
+  assert [g["name"] for g in delta["changed"]] == ["game_3"]
+  assert delta["removed"] == ["game_5"]
+  assert decode(cache.get_response(delta["etag"]))["not_modified"]
+
+
+def test_unknown_or_expired_etag_falls_back_to_full():
+  db = FakeDB()
+  for i in range(4):
+    db.put(i, f"game_{i}")
+  cache = CatalogueCache(db)
+  etag = decode(cache.get_response())["etag"]
+
+  # 其他次啟動的 etag
+  assert "games" in decode(cache.get_response("deadbeef:0"))
+
+  # changelog 被截斷後，舊 etag 只能拿完整列表
+  for _ in range(CHANGELOG_SIZE + 1):
+    cache.invalidate("game_0")
+  assert "games" in decode(cache.get_response(etag))
+
+
+if __name__ == "__main__":
+  test_cached_bytes_and_invalidation()
+  test_delta_and_not_modified()
+  test_unknown_or_expired_etag_falls_back_to_full()
+  print("\n>>> Catalogue Cache Test SUCCESS! <<<")
@@ -0,0 +1,71 @@
+# tests/test_codec.py
+
+import os
+import socket
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.codec import CODEC_JSON, CODEC_MSGPACK, choose_codec, packb, unpackb
+from common.constants import Command
+from common.protocol import (
+  FLAG_BINARY,
+  HEADER_STRUCT,
+  encode_frame,
+  get_codec,
+  recv_request,
+  send_request,
+  set_codec,
+)
+
+
+def test_msgpack_roundtrip():
+  """純 Python 版本的各種型別與長度邊界都能還原"""
+  ints = [0, 127, 128, 255, 256, 65536, 2**32, 2**64 - 1]
+  ints += [-1, -32, -33, -129, -32769, -(2**31) - 1, -(2**63)]
+  strings = ["", "a" * 31, "b" * 32, "中文" * 40000]
+  containers = [[], [1] * 15, [1] * 16, [1] * 70000, {}, {str(i): i for i in range(16)}]
+  nested = [{"k": {"n": [1, {"x": None}]}}, b"\x00\xff" * 300, None, True, False, 1.5]
+  for obj in ints + strings + containers + nested:
+    assert unpackb(packb(obj)) == obj, repr(obj)[:40]
+
+
+def test_msgpack_wire_format():
+  """與 msgpack 規格 (及 C 實作) 的輸出相同，可以互通"""
+  assert packb({"a": 1}) == b"\x81\xa1a\x01"
+  assert packb([1, -1, None, True]) == b"\x94\x01\xff\xc0\xc3"
+  assert packb(1.5) == b"\xcb\x3f\xf8" + b"\x00" * 6
+  assert unpackb(b"\xca\x3f\xc0\x00\x00") == 1.5
+  for bad in (b"", b"\x92\x01", b"\x01\x02", b"\xc1", b"\xd9\x05ab"):
+    try:
+      unpackb(bad)
+      assert False, bad
+    except ValueError:
+      pass
+
+
+def test_codec_negotiation_over_socket():
+  """送出端依 set_codec 編碼並設定 flag，接收端從 flag 判斷，不需事先知道"""
+  assert choose_codec(["cbor", CODEC_MSGPACK, CODEC_JSON]) == CODEC_MSGPACK
+  assert choose_codec(None) == CODEC_JSON
+
+  frame = encode_frame(Command.LIST_ROOMS, {"rooms": []}, CODEC_MSGPACK)
+  _, cmd_value = HEADER_STRUCT.unpack(frame[: HEADER_STRUCT.size])
+  assert cmd_value == Command.LIST_ROOMS.value | FLAG_BINARY
+
+  a, b = socket.socketpair()
+  with a, b:
+    assert get_codec(a) == CODEC_JSON
+    set_codec(a, CODEC_MSGPACK)
+    payload = {"games": [{"name": "遊戲", "rating": 4.5, "count": 3}], "etag": None}
+    send_request(a, Command.LIST_ALL_GAMES, payload)
+    assert recv_request(b) == (Command.LIST_ALL_GAMES, payload)
+    send_request(b, Command.LOGIN, {"status": 0})  # b 仍是 JSON
+    assert recv_request(a) == (Command.LOGIN, {"status": 0})
+
+
+if __name__ == "__main__":
+  test_msgpack_roundtrip()
+  test_msgpack_wire_format()
+  test_codec_negotiation_over_socket()
+  print("\n>>> Codec Test SUCCESS! <<<")
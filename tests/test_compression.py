@@ -0,0 +1,102 @@
+# tests/test_compression.py
+
+import os
+import socket
+import sys
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.codec import CODEC_MSGPACK
+from common.constants import Command
+from common.protocol import (
+  COMPRESS_THRESHOLD,
+  COMPRESSION_ZLIB,
+  FLAG_BINARY,
+  FLAG_COMPRESSED,
+  HEADER_STRUCT,
+  choose_compression,
+  decode_payload,
+  encode_frame,
+  get_compression,
+  recv_request,
+  send_request,
+  set_compression,
+)
+
+
+def _rooms(n):
+  return {
+    "rooms": [
+      {"room_id": f"{i}-abcd", "game_name": "TicTacToe", "host": f"p{i}"}
+      for i in range(n)
+    ]
+  }
+
+
+def _header(frame):
+  return HEADER_STRUCT.unpack(frame[: HEADER_STRUCT.size])
+
+
+def test_compress_large_payloads_only():
+  """超過門檻的 Payload 才壓縮，壓縮後要明顯變小；小封包維持原樣"""
+  small = encode_frame(Command.LIST_ROOMS, {"rooms": []}, compress=True)
+  assert not _header(small)[1] & FLAG_COMPRESSED
+
+  plain = encode_frame(Command.LIST_ROOMS, _rooms(200))
+  packed = encode_frame(Command.LIST_ROOMS, _rooms(200), compress=True)
+  length, cmd_value = _header(packed)
+  assert cmd_value == Command.LIST_ROOMS.value | FLAG_COMPRESSED
+  assert length == len(packed) - HEADER_STRUCT.size
+  assert len(plain) > COMPRESS_THRESHOLD and len(packed) * 4 < len(plain)
+  assert decode_payload(cmd_value, packed[HEADER_STRUCT.size :]) == (
+    Command.LIST_ROOMS,
+    _rooms(200),
+  )
+
+  # 與 msgpack 的 flag 可以同時使用
+  frame = encode_frame(Command.LIST_ROOMS, _rooms(200), CODEC_MSGPACK, True)
+  _, cmd_value = _header(frame)
+  assert cmd_value & FLAG_BINARY and cmd_value & FLAG_COMPRESSED
+  assert decode_payload(cmd_value, frame[HEADER_STRUCT.size :])[1] == _rooms(200)
+
+
+def test_reject_bad_compressed_payload():
+  """損毀、截斷的壓縮資料都丟出 ValueError"""
+  flagged = Command.LIST_ROOMS.value | FLAG_COMPRESSED
+  good = zlib.compress(b'{"rooms": []}' * 10)
+  for bad in (b"not zlib", good[:-4]):
+    try:
+      decode_payload(flagged, bad)
+      assert False, bad
+    except ValueError:
+      pass
+
+
+def test_negotiated_compression_over_socket():
+  """協商後送出端自動壓縮，接收端不論自己的設定都會解壓"""
+  assert choose_compression(["lz4", COMPRESSION_ZLIB]) == COMPRESSION_ZLIB
+  assert choose_compression(["lz4"]) is None
+  assert choose_compression(None) is None
+
+  a, b = socket.socketpair()
+  with a, b:
+    assert get_compression(a) is None
+    set_compression(a, COMPRESSION_ZLIB)
+    send_request(a, Command.LIST_ROOMS, _rooms(100))
+    header = b.recv(HEADER_STRUCT.size, socket.MSG_PEEK)
+    assert _header(header)[1] & FLAG_COMPRESSED
+    assert recv_request(b) == (Command.LIST_ROOMS, _rooms(100))
+
+    set_compression(a, None)
+    send_request(a, Command.LIST_ROOMS, _rooms(100))
+    header = b.recv(HEADER_STRUCT.size, socket.MSG_PEEK)
+    assert not _header(header)[1] & FLAG_COMPRESSED
+    assert recv_request(b) == (Command.LIST_ROOMS, _rooms(100))
+
+
+if __name__ == "__main__":
+  test_compress_large_payloads_only()
+  test_reject_bad_compressed_payload()
+  test_negotiated_compression_over_socket()
+  print("\n>>> Compression Test SUCCESS! <<<")
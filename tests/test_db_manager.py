@@ -0,0 +1,81 @@
+# tests/test_db_manager.py
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.db_manager import DBManager
+
+
+def make_db(tmp):
+  return DBManager(os.path.join(tmp, "test.db"), pool_size=4)
+
+
+def test_list_all_games_ratings():
+  """list_all_games 的評分彙總需與逐筆計算一致，未評分遊戲為 0"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = make_db(tmp)
+    db.add_game("Alpha", "1.0", "dev", "a", "CLI", "game.py")
+    db.add_game("Beta", "1.0", "dev", "b", "GUI", "game.py")
+    db.add_review("Alpha", "p1", 5, "")
+    db.add_review("Alpha", "p2", 2, "")
+    db.add_review("Alpha", "p2", 4, "")  # UPSERT 覆蓋 p2 的評分
+
+    games = {g["name"]: g for g in db.list_all_games()}
+    assert games["Alpha"]["rating"] == 4.5
+    assert games["Alpha"]["rating_count"] == 2
+    assert games["Beta"]["rating"] == 0.0
+    assert games["Beta"]["rating_count"] == 0
+    db.close()
+
+
+def test_wal_and_pool():
+  """連線需使用 WAL，且寫入失敗要 rollback 不影響後續操作"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = make_db(tmp)
+    with db._reader() as cursor:
+      cursor.execute("PRAGMA journal_mode")
+      assert cursor.fetchone()[0] == "wal"
+
+    assert db.add_game("Alpha", "1.0", "dev", "", "CLI", "game.py")[0]
+    assert not db.add_game("Alpha", "2.0", "dev", "", "CLI", "game.py")[0]
+    assert db.get_game_release("Alpha") == ("1.0", None)
+    assert db.get_game_release("Missing") == (None, None)
+    db.close()
+
+
+def test_concurrent_readers_and_writer():
+  """大量 login 與註冊同時進行時不應出錯，且讀取能看到已 commit 的資料"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = make_db(tmp)
+    errors = []
+
+    def worker(idx):
+      try:
+        name = f"user_{idx}"
+        ok, _ = db.register_user("player", name, "pw")
+        assert ok
+        for _ in range(20):
+          assert db.validate_login("player", name, "pw")
+          assert not db.validate_login("player", name, "wrong")
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(32)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+
+    assert not errors, errors
+    db.close()
+
+
+if __name__ == "__main__":
+  test_list_all_games_ratings()
+  test_wal_and_pool()
+  test_concurrent_readers_and_writer()
+  print("\n>>> DBManager Test SUCCESS! <<<")
@@ -0,0 +1,139 @@
+# tests/test_download_resume.py
+
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_player.network import NetworkClient
+from server.blob_store import BlobStore
+from server.client_handler import ClientHandler
+from server.db_manager import DBManager
+
+GAME_SIZE = 2 * 1024 * 1024
+
+
+def _store_blob(store, content):
+  tmp_path = store.new_temp_path()
+  with open(tmp_path, "wb") as f:
+    f.write(content)
+  return store.put(tmp_path)
+
+
+def _connect(db, store):
+  """在 socketpair 上啟動一個 ClientHandler (沒有資料通道，檔案走控制連線)"""
+  control, peer = socket.socketpair()
+  handler = ClientHandler(control, ("127.0.0.1", 0), db, blob_store=store)
+  handler.daemon = True
+  handler.start()
+  client = NetworkClient()
+  client.sock = peer
+  client.is_connected = True
+  return client, handler
+
+
+def _interrupt_after(limit):
+  """收到 limit bytes 後丟出例外，模擬下載途中斷線"""
+
+  def progress(received, total):
+    if received >= limit:
+      raise ConnectionError("simulated disconnect")
+
+  return progress
+
+
+def _download_interrupted(db, store, save_dir):
+  client, handler = _connect(db, store)
+  ok, msg = client.download_game("G", save_dir, _interrupt_after(GAME_SIZE // 4))
+  assert not ok and "simulated disconnect" in msg
+  assert not client.is_connected
+  client.sock.close()
+  handler.join(timeout=5)
+
+
+def _sha256(path):
+  with open(path, "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_resume_interrupted_download():
+  """中斷的下載保留 .part，重新連線後從 .part 的大小繼續，完成的檔案與 Server 上的一致"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    content = os.urandom(GAME_SIZE)
+    db.add_game("G", "1.0", "dev", "", "CLI", "game.py")
+    db.set_game_blob("G", _store_blob(store, content))
+
+    save_dir = os.path.join(tmp, "downloads")
+    part_path = os.path.join(save_dir, "G.zip.part")
+    _download_interrupted(db, store, save_dir)
+
+    partial = os.path.getsize(part_path)
+    assert 0 < partial < GAME_SIZE
+    with open(part_path + ".json") as f:
+      assert json.load(f)["version"] == "1.0"
+
+    # 重新連線續傳：只收剩下的部分
+    client, handler = _connect(db, store)
+    progress = []
+    ok, res = client.download_game(
+      "G", save_dir, lambda received, total: progress.append(received)
+    )
+    assert ok, res
+    assert progress[-1] == GAME_SIZE - partial
+    assert res["zip_path"] == os.path.join(save_dir, "G_1.0.zip")
+    assert _sha256(res["zip_path"]) == hashlib.sha256(content).hexdigest()
+    assert not os.path.exists(part_path)
+    assert not os.path.exists(part_path + ".json")
+
+    client.sock.close()
+    handler.join(timeout=5)
+    db.close()
+
+
+def test_resume_after_version_change():
+  """中斷後 Server 更新了版本：舊的 .part 被丟棄，重新下載完整的新版"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    old_content = os.urandom(GAME_SIZE)
+    db.add_game("G", "1.0", "dev", "", "CLI", "game.py")
+    db.set_game_blob("G", _store_blob(store, old_content))
+
+    save_dir = os.path.join(tmp, "downloads")
+    part_path = os.path.join(save_dir, "G.zip.part")
+    _download_interrupted(db, store, save_dir)
+    assert os.path.exists(part_path)
+
+    new_content = os.urandom(GAME_SIZE)
+    ok, _, _ = db.update_game_version(
+      "G", "dev", "2.0", "game.py", _store_blob(store, new_content)
+    )
+    assert ok
+
+    client, handler = _connect(db, store)
+    progress = []
+    ok, res = client.download_game(
+      "G", save_dir, lambda received, total: progress.append(received)
+    )
+    assert ok, res
+    assert res["version"] == "2.0"
+    assert progress[-1] == GAME_SIZE  # 從頭下載，沒有沿用舊版的 .part
+    assert _sha256(res["zip_path"]) == hashlib.sha256(new_content).hexdigest()
+    assert not os.path.exists(part_path)
+    assert not os.path.exists(part_path + ".json")
+
+    client.sock.close()
+    handler.join(timeout=5)
+    db.close()
+
+
+if __name__ == "__main__":
+  test_resume_interrupted_download()
+  test_resume_after_version_change()
+  print("\n>>> Download Resume Test SUCCESS! <<<")
@@ -0,0 +1,163 @@
+# tests/test_ingest.py
+
+import hashlib
+import os
+import socket
+import sys
+import tempfile
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.manifest import manifest_from_zip
+from server.blob_store import BlobStore
+from server.client_handler import ClientHandler
+from server.db_manager import DBManager
+from server.ingest import (
+  DEPLOY_FAILED,
+  DEPLOY_READY,
+  Deployer,
+  PackageIngest,
+  validate_package,
+)
+from server.room_manager import RoomManager
+
+
+def make_zip(path, files):
+  with zipfile.ZipFile(path, "w") as zf:
+    for name, content in files.items():
+      zf.writestr(name, content)
+  return path
+
+
+def test_ingest_hash_and_magic():
+  """邊收邊算的 hash 要與整個檔案一致，非 zip 在第一段資料就被拒絕"""
+  with tempfile.TemporaryDirectory() as tmp:
+    data = open(make_zip(os.path.join(tmp, "a.zip"), {"a": "1"}), "rb").read()
+    ingest = PackageIngest()
+    for i in range(0, len(data), 3):
+      ingest.update(memoryview(data)[i : i + 3])
+    assert ingest.hexdigest() == hashlib.sha256(data).hexdigest()
+
+  try:
+    PackageIngest().update(b"MZ\x90\x00 not a zip")
+    assert False, "non-zip accepted"
+  except ValueError:
+    pass
+
+
+def test_validate_package():
+  with tempfile.TemporaryDirectory() as tmp:
+    validate_package(make_zip(os.path.join(tmp, "ok.zip"), {"dir/a.py": "1"}))
+    for files in ({"../escape.py": "1"}, {"/abs.py": "1"}):
+      try:
+        validate_package(make_zip(os.path.join(tmp, "bad.zip"), files))
+        assert False, files
+      except ValueError:
+        pass
+
+    with open(os.path.join(tmp, "junk.zip"), "wb") as f:
+      f.write(b"PK\x03\x04 truncated")
+    try:
+      validate_package(os.path.join(tmp, "junk.zip"))
+      assert False, "truncated zip accepted"
+    except ValueError:
+      pass
+
+
+def test_deployer_background_extract():
+  """背景部署完成後狀態為 ready；同一遊戲連續更新只留下最新版本，刪除會清掉目錄"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    rooms = RoomManager(os.path.join(tmp, "installed"))
+    deployer = Deployer(rooms, store)
+
+    digests = []
+    for version in ("1.0", "2.0"):
+      tmp_path = make_zip(store.new_temp_path(), {"version.py": version})
+      digests.append(store.put(tmp_path))
+      deployer.submit("G", version, digests[-1])
+    deployer.join()
+
+    assert deployer.get_status("G")["state"] == DEPLOY_READY
+    assert deployer.get_status("G")["version"] == "2.0"
+    with open(os.path.join(rooms.get_current_dir("G"), "version.py")) as f:
+      assert f.read() == "2.0"
+    # 沒有房間使用的 1.0 已被清掉，只剩目前版本與 CURRENT
+    assert len(os.listdir(rooms.get_game_dir("G"))) == 2
+    assert store.manifest(digests[-1])["version.py"]["size"] == 3
+
+    deployer.remove("G")
+    deployer.join()
+    assert not os.path.exists(rooms.get_game_dir("G"))
+    assert deployer.get_status("G") is None
+    db.close()
+
+
+def test_deployer_resume_after_restart():
+  """重啟後重新排入尚未完成的部署；沒有部署紀錄的遊戲依 CURRENT 判斷狀態"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    rooms = RoomManager(os.path.join(tmp, "installed"))
+
+    for name in ("Done", "Queued"):
+      db.add_game(name, "1.0", "dev", "", "CLI", "game.py")
+      digest = store.put(make_zip(store.new_temp_path(), {"game.py": name}))
+      db.set_game_blob(name, digest)
+    first = Deployer(rooms, store, db)
+    first.submit("Done", "1.0", db.get_game_release("Done")[1])
+    first.join()
+
+    # 模擬 Server 在 Queued 解壓縮前就重啟
+    deployer = Deployer(rooms, store, db)
+    assert deployer.get_status("Done")["state"] == DEPLOY_READY
+    assert deployer.get_status("Queued")["state"] == DEPLOY_FAILED
+    assert deployer.get_status("Missing") is None
+
+    assert deployer.resume() == 1
+    deployer.join()
+    assert deployer.get_status("Queued")["state"] == DEPLOY_READY
+    with open(os.path.join(rooms.get_current_dir("Queued"), "game.py")) as f:
+      assert f.read() == "Queued"
+    assert deployer.resume() == 0
+    db.close()
+
+
+def test_delta_update_manifest_from_merged_package():
+  """差異更新組出的遊戲包要重新檢查，存下的 manifest 依實際內容計算而非 Client 提供的"""
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    base = store.put(make_zip(store.new_temp_path(), {"game.py": "v1", "a.txt": "x"}))
+
+    delta_path = make_zip(os.path.join(tmp, "delta.zip"), {"game.py": "v2"})
+    manifest = {
+      "game.py": {"size": 999, "sha256": hashlib.sha256(b"v2").hexdigest()},
+      "a.txt": {"size": 0, "sha256": hashlib.sha256(b"x").hexdigest()},
+    }
+
+    server_sock, client_sock = socket.socketpair()
+    with server_sock, client_sock:
+      handler = ClientHandler(server_sock, ("127.0.0.1", 0), db, blob_store=store)
+      with open(delta_path, "rb") as f:
+        client_sock.sendall(f.read())
+      digest = handler._ingest_package(
+        server_sock, os.path.getsize(delta_path), base, manifest
+      )
+
+    assert digest and digest != base
+    stored = db.get_blob_manifest(digest)
+    assert stored == manifest_from_zip(store.path(digest))
+    assert stored["game.py"]["size"] == 2 and stored["a.txt"]["size"] == 1
+    db.close()
+
+
+if __name__ == "__main__":
+  test_ingest_hash_and_magic()
+  test_validate_package()
+  test_deployer_background_extract()
+  test_deployer_resume_after_restart()
+  test_delta_update_manifest_from_merged_package()
+  print("\n>>> Ingest Test SUCCESS! <<<")
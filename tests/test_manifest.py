@@ -0,0 +1,120 @@
+# tests/test_manifest.py
+
+import os
+import sys
+import tempfile
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.manifest import (
+  build_zip_from_dir,
+  build_zip_from_zip,
+  diff_manifest,
+  installed_hashes,
+  is_safe_path,
+  manifest_from_dir,
+  manifest_from_zip,
+  merge_delta,
+  write_manifest,
+)
+
+
+def make_folder(root, files):
+  for path, content in files.items():
+    abs_path = os.path.join(root, *path.split("/"))
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, "wb") as f:
+      f.write(content)
+
+
+def test_manifest_zip_matches_dir():
+  """同一份資料夾打包前後的 manifest 要一致"""
+  with tempfile.TemporaryDirectory() as tmp:
+    folder = os.path.join(tmp, "game")
+    make_folder(folder, {"game.py": b"print(1)", "assets/a.bin": os.urandom(1000)})
+    zip_path = os.path.join(tmp, "game.zip")
+    build_zip_from_dir(folder, zip_path, sorted(manifest_from_dir(folder)))
+
+    assert manifest_from_zip(zip_path) == manifest_from_dir(folder)
+    assert set(manifest_from_dir(folder)) == {"game.py", "assets/a.bin"}
+
+
+def test_diff_and_merge_delta():
+  """差異 zip + 舊版遊戲包要能組出與新版完全相同內容的遊戲包"""
+  with tempfile.TemporaryDirectory() as tmp:
+    old_dir = os.path.join(tmp, "v1")
+    new_dir = os.path.join(tmp, "v2")
+    big = os.urandom(50000)
+    make_folder(old_dir, {"game.py": b"v1", "big.bin": big, "old.txt": b"bye"})
+    make_folder(new_dir, {"game.py": b"v2", "big.bin": big, "new.txt": b"hi"})
+
+    base_zip = os.path.join(tmp, "v1.zip")
+    old_manifest = manifest_from_dir(old_dir)
+    build_zip_from_dir(old_dir, base_zip, sorted(old_manifest))
+
+    new_manifest = manifest_from_dir(new_dir)
+    changed, removed = diff_manifest(old_manifest, new_manifest)
+    assert changed == ["game.py", "new.txt"]
+    assert removed == ["old.txt"]
+
+    delta_zip = os.path.join(tmp, "delta.zip")
+    build_zip_from_dir(new_dir, delta_zip, changed)
+    assert os.path.getsize(delta_zip) < os.path.getsize(base_zip)
+
+    out_zip = os.path.join(tmp, "v2.zip")
+    merge_delta(base_zip, delta_zip, new_manifest, out_zip)
+    assert manifest_from_zip(out_zip) == new_manifest
+
+    # 玩家端的差異 zip 只包含 hash 不同的檔案
+    player_zip = os.path.join(tmp, "player.zip")
+    build_zip_from_zip(out_zip, player_zip, changed)
+    with zipfile.ZipFile(player_zip) as zf:
+      assert sorted(zf.namelist()) == changed
+
+
+def test_merge_delta_rejects_bad_input():
+  with tempfile.TemporaryDirectory() as tmp:
+    folder = os.path.join(tmp, "game")
+    make_folder(folder, {"game.py": b"v1"})
+    base_zip = os.path.join(tmp, "base.zip")
+    build_zip_from_dir(folder, base_zip, ["game.py"])
+    delta_zip = os.path.join(tmp, "delta.zip")
+    build_zip_from_dir(folder, delta_zip, [])
+    out_zip = os.path.join(tmp, "out.zip")
+
+    for manifest in (
+      {"game.py": {"size": 2, "sha256": "0" * 64}},  # hash 不符
+      {"missing.py": {"size": 1, "sha256": "0" * 64}},  # 檔案不存在
+      {"../evil.py": {"size": 1, "sha256": "0" * 64}},  # 跳出安裝目錄
+    ):
+      try:
+        merge_delta(base_zip, delta_zip, manifest, out_zip)
+        assert False, manifest
+      except ValueError:
+        pass
+
+  assert is_safe_path("assets/a.bin")
+  assert not is_safe_path("/etc/passwd")
+  assert not is_safe_path("a/../../b")
+
+
+def test_installed_hashes():
+  """只回報 manifest 中列出的檔案，本地修改的檔案 hash 會不同"""
+  with tempfile.TemporaryDirectory() as tmp:
+    assert installed_hashes(tmp) is None
+    make_folder(tmp, {"game.py": b"v1", "save.dat": b"user data"})
+    manifest = manifest_from_dir(tmp, ["game.py"])
+    write_manifest(tmp, manifest)
+    assert installed_hashes(tmp) == {"game.py": manifest["game.py"]["sha256"]}
+
+    make_folder(tmp, {"game.py": b"edited"})
+    assert installed_hashes(tmp)["game.py"] != manifest["game.py"]["sha256"]
+
+
+if __name__ == "__main__":
+  test_manifest_zip_matches_dir()
+  test_diff_and_merge_delta()
+  test_merge_delta_rejects_bad_input()
+  test_installed_hashes()
+  print("\n>>> Manifest Test SUCCESS! <<<")
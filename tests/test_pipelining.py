@@ -0,0 +1,139 @@
+# tests/test_pipelining.py
+
+import os
+import socket
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.constants import Command, Status
+from common.protocol import (
+  FLAG_REQUEST_ID,
+  HEADER_STRUCT,
+  decode_frame,
+  decode_payload,
+  encode_frame,
+  exchange_pipelined,
+  recv_frame,
+  recv_request,
+  send_request,
+  with_request_id,
+)
+from server.client_handler import ClientHandler, is_serial
+
+
+class FakeDB:
+  """LIST_ALL_GAMES 會卡住直到 release 被設定，用來確認其他請求不必等它"""
+
+  def __init__(self):
+    self.release = threading.Event()
+
+  def validate_login(self, role, username, password):
+    return True
+
+  def list_all_games(self):
+    self.release.wait(5)
+    return [{"id": 1, "name": "slow"}]
+
+  def list_my_games(self, author_name):
+    return [{"id": 2, "name": "mine"}]
+
+
+class FakeDeployer:
+  def get_status(self, game_name):
+    return {"state": "ready", "version": "1.0", "msg": ""}
+
+
+def _decode(frame):
+  _, cmd_value = HEADER_STRUCT.unpack_from(frame)
+  return decode_frame(cmd_value, frame[HEADER_STRUCT.size :])
+
+
+def test_request_id_frames():
+  """Request ID 放在 Payload 前面並計入長度，可與其他 flag 並用"""
+  frame = encode_frame(Command.LIST_ROOMS, {"rooms": []}, compress=True, request_id=7)
+  length, cmd_value = HEADER_STRUCT.unpack_from(frame)
+  assert cmd_value == Command.LIST_ROOMS.value | FLAG_REQUEST_ID
+  assert length == len(frame) - HEADER_STRUCT.size
+  assert _decode(frame) == (Command.LIST_ROOMS, {"rooms": []}, 7)
+  assert _decode(encode_frame(Command.LIST_ROOMS, {"a": 1})) == (
+    Command.LIST_ROOMS,
+    {"a": 1},
+    None,
+  )
+
+  # 預先編碼好的封包 (例如快取) 補上 ID 後內容不變
+  big = {"games": [{"name": f"g{i}"} for i in range(500)]}
+  cached = encode_frame(Command.LIST_ALL_GAMES, big, compress=True)
+  assert _decode(with_request_id(cached, 2**32 - 1)) == (
+    Command.LIST_ALL_GAMES,
+    big,
+    2**32 - 1,
+  )
+
+  # 舊的介面照常回傳 (Command, data)
+  _, cmd_value = HEADER_STRUCT.unpack_from(frame)
+  assert decode_payload(cmd_value, frame[HEADER_STRUCT.size :])[1] == {"rooms": []}
+
+
+def test_transfer_commands_serial_without_data_channel():
+  """檔案只有在真的走資料通道時才能與其他請求並行，否則會在控制連線上串流"""
+  download = {"name": "g", "data_channel": True}
+  assert is_serial(Command.DOWNLOAD_GAME, download)
+  assert not is_serial(Command.DOWNLOAD_GAME, download, transfer_server=object())
+  assert is_serial(Command.DOWNLOAD_GAME, {"name": "g"}, transfer_server=object())
+  assert not is_serial(Command.LIST_ROOMS, {})
+
+
+def test_pipelined_requests_out_of_order():
+  """慢的請求不會擋住同一條連線後面的請求，回應依 ID 對應"""
+  db = FakeDB()
+  server_sock, client_sock = socket.socketpair()
+  handler = ClientHandler(server_sock, ("127.0.0.1", 0), db, deployer=FakeDeployer())
+  handler.start()
+
+  with client_sock:
+    send_request(client_sock, Command.LOGIN, {"username": "u", "password": "p"})
+    cmd, res = recv_request(client_sock)
+    assert res["status"] == Status.SUCCESS.value and res["pipelining"] is True
+
+    for i, cmd in ((1, Command.LIST_ALL_GAMES), (2, Command.LIST_MY_GAMES)):
+      send_request(client_sock, cmd, {}, request_id=i)
+    assert recv_frame(client_sock) == (
+      Command.LIST_MY_GAMES,
+      {"games": [{"id": 2, "name": "mine", "deploy_status": "ready"}]},
+      2,
+    )
+    db.release.set()
+    assert recv_frame(client_sock) == (
+      Command.LIST_ALL_GAMES,
+      {"games": [{"id": 1, "name": "slow"}]},
+      1,
+    )
+
+    # exchange_pipelined 依請求順序回傳
+    responses = exchange_pipelined(
+      client_sock,
+      [(Command.LIST_MY_GAMES, {}), (Command.LIST_ALL_GAMES, {}), (Command.ERROR, {})],
+    )
+    assert [cmd for cmd, _ in responses] == [
+      Command.LIST_MY_GAMES,
+      Command.LIST_ALL_GAMES,
+      Command.ERROR,
+    ]
+
+    # 沒有 Request ID 的請求維持原本的一問一答
+    send_request(client_sock, Command.LIST_MY_GAMES, {})
+    assert recv_frame(client_sock)[2] is None
+
+    send_request(client_sock, Command.LOGOUT, {})
+  handler.join(5)
+  assert not handler.is_alive()
+
+
+if __name__ == "__main__":
+  test_request_id_frames()
+  test_transfer_commands_serial_without_data_channel()
+  test_pipelined_requests_out_of_order()
+  print("\n>>> Pipelining Test SUCCESS! <<<")
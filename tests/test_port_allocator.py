@@ -0,0 +1,76 @@
+# tests/test_port_allocator.py
+
+import os
+import socket
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.port_allocator import PortAllocator, parse_port_range
+
+
+def test_allocate_and_release():
+  """使用中的 Port 不會重複分配，歸還的 Port 排到最後才重用"""
+  ports = PortAllocator(25000, 25004)
+  allocated = [ports.allocate() for _ in range(5)]
+  assert sorted(allocated) == list(range(25000, 25005))
+  assert ports.in_use() == 5
+  try:
+    ports.allocate()
+    assert False, "allocated beyond range"
+  except RuntimeError:
+    pass
+
+  ports.release(25001)
+  ports.release(25001)  # 重複歸還不影響
+  assert ports.allocate() == 25001
+  ports.release(25002)
+  ports.release(25000)
+  assert [ports.allocate(), ports.allocate()] == [25002, 25000]
+
+
+def test_skip_port_taken_by_other_process():
+  """範圍內被其他程式 listen 的 Port 會被跳過"""
+  with socket.socket() as other:
+    other.bind(("127.0.0.1", 0))
+    other.listen()
+    taken = other.getsockname()[1]
+    ports = PortAllocator(taken, taken + 1)
+    assert ports.allocate() == taken + 1
+
+
+def test_skip_port_in_time_wait():
+  """仍在 TIME_WAIT 的 Port (剛結束、主動關閉連線的房間) 不會被分配出去"""
+  with socket.socket() as listener:
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    port = listener.getsockname()[1]
+    client = socket.create_connection(("127.0.0.1", port))
+    conn, _ = listener.accept()
+    conn.close()  # Server 端先關閉 -> TIME_WAIT
+    client.close()
+  ports = PortAllocator(port, port)
+  try:
+    ports.allocate()
+    assert False, "allocated a port in TIME_WAIT"
+  except RuntimeError:
+    pass
+
+
+def test_parse_port_range():
+  assert parse_port_range("20000-29999") == (20000, 29999)
+  assert parse_port_range("25000") == (25000, 25000)
+  for text in ("0-10", "30000-20000", "1-70000"):
+    try:
+      parse_port_range(text)
+      assert False, text
+    except ValueError:
+      pass
+
+
+if __name__ == "__main__":
+  test_allocate_and_release()
+  test_skip_port_taken_by_other_process()
+  test_skip_port_in_time_wait()
+  test_parse_port_range()
+  print("\n>>> Port Allocator Test SUCCESS! <<<")
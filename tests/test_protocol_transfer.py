@@ -0,0 +1,109 @@
+# tests/test_protocol_transfer.py
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.constants import Command
+from common.protocol import (
+  HEADER_STRUCT,
+  MAX_PAYLOAD_SIZE,
+  recv_file,
+  recv_request,
+  send_file,
+  send_request,
+)
+
+
+def run_pair(sender, receiver):
+  """在 socketpair 上同時執行 sender / receiver，回傳 receiver 的結果"""
+  a, b = socket.socketpair()
+  errors = []
+
+  def send_side():
+    try:
+      sender(a)
+    except Exception as e:
+      errors.append(e)
+    finally:
+      a.close()
+
+  t = threading.Thread(target=send_side)
+  t.start()
+  try:
+    result = receiver(b)
+  finally:
+    t.join()
+    b.close()
+  assert not errors, errors
+  return result
+
+
+def test_large_payload_roundtrip():
+  """大型 JSON payload 需完整收到 (跨越多次 recv)"""
+  payload = {"games": [{"name": f"game_{i}", "desc": "x" * 100} for i in range(20000)]}
+  cmd, data = run_pair(
+    lambda s: send_request(s, Command.LIST_ALL_GAMES, payload), recv_request
+  )
+  assert cmd == Command.LIST_ALL_GAMES
+  assert data == payload
+
+
+def test_send_file_range_and_recv_file():
+  """send_file 的 offset / count 範圍與 recv_file 寫入內容需一致"""
+  content = os.urandom(3 * 1024 * 1024 + 123)
+  with tempfile.TemporaryDirectory() as tmp:
+    src = os.path.join(tmp, "src.bin")
+    dst = os.path.join(tmp, "dst.bin")
+    with open(src, "wb") as f:
+      f.write(content)
+
+    offset, count = 1000, 2 * 1024 * 1024
+    run_pair(
+      lambda s: send_file(s, src, offset, count),
+      lambda s: recv_file(s, count, dst),
+    )
+    with open(dst, "rb") as f:
+      assert f.read() == content[offset : offset + count]
+
+    progress = []
+    run_pair(
+      lambda s: send_file(s, src),
+      lambda s: recv_file(s, len(content), dst, lambda r, t: progress.append(r)),
+    )
+    with open(dst, "rb") as f:
+      assert f.read() == content
+    assert progress[-1] == len(content)
+
+
+def test_reject_oversized_header():
+  """宣告超過上限的長度直接斷線；宣告很大但沒送資料時不會預先配置整個長度"""
+  header = HEADER_STRUCT.pack(MAX_PAYLOAD_SIZE + 1, Command.LOGIN.value)
+  assert run_pair(lambda s: s.sendall(header), recv_request) == (None, None)
+
+  header = HEADER_STRUCT.pack(MAX_PAYLOAD_SIZE, Command.LOGIN.value)
+  assert run_pair(lambda s: s.sendall(header + b"{}"), recv_request) == (None, None)
+
+
+def test_recv_file_connection_lost():
+  """對方提早斷線時 recv_file 要丟出 ConnectionError"""
+  with tempfile.TemporaryDirectory() as tmp:
+    dst = os.path.join(tmp, "dst.bin")
+    try:
+      run_pair(lambda s: s.sendall(b"x" * 100), lambda s: recv_file(s, 1000, dst))
+    except ConnectionError:
+      pass
+    else:
+      raise AssertionError("ConnectionError expected")
+
+
+if __name__ == "__main__":
+  test_large_payload_roundtrip()
+  test_send_file_range_and_recv_file()
+  test_reject_oversized_header()
+  test_recv_file_connection_lost()
+  print("\n>>> Protocol Transfer Test SUCCESS! <<<")
@@ -0,0 +1,288 @@
+# tests/test_room_manager.py
+
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.room_manager import (
+  MODE_HOSTED,
+  ROOM_FAILED,
+  ROOM_ID_SUFFIX_BYTES,
+  ROOM_READY,
+  ROOM_STARTING,
+  RoomManager,
+)
+
+# 只 listen、不做事的 Game Server
+IDLE_SERVER = """
+import argparse, socket, time
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int)
+parser.add_argument("--room_id")
+args = parser.parse_args()
+sock = socket.socket()
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.bind(("127.0.0.1", args.port))
+sock.listen()
+time.sleep(30)
+"""
+
+# 支援 in-process hosting 的遊戲：回聲，收到 bye 結束房間、收到 boom 丟出例外
+ECHO_HANDLER = """
+class RoomHandler:
+  def __init__(self, room):
+    self.room = room
+
+  async def on_player(self, reader, writer):
+    while True:
+      data = await reader.readline()
+      if data.strip() == b"bye":
+        self.room.close()
+        return
+      if data.strip() == b"boom":
+        raise ValueError("boom")
+      writer.write(data)
+      await writer.drain()
+"""
+
+
+def install(rooms, game, release, server_code=IDLE_SERVER, handler_code=None):
+  release_dir = rooms.get_release_dir(game, release)
+  os.makedirs(release_dir)
+  with open(os.path.join(release_dir, "server.py"), "w") as f:
+    f.write(server_code)
+  if handler_code is not None:
+    with open(os.path.join(release_dir, "room_handler.py"), "w") as f:
+      f.write(handler_code)
+  rooms.activate_release(game, release)
+
+
+def test_running_room_keeps_old_release():
+  """更新後舊版目錄要等使用它的房間結束才會被刪除"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"))
+    install(rooms, "G", "1.0-aaa")
+    room_id, _ = rooms.create_room("host", "G")
+    assert rooms.rooms[room_id]["release"] == "1.0-aaa"
+
+    install(rooms, "G", "2.0-bbb")
+    rooms.collect_garbage("G")
+    assert os.path.isdir(rooms.get_release_dir("G", "1.0-aaa"))
+    assert rooms.get_current_dir("G") == rooms.get_release_dir("G", "2.0-bbb")
+
+    process = rooms.rooms[room_id]["process"]
+    process.kill()
+    process.wait()
+    rooms.collect_garbage("G")
+    assert not os.path.exists(rooms.get_release_dir("G", "1.0-aaa"))
+    assert room_id not in rooms.rooms and rooms.release_refs == {}
+
+
+def test_deactivate_and_migrate():
+  with tempfile.TemporaryDirectory() as tmp:
+    base = os.path.join(tmp, "installed")
+    # 舊版直接解壓在 installed_games/<game>/ 的安裝
+    os.makedirs(os.path.join(base, "Old"))
+    with open(os.path.join(base, "Old", "server.py"), "w") as f:
+      f.write(IDLE_SERVER)
+
+    rooms = RoomManager(base)
+    assert os.path.exists(os.path.join(rooms.get_current_dir("Old"), "server.py"))
+
+    rooms.deactivate_game("Old")
+    rooms.collect_garbage("Old")
+    assert not os.path.exists(rooms.get_game_dir("Old"))
+    try:
+      rooms.create_room("host", "Old")
+      assert False, "room created for removed game"
+    except FileNotFoundError:
+      pass
+
+
+def test_warm_pool_create_room():
+  """warm pool 補滿後建立房間不需等待 Python 啟動，回傳時 port 已可連線"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"), warm_pool_size=1)
+    install(rooms, "G", "1.0-aaa")
+    try:
+      rooms.create_room("host", "G")  # cold start，之後背景補一個 worker
+      deadline = time.monotonic() + 10
+      while rooms.warm_pool.idle_count("G", "1.0-aaa") < 1:
+        assert time.monotonic() < deadline, "warm worker never became idle"
+        time.sleep(0.05)
+
+      start = time.monotonic()
+      room_id, port = rooms.create_room("host", "G")
+      elapsed = time.monotonic() - start
+      assert elapsed < 0.5, elapsed
+      socket.create_connection(("127.0.0.1", port), timeout=1).close()
+
+      # 切換版本後舊版的閒置 worker 會被關掉
+      install(rooms, "G", "2.0-bbb")
+      assert rooms.warm_pool.idle_count("G", "1.0-aaa") == 0
+    finally:
+      rooms.warm_pool.shutdown()
+      for info in rooms.rooms.values():
+        info["process"].kill()
+
+
+def test_create_room_does_not_block_lock():
+  """Game Server 啟動期間 lock 不會被佔住，狀態由 starting 變成 ready；crash 時為 failed"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"))
+    install(rooms, "Slow", "1.0-aaa", "import time\ntime.sleep(1)\n" + IDLE_SERVER)
+    install(rooms, "Crash", "1.0-bbb", "raise SystemExit('boom')\n")
+    try:
+      room_id, _ = rooms.create_room("host", "Slow", wait=False)
+      assert rooms.get_state(room_id) == ROOM_STARTING
+      start = time.monotonic()
+      assert rooms.join_room(room_id, "p2") == (None, "Room is still starting")
+      assert time.monotonic() - start < 0.1
+
+      deadline = time.monotonic() + 10
+      while rooms.get_state(room_id) != ROOM_READY:
+        assert time.monotonic() < deadline, "room never became ready"
+        time.sleep(0.05)
+      assert rooms.join_room(room_id, "p2")[1] == "Joined"
+
+      try:
+        rooms.create_room("host", "Crash")
+        assert False, "crashed room reported as created"
+      except RuntimeError:
+        pass
+      assert ROOM_FAILED in [info["state"] for info in rooms.rooms.values()]
+      assert ("Crash", "1.0-bbb") not in rooms.release_refs
+    finally:
+      for info in rooms.rooms.values():
+        if info["process"]:
+          info["process"].kill()
+
+
+def test_reaper_records_exit():
+  """結束的 Game Server 會被背景回收，stderr 被持續讀掉 (不會塞住)，並留下紀錄"""
+  chatty = IDLE_SERVER.replace(
+    "time.sleep(30)",
+    "import sys\nsys.stderr.write('x' * 200000 + '\\nlast words\\n')\nsys.exit(3)",
+  )
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"), reap_interval=0.05)
+    install(rooms, "G", "1.0-aaa", chatty)
+    removed = []
+    rooms.subscribe(lambda room_id, record: removed.append(room_id))
+
+    room_id, _ = rooms.create_room("host", "G")
+    deadline = time.monotonic() + 10
+    while room_id in rooms.rooms:
+      assert time.monotonic() < deadline, "finished room was never reaped"
+      time.sleep(0.05)
+
+    record = rooms.history[-1]
+    assert removed == [room_id]
+    assert record["exit_code"] == 3
+    assert record["stderr_tail"][-1] == "last words"
+    assert record["duration"] >= 0
+    assert rooms.release_refs == {}
+    assert rooms.ports.in_use() == 0
+
+
+def test_hosted_rooms_spread_over_hosts():
+  """附有 room_handler.py 的遊戲，房間平均分到各 host 行程中執行並各自結束"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(
+      os.path.join(tmp, "installed"), reap_interval=0.05, host_workers=2
+    )
+    install(rooms, "Echo", "1.0-aaa", handler_code=ECHO_HANDLER)
+    try:
+      created = [rooms.create_room("host", "Echo") for _ in range(20)]
+      assert rooms.game_host.room_count() == 20
+      stats = rooms.get_stats()
+      assert stats["by_mode"] == {MODE_HOSTED: 20}
+      assert [host["rooms"] for host in stats["hosts"]] == [10, 10]
+      assert len({host["pid"] for host in stats["hosts"]}) == 2
+      assert len({room_id for room_id, _ in created}) == 20
+      assert sorted(rooms.rooms_of_game("Echo")) == sorted(r for r, _ in created)
+      assert len(rooms.rooms_of_host("host")) == 20
+      for room_id, _ in created:
+        assert rooms.rooms[room_id]["mode"] == MODE_HOSTED
+        assert rooms.rooms[room_id]["process"] is None
+        assert rooms.join_room(room_id, "p2")[1] == "Joined"
+
+      (bye_id, bye_port), (boom_id, boom_port) = created[:2]
+      with socket.create_connection(("127.0.0.1", bye_port), timeout=5) as conn:
+        conn.sendall(b"hello\n")
+        assert conn.recv(100) == b"hello\n"
+        conn.sendall(b"bye\n")
+      with socket.create_connection(("127.0.0.1", boom_port), timeout=5) as conn:
+        conn.sendall(b"boom\n")
+
+      deadline = time.monotonic() + 10
+      while bye_id in rooms.rooms or boom_id in rooms.rooms:
+        assert time.monotonic() < deadline, "hosted rooms were never reaped"
+        time.sleep(0.05)
+      records = {record["room_id"]: record for record in rooms.history}
+      assert records[bye_id]["exit_code"] == 0
+      assert records[bye_id]["mode"] == MODE_HOSTED
+      assert records[boom_id]["exit_code"] == 1
+      assert "ValueError: boom" in records[boom_id]["error"]
+      assert rooms.game_host.room_count() == 18
+      assert len(rooms.rooms_of_game("Echo")) == 18
+      assert rooms.get_room(bye_id) is None
+    finally:
+      rooms.game_host.shutdown()
+
+
+def test_room_ids_unique():
+  """Room ID 由序號保證不重複，超過舊版 9000 個的上限也不會覆蓋既有房間"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"), host_workers=0)
+    room_ids = {rooms._new_room_id() for _ in range(20000)}
+    assert len(room_ids) == 20000
+    seq, suffix = next(iter(room_ids)).split("-")
+    assert seq.isdigit() and len(suffix) == 2 * ROOM_ID_SUFFIX_BYTES == 16
+
+
+def test_list_rooms_filters_and_pages():
+  """LIST_ROOMS 以索引篩選並用 cursor 分頁，額滿的房間不在 open 列表中"""
+  with tempfile.TemporaryDirectory() as tmp:
+    rooms = RoomManager(os.path.join(tmp, "installed"), host_workers=1)
+    install(rooms, "A", "1.0-aaa", handler_code=ECHO_HANDLER)
+    install(rooms, "B", "1.0-bbb", handler_code=ECHO_HANDLER)
+    try:
+      a_ids = [rooms.create_room("alice", "A", max_players=2)[0] for _ in range(7)]
+      b_ids = [rooms.create_room("bob", "B")[0] for _ in range(3)]
+      assert rooms.join_room(a_ids[0], "p2")[1] == "Joined"
+      assert rooms.join_room(a_ids[0], "p3") == (None, "Room is full")
+
+      page, cursor = rooms.list_rooms(game="A", limit=3)
+      seen = [room["room_id"] for room in page]
+      while cursor is not None:
+        page, cursor = rooms.list_rooms(game="A", limit=3, cursor=cursor)
+        seen += [room["room_id"] for room in page]
+      assert seen == a_ids[::-1]  # 預設最新的在前
+
+      page, cursor = rooms.list_rooms(newest_first=False, limit=20)
+      assert [room["room_id"] for room in page] == a_ids + b_ids and cursor is None
+
+      page, _ = rooms.list_rooms(game="A", open_only=True)
+      assert a_ids[0] not in [room["room_id"] for room in page] and len(page) == 6
+      page, _ = rooms.list_rooms(host="bob", open_only=True)
+      assert [room["room_id"] for room in page] == b_ids[::-1]
+      assert page[0]["max_players"] is None
+    finally:
+      rooms.game_host.shutdown()
+
+
+if __name__ == "__main__":
+  test_running_room_keeps_old_release()
+  test_deactivate_and_migrate()
+  test_warm_pool_create_room()
+  test_create_room_does_not_block_lock()
+  test_reaper_records_exit()
+  test_hosted_rooms_spread_over_hosts()
+  test_room_ids_unique()
+  test_list_rooms_filters_and_pages()
+  print("\n>>> Room Manager Test SUCCESS! <<<")
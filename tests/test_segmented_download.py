@@ -0,0 +1,191 @@
+# tests/test_segmented_download.py
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_player.segmented_download import (
+  SEGMENT_RETRIES,
+  SegmentedDownload,
+  SegmentError,
+)
+
+SEGMENT = 1000
+
+
+def _hashes(content):
+  return [
+    hashlib.sha256(content[i : i + SEGMENT]).hexdigest()
+    for i in range(0, len(content), SEGMENT)
+  ]
+
+
+def _local_fetch(content, part_path, corrupt=None, delay=0.0):
+  """從記憶體中的內容 "下載" 到 .part；corrupt 中的 offset 第一次會收到壞資料"""
+  corrupt = set(corrupt or ())
+  lock = threading.Lock()
+  state = {"active": 0, "peak": 0}
+
+  def fetch(offset, length, hasher):
+    with lock:
+      state["active"] += 1
+      state["peak"] = max(state["peak"], state["active"])
+    try:
+      time.sleep(delay)  # 模擬單條連線的速度上限
+      data = content[offset : offset + length]
+      if offset in corrupt:
+        corrupt.discard(offset)
+        data = bytes(length)
+      hasher.update(data)
+      with open(part_path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+    finally:
+      with lock:
+        state["active"] -= 1
+
+  return fetch, state
+
+
+def test_segments_verified_and_stitched():
+  """各段寫到正確位置；驗證失敗的段會重下，已完成的段不會再下載"""
+  content = os.urandom(SEGMENT * 7 + 123)
+  with tempfile.TemporaryDirectory() as tmp:
+    part = os.path.join(tmp, "game.zip.part")
+    with open(part, "wb") as f:
+      f.truncate(len(content))
+
+    fetch, _ = _local_fetch(content, part, corrupt={2 * SEGMENT})
+    saved, progress = [], []
+    download = SegmentedDownload(
+      len(content),
+      SEGMENT,
+      _hashes(content),
+      fetch,
+      done=[0],
+      progress_callback=lambda r, t: progress.append(r),
+      on_segment_done=lambda done: saved.append(sorted(done)),
+    )
+    # 段 0 標示為已完成：先在 .part 放好內容
+    with open(part, "r+b") as f:
+      f.write(content[:SEGMENT])
+    download.run()
+
+    with open(part, "rb") as f:
+      assert f.read() == content
+    assert saved[-1] == list(range(8)) and len(saved) == 7
+    assert progress[-1] == len(content)
+
+
+def test_transient_errors_retried():
+  """連線錯誤只重下該段；一直失敗才讓下載失敗，Server 拒絕則不重試"""
+  content = os.urandom(SEGMENT * 3)
+  with tempfile.TemporaryDirectory() as tmp:
+    part = os.path.join(tmp, "game.zip.part")
+    with open(part, "wb") as f:
+      f.truncate(len(content))
+    fetch, _ = _local_fetch(content, part)
+    calls = []
+
+    def flaky(offset, length, hasher):
+      calls.append(offset)
+      if calls.count(offset) == 1 and offset == SEGMENT:
+        raise ConnectionResetError("reset by peer")
+      fetch(offset, length, hasher)
+
+    SegmentedDownload(len(content), SEGMENT, _hashes(content), flaky).run()
+    with open(part, "rb") as f:
+      assert f.read() == content
+    assert calls.count(SEGMENT) == 2
+
+    def down(offset, length, hasher):
+      calls.append(offset)
+      raise ConnectionRefusedError("refused")
+
+    calls.clear()
+    download = SegmentedDownload(
+      len(content), SEGMENT, _hashes(content), down, min_workers=1
+    )
+    try:
+      download.run()
+      assert False, "should fail"
+    except ConnectionRefusedError:
+      pass
+    assert calls == [0] * (SEGMENT_RETRIES + 1)
+
+    def rejected(offset, length, hasher):
+      calls.append(offset)
+      raise SegmentError("Version changed")
+
+    calls.clear()
+    download = SegmentedDownload(
+      len(content), SEGMENT, _hashes(content), rejected, min_workers=1
+    )
+    try:
+      download.run()
+      assert False, "should fail"
+    except SegmentError:
+      pass
+    assert calls == [0]
+
+
+def test_segment_failure_keeps_progress():
+  """一直驗證失敗的段讓下載失敗，其他已完成的段保留給續傳"""
+  content = os.urandom(SEGMENT * 4)
+  hashes = _hashes(content)
+  hashes[3] = "0" * 64
+  with tempfile.TemporaryDirectory() as tmp:
+    part = os.path.join(tmp, "game.zip.part")
+    with open(part, "wb") as f:
+      f.truncate(len(content))
+
+    fetch, _ = _local_fetch(content, part)
+    download = SegmentedDownload(len(content), SEGMENT, hashes, fetch, min_workers=1)
+    try:
+      download.run()
+      assert False, "should fail"
+    except SegmentError:
+      pass
+    assert download.done == {0, 1, 2}
+
+
+def test_workers_grow_with_throughput():
+  """每條連線速度固定時，加開連線能提升整體速度，連線數會一路長到上限"""
+  content = os.urandom(SEGMENT * 40)
+  with tempfile.TemporaryDirectory() as tmp:
+    part = os.path.join(tmp, "game.zip.part")
+    with open(part, "wb") as f:
+      f.truncate(len(content))
+
+    fetch, state = _local_fetch(content, part, delay=0.02)
+    download = SegmentedDownload(
+      len(content), SEGMENT, _hashes(content), fetch, min_workers=2, max_workers=5
+    )
+    download.run()
+    assert len(download.workers) == 5 and state["peak"] == 5
+
+    # 整體速度不會因連線數增加而提升時 (例如頻寬已滿)，停在起始的數量
+    link = threading.Lock()
+
+    def saturated(offset, length, hasher):
+      with link:  # 所有連線共用一條 "頻寬"
+        fetch(offset, length, hasher)
+
+    download = SegmentedDownload(
+      len(content), SEGMENT, _hashes(content), saturated, min_workers=2
+    )
+    download.run()
+    assert len(download.workers) <= 3
+
+
+if __name__ == "__main__":
+  test_segments_verified_and_stitched()
+  test_transient_errors_retried()
+  test_segment_failure_keeps_progress()
+  test_workers_grow_with_throughput()
+  print("\n>>> Segmented Download Test SUCCESS! <<<")
@@ -0,0 +1,167 @@
+# tests/test_transfer_server.py
+
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.constants import Command, Status
+from common.protocol import recv_file, recv_request, send_file, send_request
+from server.blob_store import BlobStore
+from server.client_handler import ClientHandler
+from server.db_manager import DBManager
+from server.transfer_server import TransferServer, TransferTokens
+
+
+def test_tokens_single_use_and_expiry():
+  cleaned = []
+  tokens = TransferTokens(ttl=0.2)
+  token = tokens.issue(Command.DOWNLOAD_GAME, "transfer", lambda: cleaned.append(1))
+
+  assert tokens.claim(token, Command.UPLOAD_GAME) is None  # 指令不符
+  assert tokens.claim("guess", Command.DOWNLOAD_GAME) is None
+  assert tokens.claim(None, Command.DOWNLOAD_GAME) is None
+  transfer, _ = tokens.claim(token, Command.DOWNLOAD_GAME)
+  assert transfer == "transfer"
+  assert tokens.claim(token, Command.DOWNLOAD_GAME) is None  # 只能用一次
+  assert cleaned == []  # 被取走的 token 由 TransferServer 負責 cleanup
+
+  # 逾時的 token 作廢並執行 cleanup
+  token = tokens.issue(Command.DOWNLOAD_GAME, "transfer", lambda: cleaned.append(2))
+  time.sleep(0.3)
+  assert tokens.claim(token, Command.DOWNLOAD_GAME) is None
+  assert cleaned == [2] and tokens.pending() == 0
+
+
+def test_expired_tokens_swept_when_idle():
+  """沒有任何新請求時，逾時 token 的 cleanup 也會在 sweep_interval 內執行"""
+  listener = socket.create_server(("127.0.0.1", 0))
+  server = TransferServer(listener, TransferTokens(ttl=0.2), sweep_interval=0.1)
+  server.start()
+
+  cleaned = []
+  server.issue(Command.DOWNLOAD_GAME, "transfer", lambda: cleaned.append(1))
+  deadline = time.monotonic() + 5
+  while not cleaned and time.monotonic() < deadline:
+    time.sleep(0.05)
+  assert cleaned == [1] and server.tokens.pending() == 0
+  listener.close()
+
+
+def test_transfer_over_data_connection():
+  listener = socket.create_server(("127.0.0.1", 0))
+  server = TransferServer(listener)
+  server.start()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    src = os.path.join(tmp, "pkg.zip")
+    with open(src, "wb") as f:
+      f.write(os.urandom(300_000))
+    cleaned = []
+
+    def transfer(sock):
+      send_request(sock, Command.DOWNLOAD_GAME, {"status": Status.SUCCESS.value})
+      send_file(sock, src)
+
+    token = server.issue(Command.DOWNLOAD_GAME, transfer, lambda: cleaned.append(1))
+
+    # 錯誤的 token 收到 ERROR
+    with socket.create_connection(("127.0.0.1", server.port)) as sock:
+      send_request(sock, Command.DOWNLOAD_GAME, {"token": "bad"})
+      assert recv_request(sock)[0] == Command.ERROR
+
+    dst = os.path.join(tmp, "out.zip")
+    with socket.create_connection(("127.0.0.1", server.port)) as sock:
+      send_request(sock, Command.DOWNLOAD_GAME, {"token": token})
+      cmd, res = recv_request(sock)
+      assert cmd == Command.DOWNLOAD_GAME and res["status"] == Status.SUCCESS.value
+      recv_file(sock, os.path.getsize(src), dst)
+      assert sock.recv(1) == b""  # 傳完即關閉
+    with open(src, "rb") as a, open(dst, "rb") as b:
+      assert a.read() == b.read()
+    assert cleaned == [1]
+
+  listener.close()
+
+
+def test_idle_transfer_times_out():
+  """token 驗證後對方不再送資料，逾時後中斷傳輸並執行 cleanup"""
+  listener = socket.create_server(("127.0.0.1", 0))
+  server = TransferServer(listener, idle_timeout=0.3)
+  server.start()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    cleaned = []
+
+    def transfer(sock):
+      send_request(sock, Command.UPLOAD_GAME, {"status": Status.SUCCESS.value})
+      recv_file(sock, 1000, os.path.join(tmp, "upload.zip"))
+
+    token = server.issue(Command.UPLOAD_GAME, transfer, lambda: cleaned.append(1))
+    with socket.create_connection(("127.0.0.1", server.port)) as sock:
+      send_request(sock, Command.UPLOAD_GAME, {"token": token})
+      assert recv_request(sock)[1]["status"] == Status.SUCCESS.value
+      sock.sendall(b"x" * 10)  # 只送一點就停住
+      deadline = time.monotonic() + 5
+      while not cleaned and time.monotonic() < deadline:
+        time.sleep(0.05)
+      assert cleaned == [1]
+      assert sock.recv(1) == b""  # Server 已關閉連線
+
+  listener.close()
+
+
+def test_download_survives_release_before_claim():
+  """回覆 token 後遊戲才被更新 / 下架 (引用數歸零)，資料通道仍送出完整的舊版"""
+  listener = socket.create_server(("127.0.0.1", 0))
+  server = TransferServer(listener)
+  server.start()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    db = DBManager(os.path.join(tmp, "test.db"))
+    store = BlobStore(db, os.path.join(tmp, "storage"))
+    content = os.urandom(200_000)
+    tmp_path = store.new_temp_path()
+    with open(tmp_path, "wb") as f:
+      f.write(content)
+    digest = store.put(tmp_path)
+    db.add_game("G", "1.0", "dev", "", "CLI", "game.py")
+    db.set_game_blob("G", digest)
+
+    control, peer = socket.socketpair()
+    handler = ClientHandler(
+      control, ("127.0.0.1", 0), db, blob_store=store, transfer_server=server
+    )
+    handler._handle_download_game({"name": "G", "data_channel": True})
+    cmd, res = recv_request(peer)
+    assert res["status"] == Status.SUCCESS.value and res["token"]
+
+    store.release(digest)  # 例如下架：最後一個引用被釋放
+    assert os.path.exists(store.path(digest))
+
+    dst = os.path.join(tmp, "out.zip")
+    with socket.create_connection(("127.0.0.1", server.port)) as sock:
+      send_request(sock, Command.DOWNLOAD_GAME, {"token": res["token"]})
+      assert recv_request(sock)[1]["status"] == Status.SUCCESS.value
+      recv_file(sock, res["length"], dst)
+      assert sock.recv(1) == b""
+    with open(dst, "rb") as f:
+      assert f.read() == content
+    assert not os.path.exists(store.path(digest))  # 傳完才刪除
+
+    control.close()
+    peer.close()
+    db.close()
+  listener.close()
+
+
+if __name__ == "__main__":
+  test_tokens_single_use_and_expiry()
+  test_expired_tokens_swept_when_idle()
+  test_transfer_over_data_connection()
+  test_idle_transfer_times_out()
+  test_download_survives_release_before_claim()
+  print("\n>>> Transfer Server Test SUCCESS! <<<")